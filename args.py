@@ -10,13 +10,30 @@ import os
 import sys
 
 
+# precisions of each framework (tensil : fixed by the data type of the tarch)
+FRAMEWORK_PRECISIONS = {
+    "pytorch": ("fp32", "fp16", "bf16"),
+    "onnx": ("fp32", "fp16", "int8"),
+    "tensil": ("fp32",),
+    "tensil_sim": ("fp32",),
+}
+
+
 def convert_to_absolute(path):
     return os.path.abspath(path)
 
 
+def check_precision(parser, args):
+    """
+    parser error if the precision is not available with the framework
+    """
+    if args.precision not in FRAMEWORK_PRECISIONS[args.framework]:
+        parser.error(f"--precision {args.precision} is not available with --framework {args.framework} (choose from {', '.join(FRAMEWORK_PRECISIONS[args.framework])})")
+
+
 def create_args(parser):
     ### FRAMEWORK ###
-    parser.add_argument("--framework", type=str, required=True, choices=["pytorch","tensil","onnx"], help="Framework to use for the backbone.")
+    parser.add_argument("--framework", type=str, required=True, choices=["pytorch","tensil","onnx","tensil_sim"], help="Framework to use for the backbone (tensil_sim : numpy simulation of the tensil fixed point inference of the onnx).")
 
     ### BACKBONE ###
     parser.add_argument("--backbone", type=str, default="resnet9", help="Specify the model of backbone used. Can only be resnet9 or resnet12.")
@@ -25,19 +42,23 @@ def create_args(parser):
     parser.add_argument("--resolution-input", type=int, default=32, help="Resolution of the input image.")
     parser.add_argument("--classifier-type", type=str, default="ncm", help="Type of classifier, ncm or knn.")   
     parser.add_argument("--number-neiboors", type=int, default=5, help="number of neiboors for knn classifier.")
+    parser.add_argument("--precision", type=str, default="fp32", choices=["fp32","fp16","bf16","int8"], help="Numeric precision of the backbone (pytorch : fp32, fp16, bf16 / onnx : fp32, fp16, int8). Tensil precision is fixed by the tarch.")
 
     ### PYTORCH ###
     parser.add_argument("--device-pytorch", type=str, default="cpu", help="Device on which the backbone will be run. Can be cudo:0, cuda:1, cpu, ...")
     parser.add_argument("--path-pytorch-weight", type=str, default="../resnet9_strided_16fmaps.pt", help="Path of the pytorch weight.")
     parser.add_argument("--no-strides", action="store_false", default=False, help="If you want to use maxpooling instead of strides.")
+    parser.add_argument("--fold-bn", action="store_true", help="Fold the batchnorms into the convolutions (inference only model).")
 
     ### TENSIL ###
     parser.add_argument("--path-bit", type=str, default="/home/xilinx/design.bit", help="The bitstream name or absolute path as a string.")
     parser.add_argument("--path-tcu", type=str, default="/home/xilinx", help="The path to the driver (added to the path).")
+    parser.add_argument("--path-tarch", type=str, default="arch/custom_perf.tarch", help="Tensil architecture simulated by tensil_sim (gives the fixed point data type).")
     parser.add_argument("--path-tmodel", type=str, default="/home/xilinx/resnet9_strided_16fmaps_onnx_custom_perf.tmodel", help="Path of the tmodel. The tprog and tdata must be in the same folder.")
 
     ### ONNX ###
     parser.add_argument("--path-onnx", type=str, default="../resnet9_strided_16fmaps.onnx", help="Path of the .onnx file. Input image resolution should match the resolution of the model.")
+    parser.add_argument("--path-onnx-segments", type=str, nargs="*", default=[], help="Paths of the onnx graphs of the blocks (model_to_onnx.py --segments), in order, used instead of --path-onnx (early exits).")
 
     ### PARAMETERS FOR THE DEMO ###
     parser.add_argument("--max-fps", action="store_true", help="Puts all the parameters in an optiomal way to get the max fps.")
@@ -45,11 +66,52 @@ def create_args(parser):
     parser.add_argument("--camera-id", type=int, default=0, help="Specification of the camera. 0 for the first camera, 1 for the second ...")
     parser.add_argument("--camera-resolution", type=str, default="640x480", help="Camera resolution. Must be 16:9 and less or equal to resolution max.")
     # Buttons
-    parser.add_argument("--button", type=str, default="keyboard", help="Input device for the button. Can be keyboard (on computer), pynq (on pynq) or keyboard-pynq (simulate pynq on computer).")
+    parser.add_argument("--button", type=str, default="keyboard", help="Input device for the button. Can be keyboard (on computer), pynq (on pynq), keyboard-pynq (simulate pynq on computer) or simulated (scripted presses of the pynq buttons, see --button-script).")
+    parser.add_argument("--button-script", type=str, default=None, help="Json list of [time (s), button, duration (s)] replayed with --button simulated, ex : [[1.0, \"shot\", 0.1], [4.0, \"inference\", 0.1]].")
+    parser.add_argument("--debounce-ms", type=float, default=20, help="Time a button state must be stable to be accepted (pynq and simulated buttons).")
+    parser.add_argument("--button-period-ms", type=float, default=1, help="Sampling period of the buttons (pynq and simulated buttons).")
     # Output
     parser.add_argument("--output-resolution", type=str, default="800x480", help="Output resolution of the frame (width/height).")
     parser.add_argument("--general-scale", type=float, default=1, help="General scale (=1 for the pynq screen).")
     parser.add_argument("--hdmi-display", action="store_true", help="To display on the hdmi screen of the pynq. If False, display on the computer screen.")
+    # Motion gate
+    parser.add_argument("--motion-gate", type=str, default="none", choices=["none","diff","phash"], help="Run the backbone only when the scene changes during inference (diff : mean absolute difference of the frames, phash : perceptual hash).")
+    parser.add_argument("--motion-threshold", type=float, default=None, help="Change above which the backbone runs (diff : gray levels, default 4 / phash : different bits, default 6).")
+    parser.add_argument("--motion-refresh", type=int, default=30, help="The backbone runs at least once every motion-refresh frames.")
+    # Backbone process
+    parser.add_argument("--backbone-process", action="store_true", help="Run the backbone in a worker process (frames and features in shared memory), the main process keeps the capture and the interface. Most useful with --classification-rate.")
+    # Test time augmentation
+    parser.add_argument("--tta", type=str, nargs="*", default=[], choices=["flip","crops","scales"], help="Test time augmentation : the features are pooled over augmented views of the frame, ran through the backbone in one batch (ex : --tta flip crops).")
+    parser.add_argument("--tta-register-views", action="store_true", help="With --tta, register every view as a shot instead of their pooled features.")
+    # Classification rate
+    parser.add_argument("--classification-rate", type=float, default=None, help="Classify in a background thread at this rate (classifications per second, 0 : as fast as the backbone allows) while the display runs at the camera rate. By default, one classification per displayed frame.")
+    # Frame scheduler
+    parser.add_argument("--target-fps", type=float, default=None, help="Target fps of the demo : the frames are paced to the target and the optional work is shed when the deadlines are missed.")
+    parser.add_argument("--latency-budget-ms", type=float, default=None, help="Time budget of a frame (without pacing), instead of --target-fps.")
+    parser.add_argument("--stage-budgets", type=str, nargs="*", default=[], help="Budget of some stages in ms, named as the columns of the terminal, ex : BACKBONE=20 PREDI=2.")
+    parser.add_argument("--shed", type=str, nargs="*", default=["overlay","classification","stale_frame"], choices=["overlay","classification","stale_frame"], help="Work shed under overload, in activation order.")
+    parser.add_argument("--scheduler-report", type=str, default=None, help="Save the deadline misses report in a json file.")
+    # Cascade
+    parser.add_argument("--cascade-config", type=str, default=None, help="Json list of the stages of a cascade of backbones (backbone_specs, resolution, margin), see backbone_loader/cascade.py. The next stage runs only when the margin between the two most probable classes is below the margin of the stage.")
+    # Early exits
+    parser.add_argument("--early-exit-margins", type=float, nargs="*", default=[], help="Margins of the exits of the backbone (one per block but the last, or one for all) : the next blocks run only when the margin between the two most probable classes is below the margin of the exit.")
+    # Resolution variants
+    parser.add_argument("--resolutions", type=int, nargs="*", default=[], help="Resolutions of the backbone kept loaded (instead of --resolution-input), the demo switches between them to hold --resolution-latency-ms.")
+    parser.add_argument("--variant-paths", type=str, nargs="*", default=[], help="Graph of each resolution, in the order of --resolutions (onnx, tensil_sim : .onnx / tensil : .tmodel). Not needed with pytorch.")
+    parser.add_argument("--resolution-latency-ms", type=float, default=20, help="Latency target of the backbone and the classifier with --resolutions.")
+    parser.add_argument("--cascade-report", type=str, default=None, help="Save the report of the cascade, of the early exits or of the resolution variants (proportion of the frames per stage, latency) in a json file.")
+    # Projection of the features
+    parser.add_argument("--projection", type=str, default="none", choices=["none","pca","random"], help="Project the features on --projection-dim dimensions before storage and matching (pca : fitted on the initialization frames, random : random orthogonal projection).")
+    parser.add_argument("--projection-dim", type=int, default=32, help="Number of dimensions of the projected features.")
+    parser.add_argument("--projection-path", type=str, default=None, help="Projection fitted offline (.npz saved by projection_report.py), instead of --projection.")
+    parser.add_argument("--bank-storage", type=str, default="float32", choices=["float32","float16","int8","pq"], help="Storage of the support bank of the knn (float16, int8 : scale per dimension, pq : product quantization), the distances are computed on the codes.")
+    parser.add_argument("--pq-subspaces", type=int, default=8, help="Number of subspaces of the product quantization (must divide the number of features).")
+    parser.add_argument("--class-capacity", type=int, default=None, help="Maximum number of shots of a class, a diverse subset is kept when it is reached (see --coreset).")
+    parser.add_argument("--coreset", type=str, default="kcenter", choices=["kcenter","reservoir"], help="Selection of the shots kept at the capacity of a class (kcenter : k-center greedy in feature space, reservoir : uniform sample of the shots seen).")
+    parser.add_argument("--max-total-shots", type=int, default=None, help="Maximum number of shots of all the classes, the least recently registered or predicted classes are evicted.")
+    # Recording
+    parser.add_argument("--record-frames", type=str, default=None, help="Save the frames given to the backbone in a .npy file (calibration set of quantize_onnx.py).")
+    parser.add_argument("--record-frames-max", type=int, default=500, help="Maximum number of recorded frames.")
 
 
 def framework_choice(args):
@@ -58,7 +120,7 @@ def framework_choice(args):
     """
     if args.framework == "pytorch":
         # backbone arguments
-        args.backbone_specs = {"type":args.framework, "device":args.device_pytorch, "model_name":args.backbone, "use_strides":not args.no_strides}
+        args.backbone_specs = {"type":args.framework, "device":args.device_pytorch, "model_name":args.backbone, "use_strides":not args.no_strides, "precision":args.precision, "fold_bn":args.fold_bn}
         # weights path
         args.backbone_specs["weight"] = args.path_pytorch_weight
         print("Backbone specification :",args.backbone_specs)
@@ -71,11 +133,19 @@ def framework_choice(args):
         args.overlay = Overlay(args.path_bit)
         sys.path.append(args.path_tcu)
         # backbone arguments
-        args.backbone_specs = {"type":args.framework, "overlay":args.overlay, "path_tmodel":args.path_tmodel}
+        args.backbone_specs = {"type":args.framework, "overlay":args.overlay, "path_tmodel":args.path_tmodel, "path_bit":args.path_bit, "path_tcu":args.path_tcu}
+        print("Backbone specification :",args.backbone_specs)
+
+    elif args.framework == "onnx" and args.path_onnx_segments:
+        args.backbone_specs = {"type":"onnx_segments", "paths_onnx":args.path_onnx_segments, "precision":args.precision}
         print("Backbone specification :",args.backbone_specs)
 
     elif args.framework == "onnx":
-        args.backbone_specs = {"type":args.framework, "path_onnx":args.path_onnx}
+        args.backbone_specs = {"type":args.framework, "path_onnx":args.path_onnx, "precision":args.precision}
+        print("Backbone specification :",args.backbone_specs)
+
+    elif args.framework == "tensil_sim":
+        args.backbone_specs = {"type":args.framework, "path_onnx":args.path_onnx, "path_tarch":args.path_tarch}
         print("Backbone specification :",args.backbone_specs)
     
     else:
@@ -97,6 +167,7 @@ def get_args_demo():
     parser = argparse.ArgumentParser(description="Get the arguments for the demo",formatter_class=argparse.RawTextHelpFormatter)
     create_args(parser)
     args = parser.parse_args() # read arguments
+    check_precision(parser, args)
     framework_choice(args)
     args_treatement(args)
     return args
\ No newline at end of file
@@ -25,7 +25,9 @@ def get_model(model_specs: dict):
         model_name = model_specs["model_name"]
         weight = model_specs["weight"]
         use_strides = model_specs["use_strides"]
-        return TorchBatchModelWrapper(model_name, weight, use_strides, device=device)
+        precision = model_specs.get("precision", "fp32")
+        fold_bn = model_specs.get("fold_bn", False)
+        return TorchBatchModelWrapper(model_name, weight, use_strides, device=device, precision=precision, fold_bn=fold_bn)
     elif model_specs["type"] == "tensil":
         from backbone_loader.backbone_tensil import BackboneTensilWrapper
 
@@ -36,7 +38,19 @@ def get_model(model_specs: dict):
     elif model_specs["type"] == "onnx":
         from backbone_loader.backbone_onnx import BackboneOnnxWrapper
 
-        return BackboneOnnxWrapper(model_specs["path_onnx"])
+        return BackboneOnnxWrapper(model_specs["path_onnx"], model_specs.get("precision", "fp32"))
+    elif model_specs["type"] == "onnx_segments":
+        from backbone_loader.backbone_onnx import BackboneOnnxSegmentsWrapper
+
+        return BackboneOnnxSegmentsWrapper(model_specs["paths_onnx"], model_specs.get("precision", "fp32"))
+    elif model_specs["type"] == "tensil_sim":
+        from backbone_loader.backbone_tensil_sim import BackboneTensilSimWrapper
+
+        return BackboneTensilSimWrapper(
+            model_specs["path_onnx"],
+            model_specs.get("data_type", "FP16BP8"),
+            model_specs.get("path_tarch", None),
+        )
 
     else:
         raise UserWarning("model type=" + model_specs["type"] + "is not defined")
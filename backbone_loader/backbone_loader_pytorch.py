@@ -6,7 +6,8 @@ import os
 
 print("Torch imported.")
 
-from backbone_loader.backbone_pytorch.model import get_model
+from backbone_loader.backbone_pytorch.model import get_model, TORCH_DTYPES
+from backbone_loader.backbone_pytorch.segments import block_segments
 
 
 class TorchBatchModelWrapper:
@@ -14,16 +15,16 @@ class TorchBatchModelWrapper:
     Wrapps a torch model to input/output ndarray
     """
 
-    def __init__(self, model_name: Union[str, os.PathLike], weights, use_strides, device="cpu"):
-        self.model = get_model(model_name, weights, use_strides, device=device)
+    def __init__(self, model_name: Union[str, os.PathLike], weights, use_strides, device="cpu", precision="fp32", fold_bn=False):
+        self.model = get_model(model_name, weights, use_strides, device=device, precision=precision, fold_bn=fold_bn)
         self.device = device
+        self.dtype = TORCH_DTYPES[precision]
+        self.max_batch_size = None
+        # early exits : the model cut after each block
+        self.segments = block_segments(self.model)
+        self.number_exits = len(self.segments)
 
-    def __call__(self, batch_img: np.ndarray):
-        """
-        return the features from an img
-        args :
-            - batch_img(np.ndarray) : represent a batch of image (channel last convention)
-        """
+    def to_tensor(self, batch_img: np.ndarray):
         channel_number = batch_img.shape[3]
         assert len(batch_img.shape) == 4
         assert (channel_number == 3) or (
@@ -34,8 +35,28 @@ class TorchBatchModelWrapper:
         # convertion to tensor with channel first convention
         batch_img = np.transpose(batch_img, (0, 3, 1, 2))
         batch_img = torch.from_numpy(batch_img)
-        batch_img = batch_img.to(self.device)
+        return batch_img.to(self.device, self.dtype)
+
+    def __call__(self, batch_img: np.ndarray):
+        """
+        return the features from an img
+        args :
+            - batch_img(np.ndarray) : represent a batch of image (channel last convention)
+        """
+        batch_img = self.to_tensor(batch_img)
 
         with torch.no_grad():
             features = self.model(batch_img)
-        return features.cpu().numpy()
+        # numpy has no bfloat16, features are always returned in fp32
+        return features.float().cpu().numpy()
+
+    def exits(self, batch_img: np.ndarray):
+        """
+        generator of the pooled features after each block, the next block only runs when the next features are asked
+        (the features of the last exit are the features of the model)
+        """
+        y = self.to_tensor(batch_img)
+        for segment in self.segments:
+            with torch.no_grad():
+                y, features = segment(y)
+            yield features.float().cpu().numpy()
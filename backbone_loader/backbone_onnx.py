@@ -2,18 +2,62 @@ import numpy as np
 import onnxruntime as ort
 from typing import Union
 import os
+import tempfile
+
+# numeric precision of the onnx graph
+ONNX_PRECISIONS = ("fp32", "fp16", "int8")
+
+
+def load_onnx_precision(model_path: Union[str, os.PathLike], precision: str = "fp32"):
+    """
+    convert the (fp32) onnx graph to the given precision
+    args :
+        - model_path : path to the onnx file
+        - precision : fp32 (graph as is), fp16 (weights and activations in fp16, inputs/outputs kept in fp32)
+          or int8 (dynamic quantization of the weights, activations quantized at runtime)
+    returns :
+        path of the model or serialized model (bytes), both can be given to ort.InferenceSession
+    """
+    if precision == "fp32":
+        return str(model_path)
+
+    import onnx
+
+    if precision == "fp16":
+        from onnxconverter_common import float16
+
+        model = float16.convert_float_to_float16(onnx.load(model_path), keep_io_types=True)
+        return model.SerializeToString()
+
+    if precision == "int8":
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_quantized = os.path.join(tmp_dir, "model_int8.onnx")
+            quantize_dynamic(str(model_path), path_quantized, weight_type=QuantType.QUInt8)
+            with open(path_quantized, "rb") as file:
+                return file.read()
+
+    if precision == "bf16":
+        raise NotImplementedError("bf16 is not supported by the onnxruntime CPU kernels")
+    raise ValueError(f"precision {precision} is not one of {ONNX_PRECISIONS}")
 
 
 class BackboneOnnxWrapper:
-    def __init__(self, model_path: Union[str, os.PathLike]):
+    def __init__(self, model_path: Union[str, os.PathLike], precision: str = "fp32"):
         """
         Args :
 
             model_path : path to the onnx file
+            precision : fp32, fp16 or int8 (see load_onnx_precision)
 
         """
-        print(f"path to model : {model_path}")
-        self.ort_session = ort.InferenceSession(model_path)
+        print(f"path to model : {model_path} ({precision})")
+        self.ort_session = ort.InferenceSession(load_onnx_precision(model_path, precision))
+        self.input_name = self.ort_session.get_inputs()[0].name
+        # batch size fixed by the exported graph (None if the batch dimension is dynamic)
+        batch_dimension = self.ort_session.get_inputs()[0].shape[0]
+        self.max_batch_size = batch_dimension if isinstance(batch_dimension, int) else None
 
     def __call__(self, batch_image: np.ndarray):
         """
@@ -21,7 +65,9 @@ class BackboneOnnxWrapper:
         """
         assert len(batch_image.shape) == 4, "not a batch"
         channel_number = batch_image.shape[-1]
-        assert batch_image.shape[0] == 1, "got sevral images in the batch"
+        assert (
+            self.max_batch_size is None or batch_image.shape[0] == self.max_batch_size
+        ), f"got {batch_image.shape[0]} images in the batch, the graph takes batches of {self.max_batch_size}"
         assert (channel_number == 3) or (
             channel_number == 1
         ), f"got numpy array of shape {batch_image.shape}, with {channel_number} channels, not the correct format (should be B C H W)"
@@ -30,7 +76,7 @@ class BackboneOnnxWrapper:
 
         outputs = self.ort_session.run(
             None,
-            {"input.1": img.astype(np.float32)},
+            {self.input_name: img.astype(np.float32)},
         )
 
         if len(outputs) > 1:
@@ -39,3 +85,37 @@ class BackboneOnnxWrapper:
                 1
             ]  # return only the feature part (second part of the tuple output)
         return outputs[0]
+
+
+class BackboneOnnxSegmentsWrapper:
+    """
+    backbone exported as one onnx graph per block (see model_to_onnx.py --segments) : each graph gives the feature map
+    of the next graph and the pooled features of its block (early exits)
+    """
+
+    def __init__(self, model_paths, precision: str = "fp32"):
+        print(f"path to segments : {model_paths} ({precision})")
+        self.ort_sessions = [ort.InferenceSession(load_onnx_precision(path, precision)) for path in model_paths]
+        self.input_names = [session.get_inputs()[0].name for session in self.ort_sessions]
+        batch_dimension = self.ort_sessions[0].get_inputs()[0].shape[0]
+        self.max_batch_size = batch_dimension if isinstance(batch_dimension, int) else None
+        self.number_exits = len(self.ort_sessions)
+
+    def exits(self, batch_image: np.ndarray):
+        """
+        generator of the pooled features after each block, the next graph only runs when the next features are asked
+        """
+        assert len(batch_image.shape) == 4, "not a batch"
+        y = np.transpose(batch_image, (0, 3, 1, 2)).astype(np.float32)  # onnx channel first convention
+        for session, input_name in zip(self.ort_sessions, self.input_names):
+            outputs = session.run(None, {input_name: y})
+            y = outputs[0]
+            yield outputs[-1]
+
+    def __call__(self, batch_image: np.ndarray):
+        """
+        img : batchified numpy img with channel last convention
+        """
+        for features in self.exits(batch_image):
+            pass
+        return features
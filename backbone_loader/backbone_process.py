@@ -0,0 +1,213 @@
+"""
+run the backbone in a worker process, so that the main process (capture, drawing, classification) and the backbone
+do not compete for the GIL
+
+the frames and the features are transferred through ring buffers in shared memory (multiprocessing.shared_memory) :
+only the index of the slot and the number of images go through the queues, the arrays are never pickled
+
+the worker is spawned (forking after torch is imported can deadlock), it gets picklable specs : the tensil overlay
+is attached again in the worker from its bitstream (without downloading it)
+"""
+import atexit
+import multiprocessing
+import queue
+import sys
+from multiprocessing import shared_memory
+import numpy as np
+
+from backbone_loader.batching import batched_call
+
+
+def create_ring(shape, dtype=np.float32):
+    """
+    shared memory block and numpy view of shape (n_slots,...)
+    """
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    memory = shared_memory.SharedMemory(create=True, size=size)
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+# period of the liveness check of the worker while waiting for its results (s)
+POLL_PERIOD = 1
+
+
+def picklable_specs(backbone_specs):
+    """
+    backbone specs sent to the worker (the tensil overlay is replaced by the path of its bitstream)
+    """
+    specs = dict(backbone_specs)
+    if "overlay" in specs:
+        del specs["overlay"]
+        if "path_bit" not in specs:
+            raise ValueError("the tensil backbone specs need path_bit to run in a backbone process")
+    return specs
+
+
+def attach_overlay(backbone_specs):
+    """
+    tensil overlay of the bitstream already downloaded by the main process
+    """
+    from pynq import Overlay
+
+    sys.path.append(backbone_specs["path_tcu"])
+    return dict(backbone_specs, overlay=Overlay(backbone_specs["path_bit"], download=False))
+
+
+def worker(backbone_specs, input_name, input_shape, output_name, output_shape, requests, results):
+    """
+    loop of the worker process : run the backbone on the slots given by the requests queue
+    """
+    from backbone_loader.backbone_loader import get_model
+
+    input_memory = shared_memory.SharedMemory(name=input_name)
+    output_memory = shared_memory.SharedMemory(name=output_name)
+    inputs = np.ndarray(input_shape, dtype=np.float32, buffer=input_memory.buf)
+    outputs = np.ndarray(output_shape, dtype=np.float32, buffer=output_memory.buf)
+    try:
+        if backbone_specs["type"] == "tensil":
+            backbone_specs = attach_overlay(backbone_specs)
+        backbone = get_model(backbone_specs)
+        number_features = backbone(np.zeros((1,) + input_shape[2:], dtype=np.float32)).shape[-1]
+        if number_features > output_shape[-1]:
+            raise ValueError(f"{number_features} features, max_features is {output_shape[-1]}")
+        results.put(("ready", number_features))
+    except Exception as error:
+        results.put(("ready", repr(error)))
+        return
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        slot, number_images = request
+        try:
+            outputs[slot, :number_images, :number_features] = batched_call(backbone, inputs[slot, :number_images])
+            results.put((slot, None))
+        except Exception as error:
+            results.put((slot, repr(error)))
+    del inputs, outputs
+    input_memory.close()
+    output_memory.close()
+
+
+class BackboneProcess:
+    """
+    backbone ran in a worker process, same call as the backbone wrappers (synchronous)
+    or submit/collect to overlap the backbone with the work of the main process
+
+    attributes :
+        slot_size : maximum number of images of a slot (larger batches are split by __call__)
+        number_slots : number of frames (batches) that can be submitted before collecting
+        number_features : size of the features given by the backbone
+    """
+
+    def __init__(self, backbone_specs, input_shape, slot_size=16, number_slots=4, max_features=4096):
+        """
+        Args :
+            - backbone_specs : specification of the backbone (see backbone_loader.get_model)
+            - input_shape : (height, width, channels) of the preprocessed frames
+        """
+        self.slot_size = slot_size
+        self.max_batch_size = None  # any batch size, see __call__
+        self.number_slots = number_slots
+        self.input_memory, self.inputs = create_ring((number_slots, slot_size) + tuple(input_shape))
+        self.output_memory, self.outputs = create_ring((number_slots, slot_size, max_features))
+
+        context = multiprocessing.get_context("spawn")
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(
+            target=worker,
+            args=(
+                picklable_specs(backbone_specs),
+                self.input_memory.name,
+                self.inputs.shape,
+                self.output_memory.name,
+                self.outputs.shape,
+                self.requests,
+                self.results,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        _, self.number_features = self.get_result()
+        if isinstance(self.number_features, str):
+            self.close()
+            raise RuntimeError(f"backbone process failed to load the backbone : {self.number_features}")
+        print(f"Backbone running in process {self.process.pid}")
+
+        self.free_slots = list(range(number_slots))
+        self.sizes = {}
+        self.finished = {}
+        atexit.register(self.close)
+
+    def submit(self, batch_image: np.ndarray):
+        """
+        copy the batch in a free slot and give it to the worker
+        returns :
+            slot (int) : to give to collect
+        """
+        assert len(batch_image) <= self.slot_size, f"batch of {len(batch_image)} images, slot_size is {self.slot_size}"
+        if len(self.free_slots) == 0:
+            raise RuntimeError(f"the {self.number_slots} slots are used, collect the features before submitting")
+        slot = self.free_slots.pop(0)
+        self.inputs[slot, : len(batch_image)] = batch_image
+        self.sizes[slot] = len(batch_image)
+        self.requests.put((slot, len(batch_image)))
+        return slot
+
+    def get_result(self):
+        """
+        next message of the worker, raises RuntimeError if the worker died (ex : killed by the oom killer, segfault)
+        """
+        while True:
+            try:
+                return self.results.get(timeout=POLL_PERIOD)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(f"backbone process {self.process.pid} died (exit code {self.process.exitcode})")
+
+    def receive(self):
+        slot, error = self.get_result()
+        self.finished[slot] = error
+
+    def collect(self, slot: int):
+        """
+        wait for the features of the slot
+        returns :
+            features (np.ndarray(n_images,n_features)) : copy of the features, the slot is freed
+        """
+        while slot not in self.finished:
+            self.receive()
+        error = self.finished.pop(slot)
+        features = self.outputs[slot, : self.sizes.pop(slot), : self.number_features].copy()
+        self.free_slots.append(slot)
+        if error is not None:
+            raise RuntimeError(f"backbone process : {error}")
+        return features
+
+    def __call__(self, batch_image: np.ndarray):
+        """
+        img : batchified numpy img with channel last convention
+        """
+        return np.concatenate(
+            [
+                self.collect(self.submit(batch_image[start : start + self.slot_size]))
+                for start in range(0, len(batch_image), self.slot_size)
+            ],
+            axis=0,
+        )
+
+    def close(self):
+        if self.process.is_alive():
+            self.requests.put(None)
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+        if self.input_memory is not None:
+            del self.inputs, self.outputs
+            for memory in (self.input_memory, self.output_memory):
+                memory.close()
+                memory.unlink()
+            self.input_memory = None
+            self.output_memory = None
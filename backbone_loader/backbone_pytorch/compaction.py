@@ -0,0 +1,163 @@
+"""
+inference only version of ResNet9/ResNet12 :
+    - every BatchNorm2d is folded into the weights and bias of the convolution before it
+    - training only branches (mixup, manifold mixup) are removed
+The modules keep the names of the original model (block1.conv1, ..., block1.sc) to compare them layer by layer.
+"""
+import time
+import torch
+import torch.nn as nn
+
+
+def fold_conv_bn(conv: nn.Conv2d, bn: nn.BatchNorm2d):
+    """
+    return a convolution (with bias) equivalent to bn(conv(x)) in eval mode
+    """
+    folded = nn.Conv2d(
+        conv.in_channels,
+        conv.out_channels,
+        kernel_size=conv.kernel_size,
+        stride=conv.stride,
+        padding=conv.padding,
+        groups=conv.groups,
+        bias=True,
+    ).to(conv.weight.device)
+    with torch.no_grad():
+        scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+        folded.weight.copy_(conv.weight * scale.reshape(-1, 1, 1, 1))
+        bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+        folded.bias.copy_((bias - bn.running_mean) * scale + bn.bias)
+    return folded
+
+
+class FoldedConv2d(nn.Module):
+    """
+    ConvBN2d with the BatchNorm folded into the convolution
+    """
+
+    def __init__(self, conv_bn):
+        super(FoldedConv2d, self).__init__()
+        self.conv = fold_conv_bn(conv_bn.conv, conv_bn.bn)
+        self.outRelu = conv_bn.outRelu
+        self.leaky = conv_bn.leaky
+
+    def forward(self, x):
+        y = self.conv(x)
+        if self.outRelu:
+            if not self.leaky:
+                return torch.relu(y)
+            else:
+                return torch.nn.functional.leaky_relu(y, negative_slope=0.1)
+        else:
+            return y
+
+
+class FoldedBlockRN12(nn.Module):
+    """
+    BasicBlockRN12 with folded convolutions (the shortcut is folded as well)
+    """
+
+    def __init__(self, block):
+        super(FoldedBlockRN12, self).__init__()
+        self.conv1 = FoldedConv2d(block.conv1)
+        self.conv2 = FoldedConv2d(block.conv2)
+        self.conv3 = FoldedConv2d(block.conv3)
+        self.sc = FoldedConv2d(block.sc)
+        self.leaky = block.leaky
+
+    def forward(self, x):
+        y = self.conv1(x)
+        y = self.conv2(y)
+        y = self.conv3(y)
+        y = y + self.sc(x)
+        if self.leaky:
+            return torch.nn.functional.leaky_relu(y, negative_slope=0.1)
+        else:
+            return torch.relu(y)
+
+
+class CompactResNet(nn.Module):
+    """
+    inference only ResNet9 / ResNet12Brain (blocks are ran in order, then global mean)
+    """
+
+    def __init__(self, model):
+        super(CompactResNet, self).__init__()
+        self.block_names = [name for name, _ in model.named_children() if name.startswith("block")]
+        for name in self.block_names:
+            setattr(self, name, FoldedBlockRN12(getattr(model, name)))
+        self.mp = model.mp
+
+    def forward(self, x):
+        if x.shape[1] == 1:
+            x = x.repeat(1, 3, 1, 1)
+        y = x
+        for name in self.block_names:
+            y = self.mp(getattr(self, name)(y))
+        y = y.mean(dim=list(range(2, len(y.shape))))
+        return y
+
+
+def compact_model(model):
+    """
+    return the inference only version of a ResNet9 / ResNet12Brain (the model must be in fp32)
+    """
+    model.eval()
+    compact = CompactResNet(model)
+    compact.eval()
+    return compact
+
+
+def check_equivalence(model, compact, input_resolution, n_samples=8, device="cpu"):
+    """
+    compare the features of the original and compacted model on random inputs
+    returns :
+        dict : max absolute error and max error relative to the norm of the features
+    """
+    batch = torch.randn(n_samples, 3, input_resolution, input_resolution, device=device)
+    with torch.no_grad():
+        reference = model(batch)
+        features = compact(batch)
+    error = (features - reference).abs()
+    relative = torch.linalg.norm(features - reference, dim=-1) / torch.linalg.norm(reference, dim=-1)
+    return {"max_abs": error.max().item(), "max_relative": relative.max().item()}
+
+
+def layer_latency(model, batch, layer_type, n_runs=20):
+    """
+    mean latency (ms) of every module of type layer_type (measured with forward hooks)
+    args :
+        - model : model to time
+        - batch (torch.Tensor) : input of the model
+        - layer_type : type(s) of the module to time (ex : ConvBN2d, FoldedConv2d)
+    returns :
+        dict : name of the module -> mean latency in ms
+    """
+    starts = {}
+    durations = {}
+    handles = []
+
+    def pre_hook(name):
+        def hook(module, inputs):
+            starts[name] = time.perf_counter()
+
+        return hook
+
+    def post_hook(name):
+        def hook(module, inputs, output):
+            durations.setdefault(name, []).append(time.perf_counter() - starts[name])
+
+        return hook
+
+    for name, module in model.named_modules():
+        if isinstance(module, layer_type):
+            handles.append(module.register_forward_pre_hook(pre_hook(name)))
+            handles.append(module.register_forward_hook(post_hook(name)))
+    with torch.no_grad():
+        model(batch)  # warmup
+        durations.clear()
+        for _ in range(n_runs):
+            model(batch)
+    for handle in handles:
+        handle.remove()
+    return {name: 1000 * sum(values) / len(values) for name, values in durations.items()}
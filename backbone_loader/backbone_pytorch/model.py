@@ -1,5 +1,10 @@
 import torch
 from backbone_loader.backbone_pytorch.resnet9_12 import ResNet12Brain, ResNet9
+from backbone_loader.backbone_pytorch.compaction import compact_model
+
+# numeric precision of the backbone (weights and activations)
+PRECISIONS = ("fp32", "fp16", "bf16", "int8")
+TORCH_DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
 
 def load_model_weights(
     model, path, device=None, verbose=False, raise_error_incomplete=True
@@ -22,10 +27,7 @@ def load_model_weights(
             if verbose:
                 print(f"loading weight name : {k}", flush=True)
 
-            if "bn" in k:
-                new_dict[k] = weight.to(torch.float16)
-            else:
-                new_dict[k] = weight.to(torch.float16)
+            new_dict[k] = weight
         else:
             if raise_error_incomplete:
                 raise TypeError("the weights does not correspond to the same model")
@@ -34,11 +36,29 @@ def load_model_weights(
     model.load_state_dict(model_dict)
 
 
-def get_model(backbone, input_model, use_strides, device="cpu"):
+def set_precision(model, precision):
+    """
+    cast the weights of the model to the given precision (the weights are loaded in fp32)
+    args :
+        - model(torch.nn.Module) : model to cast
+        - precision(str) : fp32, fp16 or bf16
+    int8 is not available here : pytorch dynamic quantization only handles Linear layers
+    and the backbones are made of convolutions (use the onnx backend instead)
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision {precision} is not one of {PRECISIONS}")
+    if precision not in TORCH_DTYPES:
+        raise NotImplementedError(f"precision {precision} is not supported by the pytorch backend")
+    return model.to(TORCH_DTYPES[precision])
+
+
+def get_model(backbone, input_model, use_strides, device="cpu", precision="fp32", fold_bn=False):
     """
     get a model from pytorch_hub or from custom arch, using hardcoded specifications
     backbone : type of the model: either resnet 12 or resnet 9.
     input_model : path to pytorch weights
+    precision : fp32, fp16 or bf16 (see set_precision)
+    fold_bn : return the inference only model, with batchnorms folded into the convolutions
     """
     pretrained_dict = torch.load(input_model, map_location=device)
     feature_maps = len(pretrained_dict['block1.conv1.conv.weight'])
@@ -51,5 +71,8 @@ def get_model(backbone, input_model, use_strides, device="cpu"):
         load_model_weights(model, input_model, device=device)
     else:
         raise NotImplementedError(f"model {backbone} is not implemented")
+    if fold_bn:
+        model = compact_model(model)
+    model = set_precision(model, precision)
     model.eval()
     return model
@@ -0,0 +1,47 @@
+"""
+ResNet9/ResNet12 cut after each block (early exits) : each segment runs one block and gives the feature map for the
+next segment and the pooled features of the block (global mean, as at the end of the full model)
+works with ResNet9, ResNet12Brain and the compacted models (modules block1, block2, ... and mp)
+"""
+import torch
+import torch.nn as nn
+
+
+class BlockSegment(nn.Module):
+    """
+    block of the backbone and its pooling
+    """
+
+    def __init__(self, block, mp, first=False):
+        super(BlockSegment, self).__init__()
+        self.block = block
+        self.mp = mp
+        self.first = first
+
+    def forward(self, x):
+        if self.first and x.shape[1] == 1:
+            x = x.repeat(1, 3, 1, 1)
+        y = self.mp(self.block(x))
+        return y, y.mean(dim=list(range(2, len(y.shape))))
+
+
+def block_segments(model):
+    """
+    segments of the model (share the weights of the model), the pooled features of the last one are the features of
+    the full model
+    """
+    block_names = [name for name, _ in model.named_children() if name.startswith("block")]
+    return [BlockSegment(getattr(model, name), model.mp, first=index == 0) for index, name in enumerate(block_names)]
+
+
+def segment_inputs(segments, input_resolution, device="cpu"):
+    """
+    random input of each segment (shape of the feature map given by the previous segment)
+    """
+    inputs = []
+    x = torch.randn(1, 3, input_resolution, input_resolution, device=device)
+    with torch.no_grad():
+        for segment in segments:
+            inputs.append(x)
+            x, _ = segment(x)
+    return inputs
@@ -34,14 +34,22 @@ class BackboneTensilWrapper:
         self.tcu = Driver(self.tarch, overlay.axi_dma_0, debug=debug)
         print("TCU successfully loaded.")
 
+        self.load_model(path_tmodel)
+        assert self.tcu.arch.array_size >= 3, "array size must be >=3"
+        self.max_batch_size = 1
+
+    def load_model(self, path_tmodel: Union[str, os.PathLike]):
+        """
+        load the program of a tmodel in the TCU (models compiled for the same architecture)
+        """
         with open(path_tmodel, "r") as f:
             tmodel = json.loads(f.read())
             input = tmodel["inputs"][0]
             output = tmodel["outputs"][0]
             self.input_name = input["name"]
-            self.output_name = output["name"]            
+            self.output_name = output["name"]
         self.tcu.load_model(path_tmodel)
-        assert self.tcu.arch.array_size >= 3, "array size must be >=3"
+        self.path_tmodel = path_tmodel
 
     def __call__(self, single_image_batch: np.ndarray):
         assert len(single_image_batch.shape) == 4, "single image is not a batch"
@@ -0,0 +1,179 @@
+"""
+numpy simulation of a tensil backbone : the onnx graph is executed with the fixed point data type of the
+architecture (ex : FP16BP8 = 16 bits with 8 fractional bits), rounding and saturating the weights and the output
+of every operation, as the TCU does. Runs without the board, on batches of images.
+"""
+import json
+import re
+import numpy as np
+import onnx
+from onnx import numpy_helper
+from typing import Union
+import os
+
+
+class FixedPoint:
+    """
+    fixed point data type of tensil, FP<bits>BP<fractional bits>
+    """
+
+    def __init__(self, data_type: str = "FP16BP8"):
+        match = re.fullmatch(r"FP(\d+)BP(\d+)", data_type)
+        if match is None:
+            raise ValueError(f"data type {data_type} is not a tensil fixed point type")
+        self.data_type = data_type
+        bits, fractional_bits = int(match.group(1)), int(match.group(2))
+        self.scale = float(2 ** fractional_bits)
+        self.min_value = -(2 ** (bits - 1)) / self.scale
+        self.max_value = (2 ** (bits - 1) - 1) / self.scale
+
+    def __call__(self, x: np.ndarray):
+        """
+        round to the nearest representable value and saturate
+        """
+        x = np.floor(np.asarray(x, dtype=np.float32) * self.scale + 0.5) / self.scale
+        return np.clip(x, self.min_value, self.max_value).astype(np.float32, copy=False)
+
+
+def identity(x):
+    return x
+
+
+def conv2d(x, weight, bias, strides, pads):
+    """
+    vectorized convolution (NCHW input, OIHW weights, groups=1)
+    """
+    if any(pads):
+        x = np.pad(x, ((0, 0), (0, 0), (pads[0], pads[2]), (pads[1], pads[3])))
+    kernel_h, kernel_w = weight.shape[2:]
+    windows = np.lib.stride_tricks.sliding_window_view(x, (kernel_h, kernel_w), axis=(2, 3))
+    windows = windows[:, :, :: strides[0], :: strides[1]]
+    # (N,C,H,W,kh,kw) x (O,C,kh,kw) -> (N,H,W,O)
+    y = np.tensordot(windows, weight, axes=((1, 4, 5), (1, 2, 3)))
+    if bias is not None:
+        y += bias
+    return np.ascontiguousarray(y.transpose(0, 3, 1, 2))
+
+
+def max_pool(x, kernel_shape, strides, pads):
+    if any(pads):
+        x = np.pad(x, ((0, 0), (0, 0), (pads[0], pads[2]), (pads[1], pads[3])), constant_values=-np.inf)
+    windows = np.lib.stride_tricks.sliding_window_view(x, tuple(kernel_shape), axis=(2, 3))
+    windows = windows[:, :, :: strides[0], :: strides[1]]
+    return windows.max(axis=(4, 5))
+
+
+class BackboneTensilSimWrapper:
+    def __init__(
+        self,
+        path_onnx: Union[str, os.PathLike],
+        data_type: str = "FP16BP8",
+        path_tarch: Union[None, str, os.PathLike] = None,
+    ):
+        """
+        Args :
+            - path_onnx : onnx graph compiled for tensil (output of model_to_onnx.py)
+            - data_type : tensil data type (ex : FP16BP8)
+            - path_tarch : tensil architecture, overrides data_type if given
+        """
+        if path_tarch is not None:
+            with open(path_tarch, "r", encoding="utf-8") as file:
+                data_type = json.load(file)["data_type"]
+        print(f"path to model : {path_onnx} (simulated {data_type})")
+        self.fixed_point = FixedPoint(data_type)
+        model = onnx.load(path_onnx)
+        self.nodes = list(model.graph.node)
+        self.initializers = {}
+        for init in model.graph.initializer:
+            value = numpy_helper.to_array(init)
+            self.initializers[init.name] = value.astype(np.float32) if value.dtype.kind == "f" else value
+        # weights are stored in fixed point on the board
+        self.quantized_initializers = {
+            name: self.fixed_point(value) if value.dtype == np.float32 else value
+            for name, value in self.initializers.items()
+        }
+        graph_inputs = [i.name for i in model.graph.input if i.name not in self.initializers]
+        self.input_name = graph_inputs[0]
+        self.output_name = model.graph.output[0].name
+        self.max_batch_size = None
+
+    def run(self, batch_image: np.ndarray, quantize=True):
+        """
+        execute the graph
+        args :
+            - batch_image : batch of images, channel last convention
+            - quantize : fixed point simulation (True) or float inference (False)
+        """
+        assert len(batch_image.shape) == 4, "not a batch"
+        assert batch_image.shape[-1] == 3, "last channel is not a rgb image"
+        q = self.fixed_point if quantize else identity
+        values = dict(self.quantized_initializers if quantize else self.initializers)
+        values[self.input_name] = q(np.transpose(batch_image, (0, 3, 1, 2)).astype(np.float32))
+
+        for node in self.nodes:
+            attributes = {attribute.name: onnx.helper.get_attribute_value(attribute) for attribute in node.attribute}
+            inputs = [values[name] if name else None for name in node.input]
+            op_type = node.op_type
+            if op_type == "Conv":
+                assert attributes.get("group", 1) == 1, "grouped convolutions are not supported"
+                output = conv2d(
+                    inputs[0], inputs[1], inputs[2] if len(inputs) > 2 else None,
+                    attributes.get("strides", [1, 1]), attributes.get("pads", [0, 0, 0, 0]),
+                )
+            elif op_type == "BatchNormalization":
+                x, scale, bias, mean, var = inputs[:5]
+                factor = scale / np.sqrt(var + attributes.get("epsilon", 1e-5))
+                output = (x - mean[:, None, None]) * factor[:, None, None] + bias[:, None, None]
+            elif op_type == "Relu":
+                output = np.maximum(inputs[0], 0)
+            elif op_type == "LeakyRelu":
+                alpha = q(np.float32(attributes.get("alpha", 0.01)))
+                output = np.where(inputs[0] > 0, inputs[0], alpha * inputs[0])
+            elif op_type == "Add":
+                output = inputs[0] + inputs[1]
+            elif op_type == "Mul":
+                output = inputs[0] * inputs[1]
+            elif op_type == "MaxPool":
+                output = max_pool(
+                    inputs[0], attributes["kernel_shape"], attributes.get("strides", [1, 1]), attributes.get("pads", [0, 0, 0, 0])
+                )
+            elif op_type == "GlobalAveragePool":
+                # sum, then multiplication by 1/n in fixed point
+                n = inputs[0].shape[2] * inputs[0].shape[3]
+                output = inputs[0].sum(axis=(2, 3), keepdims=True) * q(np.float32(1 / n))
+            elif op_type == "ReduceMean":
+                output = inputs[0].mean(axis=tuple(attributes["axes"]), keepdims=bool(attributes.get("keepdims", 1)))
+            elif op_type == "Reshape":
+                shape = [d if d != 0 else inputs[0].shape[i] for i, d in enumerate(inputs[1])]
+                # the batch dimension is exported as 1, keep the batch of the input
+                if len(shape) > 0 and shape[0] == 1:
+                    shape[0] = inputs[0].shape[0]
+                output = inputs[0].reshape(shape)
+            elif op_type == "Flatten":
+                output = inputs[0].reshape(inputs[0].shape[0], -1)
+            elif op_type == "Identity":
+                output = inputs[0]
+            elif op_type == "Constant":
+                output = numpy_helper.to_array(attributes["value"])
+            else:
+                raise NotImplementedError(f"onnx operation {op_type} is not supported by the tensil simulator")
+            if output.dtype.kind == "f":
+                output = q(output)
+            values[node.output[0]] = output
+        return values[self.output_name]
+
+    def __call__(self, batch_image: np.ndarray):
+        """
+        img : batchified numpy img with channel last convention (any batch size)
+        """
+        return self.run(batch_image, quantize=True)
+
+    def divergence(self, batch_image: np.ndarray):
+        """
+        divergence between the fixed point simulation and the float inference on the batch
+        returns :
+            dict : mean relative l2 error, mean cosine similarity, max absolute error
+        """
+        from few_shot_model.evaluation import feature_drift
+
+        return feature_drift(self.run(batch_image, quantize=True), self.run(batch_image, quantize=False))
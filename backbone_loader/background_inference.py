@@ -0,0 +1,132 @@
+"""
+run the backbone and the classification in a background thread, at its own rate, while the display runs at the
+rate of the camera
+
+the main loop gives the latest frame (older frames not yet classified are dropped) and reads the probabilities,
+interpolated between the last two classifications so that the indicator bars move smoothly
+"""
+import threading
+import time
+import numpy as np
+
+# maximum time waited for the first classification (s)
+FIRST_RESULT_TIMEOUT = 30
+
+
+class BackgroundClassifier:
+    """
+    attributes :
+        extract_features : frame -> features (ex : backbone on the preprocessed frame), not used by the main loop
+            while the classifier is running
+        few_shot_model : FewShotModel
+        rate : classifications per second (None : as fast as the backbone allows)
+        backbone_time : duration of the last backbone call (s)
+        classification_rate : measured classifications per second
+        error : exception raised in the thread (raised again by get_prediction)
+    """
+
+    def __init__(self, extract_features, few_shot_model, rate=None):
+        self.extract_features = extract_features
+        self.few_shot_model = few_shot_model
+        self.rate = rate
+        self.condition = threading.Condition()
+        self.first_result = threading.Event()
+        self.thread = None
+        self.running = False
+        self.frame = None
+        self.results = []  # last two (time, classe_prediction, probabilities)
+        self.backbone_time = 0
+        self.classification_rate = 0
+        self.error = None
+
+    def start(self, shot_list, mean_features, support_bank=None):
+        """
+        start classifying the submitted frames with the given shots (and their SupportBank)
+        """
+        self.stop()
+        self.shot_list = shot_list
+        self.mean_features = mean_features
+        self.support_bank = support_bank
+        self.frame = None
+        self.results = []
+        self.error = None
+        self.first_result.clear()
+        self.running = True
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+        self.thread = None
+
+    def submit(self, frame: np.ndarray):
+        """
+        give the latest frame (input of extract_features), replaces the frame not yet classified
+        """
+        with self.condition:
+            self.frame = frame
+            self.condition.notify()
+
+    def loop(self):
+        try:
+            self.classify_frames()
+        except Exception as error:
+            # the main loop must not wait for a result that will never come
+            self.error = error
+            self.running = False
+            self.first_result.set()
+
+    def classify_frames(self):
+        probabilities = None
+        last_start = None
+        while True:
+            with self.condition:
+                while self.running and self.frame is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                frame, self.frame = self.frame, None
+
+            start = time.time()
+            features = self.extract_features(frame)
+            self.backbone_time = time.time() - start
+            classe_prediction, probabilities = self.few_shot_model.predict_class_moving_avg(
+                features, probabilities, self.shot_list, self.mean_features, support_bank=self.support_bank
+            )
+            now = time.time()
+            with self.condition:
+                self.results = self.results[-1:] + [(now, classe_prediction, probabilities)]
+            self.first_result.set()
+
+            if last_start is not None:
+                self.classification_rate = 1 / max(start - last_start, 1e-6)
+            last_start = start
+            if self.rate:
+                time.sleep(max(0, 1 / self.rate - (time.time() - start)))
+
+    def get_prediction(self, timeout=FIRST_RESULT_TIMEOUT):
+        """
+        probabilities interpolated between the last two classifications (the display is one classification late)
+        waits for the first classification, raises the exception of the thread if it failed
+        returns :
+            classe_prediction : class prediction
+            probabilities : probability of belonging to each class
+        """
+        if not self.first_result.wait(timeout):
+            raise TimeoutError(f"no classification from the background thread after {timeout} s")
+        if self.error is not None:
+            raise self.error
+        with self.condition:
+            results = list(self.results)
+        if len(results) == 1:
+            _, classe_prediction, probabilities = results[0]
+            return classe_prediction, probabilities
+        (previous_time, _, previous), (last_time, _, last) = results
+        alpha = np.clip((time.time() - last_time) / max(last_time - previous_time, 1e-6), 0, 1)
+        probabilities = previous + alpha * (last - previous)
+        return probabilities.argmax(), probabilities
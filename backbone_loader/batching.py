@@ -0,0 +1,116 @@
+"""
+batching of the backbone calls :
+    - batched_call : call a backbone on batches of any size, whatever the batch size supported by the backend
+      (max_batch_size attribute of the wrappers : None for any size, ex : 1 for tensil and the onnx graphs exported by model_to_onnx.py)
+    - gather_batch : gather the items of a queue into a batch, under a deadline
+    - MicroBatcher : gather the frames submitted by several threads into batches
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+
+def batched_call(backbone, batch: np.ndarray):
+    """
+    run the backbone on the batch, split into chunks of backbone.max_batch_size images
+    (the last chunk is padded with its last image when the backbone only takes full batches)
+    args :
+        - backbone : wrapper of the backbone (see backbone_loader.get_model)
+        - batch (np.ndarray(n_images,h,w,c)) : preprocessed batch, channel last
+    returns :
+        features (np.ndarray(n_images,n_features))
+    """
+    max_batch_size = getattr(backbone, "max_batch_size", None)
+    if max_batch_size is None or len(batch) == max_batch_size:
+        return backbone(batch)
+
+    features = []
+    for start in range(0, len(batch), max_batch_size):
+        chunk = batch[start : start + max_batch_size]
+        number = len(chunk)
+        if number < max_batch_size:
+            chunk = np.concatenate([chunk, np.repeat(chunk[-1:], max_batch_size - number, axis=0)], axis=0)
+        features.append(backbone(chunk)[:number])
+    return np.concatenate(features, axis=0)
+
+
+def gather_batch(input_queue: queue.Queue, max_batch_size: int, deadline: float, timeout: float = 0.1):
+    """
+    gather items of the queue into a batch : waits for the first item (at most timeout seconds),
+    then for other items until the batch is full or deadline seconds passed since the first item
+    returns :
+        list of the items (empty if no item arrived before the timeout)
+    """
+    try:
+        batch = [input_queue.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    end = time.time() + deadline
+    while len(batch) < max_batch_size:
+        remaining = end - time.time()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(input_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+class MicroBatcher:
+    """
+    gather the frames submitted concurrently (by several threads) into batches for the backbone
+    a batch is ran when it is full or max_wait seconds after its first frame
+    attributes :
+        backbone : wrapper of the backbone
+        max_batch_size : maximum number of frames per batch
+        max_wait : maximum waiting time of the first frame of a batch (s)
+        batch_sizes : size of the batches ran
+    """
+
+    def __init__(self, backbone, max_batch_size=8, max_wait=0.005):
+        self.backbone = backbone
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.input_queue = queue.Queue()
+        self.batch_sizes = []
+        self.running = True
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, batch: np.ndarray):
+        """
+        args :
+            batch (np.ndarray(1,h,w,c)) : preprocessed frame
+        returns :
+            Future, result : features, queueing time (s), compute time (s) of the batch
+        """
+        future = Future()
+        self.input_queue.put((batch, future, time.time()))
+        return future
+
+    def __call__(self, batch: np.ndarray):
+        return self.submit(batch).result()
+
+    def loop(self):
+        while self.running:
+            items = gather_batch(self.input_queue, self.max_batch_size, self.max_wait)
+            if len(items) == 0:
+                continue
+            start = time.time()
+            try:
+                features = batched_call(self.backbone, np.concatenate([batch for batch, _, _ in items], axis=0))
+            except Exception as error:
+                for _, future, _ in items:
+                    future.set_exception(error)
+                continue
+            compute_time = time.time() - start
+            self.batch_sizes.append(len(items))
+            for index, (_, future, submit_time) in enumerate(items):
+                future.set_result((features[index : index + 1], start - submit_time, compute_time))
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
@@ -0,0 +1,187 @@
+"""
+cascade of backbones : a cheap stage (small backbone and/or low resolution) classifies every frame, the next stage
+(larger backbone, higher resolution) only runs when the margin between the two most probable classes is below the
+threshold of the stage
+
+each stage keeps its own support set (mean features and shots computed with its backbone), the shots are registered
+in every stage
+
+config (json) : list of stages, from the cheapest to the most expensive
+    [
+        {"backbone_specs": {"model_name": "resnet9", "weight": "resnet9.pt"}, "resolution": 32, "margin": 0.3},
+        {"backbone_specs": {"model_name": "resnet12", "weight": "resnet12.pt"}, "resolution": 64}
+    ]
+the backbone_specs of a stage are merged with the default specs (see backbone_loader.get_model), the margin of the
+last stage is ignored
+"""
+import json
+import time
+import cv2
+import numpy as np
+
+from backbone_loader.backbone_loader import get_model
+from backbone_loader.preprocessing import preprocess
+from few_shot_model.data_few_shot import DataFewShot
+
+
+def probability_margin(probabilities: np.ndarray):
+    """
+    difference between the two highest probabilities (1 if there is only one class)
+    """
+    if probabilities.shape[-1] < 2:
+        return np.ones(probabilities.shape[:-1])
+    top_two = np.partition(probabilities, -2, axis=-1)[..., -2:]
+    return top_two[..., 1] - top_two[..., 0]
+
+
+class CascadeStage:
+    """
+    attributes :
+        backbone : backbone of the stage
+        resolution : (width, height) of the input of the backbone
+        margin : the next stage runs if the margin of the prediction is below
+        data (DataFewShot) : support set of the stage
+    """
+
+    def __init__(self, backbone, resolution, margin=None):
+        self.backbone = backbone
+        self.resolution = resolution
+        self.margin = margin
+        self.data = DataFewShot(0)
+
+    def features(self, frame: np.ndarray):
+        """
+        features of the camera frame (resized to the resolution of the stage)
+        """
+        img = cv2.resize(frame, dsize=self.resolution, interpolation=cv2.INTER_LINEAR)
+        return self.backbone(preprocess(img))
+
+
+class Cascade:
+    """
+    stages of the cascade and their statistics
+    attributes :
+        stages (list(CascadeStage)) : from the cheapest to the most expensive
+        runs : number of frames classified by each stage
+        stage_times : total time of each stage (s)
+    """
+
+    def __init__(self, stages, few_shot_model):
+        if len(stages) == 0:
+            raise ValueError("the cascade needs at least one stage")
+        self.stages = stages
+        self.few_shot_model = few_shot_model
+        self.reset_stats()
+
+    @classmethod
+    def from_config(cls, path, few_shot_model, default_specs=None):
+        with open(path, "r", encoding="utf-8") as file:
+            config = json.load(file)
+        stages = []
+        for index, stage in enumerate(config):
+            if index < len(config) - 1 and stage.get("margin", None) is None:
+                raise ValueError(f"stage {index} of the cascade needs a margin")
+            specs = dict(default_specs or {}, **stage.get("backbone_specs", {}))
+            resolution = stage.get("resolution", 32)
+            if isinstance(resolution, int):
+                resolution = (resolution, resolution)
+            stages.append(CascadeStage(get_model(specs), tuple(resolution), stage.get("margin", None)))
+            print(f"Cascade stage {len(stages) - 1} : {specs}, resolution {resolution}, margin {stage.get('margin', None)}")
+        return cls(stages, few_shot_model)
+
+    def reset_stats(self):
+        self.frames = 0
+        self.runs = [0] * len(self.stages)
+        self.stage_times = [0.0] * len(self.stages)
+
+    def stage_features(self, frame: np.ndarray):
+        """
+        generator of the features of each stage, a stage only runs when its features are asked
+        """
+        for stage in self.stages:
+            yield stage.features(frame)
+
+    ### support sets (same calls as DataFewShot, with the camera frame) ###
+
+    def add_mean_repr(self, frame: np.ndarray):
+        for stage, features in zip(self.stages, self.stage_features(frame)):
+            stage.data.add_mean_repr(features)
+
+    def aggregate_mean_rep(self):
+        for stage in self.stages:
+            stage.data.aggregate_mean_rep()
+
+    def add_repr(self, classe: int, frame: np.ndarray):
+        for stage, features in zip(self.stages, self.stage_features(frame)):
+            stage.data.add_repr(classe, features)
+
+    def reset(self):
+        for stage in self.stages:
+            stage.data.reset()
+
+    def is_data_recorded(self):
+        return self.stages[0].data.is_data_recorded()
+
+    @property
+    def registered_classes(self):
+        return self.stages[0].data.registered_classes
+
+    ### inference ###
+
+    def predict_class_moving_avg(self, frame: np.ndarray, prev_probabilities):
+        """
+        classify the frame with the first stages until the margin is above the threshold of the stage
+        args :
+            frame (np.ndarray(h,w,3)) : camera frame
+            prev_probabilities : probabilities of the previous prediction (moving average)
+        returns :
+            classe_prediction : class prediction
+            probabilities : probability of belonging to each class
+        """
+        self.frames += 1
+        start = time.time()
+        for index, (stage, features) in enumerate(zip(self.stages, self.stage_features(frame))):
+            _, current_proba = self.few_shot_model.predict_class_feature(
+                features,
+                stage.data.get_shot_list(),
+                stage.data.get_mean_features(),
+                support_bank=stage.data.get_support_bank(),
+            )
+            self.stage_times[index] += time.time() - start
+            self.runs[index] += 1
+            last = index == len(self.stages) - 1
+            if last or probability_margin(current_proba).min() >= stage.margin:
+                break
+            start = time.time()
+        probabilities = self.few_shot_model.moving_average(prev_probabilities, current_proba)
+        return probabilities.argmax(), probabilities
+
+    @property
+    def escalation_rate(self):
+        """
+        fraction of the frames that needed more than the first stage
+        """
+        return self.runs[1] / self.frames if self.frames and len(self.stages) > 1 else 0
+
+    def report(self):
+        frames = max(self.frames, 1)
+        return {
+            "frames": self.frames,
+            "escalation_rate": self.escalation_rate,
+            "stage_rates": [runs / frames for runs in self.runs],
+            "exit_rates": [(runs - next_runs) / frames for runs, next_runs in zip(self.runs, self.runs[1:] + [0])],
+            "stage_ms": [1000 * total / runs if runs else 0 for total, runs in zip(self.stage_times, self.runs)],
+            "cost_per_frame_ms": 1000 * sum(self.stage_times) / frames,
+        }
+
+    def print_report(self, path=None):
+        report = self.report()
+        print(f"\n{type(self).__name__} : {report['frames']} frames, {100 * report['escalation_rate']:.1f}% escalated, "
+              f"{report['cost_per_frame_ms']:.2f} ms per frame")
+        for index, (rate, stage_ms) in enumerate(zip(report["stage_rates"], report["stage_ms"])):
+            print(f"    stage {index} : {100 * rate:.1f}% of the frames, {stage_ms:.2f} ms per run")
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=4)
+            print("Report saved in: ", path)
+        return report
@@ -0,0 +1,41 @@
+"""
+early exits : the backbone gives the pooled features after each block, the few shot classifier keeps a support set
+per exit and the next blocks only run when the margin between the two most probable classes is below the threshold
+of the exit (easy frames stop after the first blocks)
+
+the backbone must have the exits generator (pytorch backbones, onnx segments exported with model_to_onnx.py --segments)
+"""
+import cv2
+import numpy as np
+
+from backbone_loader.cascade import Cascade, CascadeStage
+from backbone_loader.preprocessing import preprocess
+
+
+class EarlyExit(Cascade):
+    """
+    cascade whose stages are the exits of one backbone (the blocks already computed are not ran again)
+    """
+
+    def __init__(self, backbone, resolution, margins, few_shot_model):
+        """
+        args :
+            - backbone : backbone with exits and number_exits
+            - resolution : (width, height) of the input of the backbone
+            - margins : threshold of each exit but the last one (a single value is used for all the exits)
+        """
+        if not hasattr(backbone, "exits"):
+            raise NotImplementedError(f"{type(backbone).__name__} has no early exits")
+        margins = list(margins)
+        if len(margins) == 1:
+            margins = margins * (backbone.number_exits - 1)
+        if len(margins) != backbone.number_exits - 1:
+            raise ValueError(f"{len(margins)} margins given for the {backbone.number_exits - 1} first exits")
+        self.backbone = backbone
+        self.resolution = resolution
+        stages = [CascadeStage(None, resolution, margin) for margin in margins + [None]]
+        super(EarlyExit, self).__init__(stages, few_shot_model)
+
+    def stage_features(self, frame: np.ndarray):
+        img = cv2.resize(frame, dsize=self.resolution, interpolation=cv2.INTER_LINEAR)
+        return self.backbone.exits(preprocess(img))
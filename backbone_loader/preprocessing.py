@@ -0,0 +1,20 @@
+"""
+preprocessing of the images given to the backbones (shared by the demo and the offline tools)
+"""
+import numpy as np
+
+
+def preprocess(img, dtype=np.float32):
+    """
+    Args : img(np.ndarray(h,w,c)) :
+    """
+    assert len(img.shape) == 3
+    assert img.shape[-1] == 3
+
+    if img.dtype != dtype:
+        # not that this copy the image
+        img = img.astype(dtype)
+    img = img[None, :]
+    mean = np.array([0.485, 0.456, 0.406], dtype=dtype)
+    std = np.array([0.229, 0.224, 0.225], dtype=dtype)
+    return (img / 255 - mean/std)
@@ -0,0 +1,158 @@
+"""
+several resolutions of the same backbone kept loaded, the demo switches between them at runtime to hold a latency
+target (under cpu or thermal pressure, the resolution goes down, and back up when the latency allows it)
+
+the support set of each resolution (mean features and shots) is extracted from the same calibration and registration
+frames, so a switch needs no registration
+
+variants :
+    - pytorch : one model for all the resolutions (fully convolutional)
+    - onnx, tensil_sim : one graph per resolution (--variant-paths)
+    - tensil : one tmodel per resolution (--variant-paths), the programs share the TCU and are loaded on a switch
+"""
+import time
+
+from backbone_loader.backbone_loader import get_model
+from backbone_loader.cascade import Cascade, CascadeStage
+
+
+class SharedTensilVariant:
+    """
+    tmodel ran by the driver of another variant, its program is loaded when it runs
+    """
+
+    def __init__(self, wrapper, path_tmodel):
+        self.wrapper = wrapper
+        self.path_tmodel = path_tmodel
+        self.max_batch_size = 1
+
+    def __call__(self, single_image_batch):
+        if self.wrapper.path_tmodel != self.path_tmodel:
+            self.wrapper.load_model(self.path_tmodel)
+        return self.wrapper(single_image_batch)
+
+
+def load_variants(backbone_specs, resolutions, variant_paths=None):
+    """
+    backbone of each resolution
+    args :
+        - backbone_specs : specification of the backbone (see backbone_loader.get_model)
+        - resolutions : list of (width, height)
+        - variant_paths : graph of each resolution (onnx, tensil_sim : path_onnx / tensil : path_tmodel)
+    """
+    if backbone_specs["type"] == "pytorch":
+        backbone = get_model(backbone_specs)
+        return [backbone] * len(resolutions)
+    if variant_paths is None or len(variant_paths) != len(resolutions):
+        raise ValueError(f"{backbone_specs['type']} graphs are resolution specific, give one path per resolution")
+    if backbone_specs["type"] in ("onnx", "tensil_sim"):
+        return [get_model(dict(backbone_specs, path_onnx=path)) for path in variant_paths]
+    if backbone_specs["type"] == "tensil":
+        wrapper = get_model(dict(backbone_specs, path_tmodel=variant_paths[0]))
+        return [SharedTensilVariant(wrapper, path) for path in variant_paths]
+    raise NotImplementedError(f"resolution variants of {backbone_specs['type']} are not implemented")
+
+
+class ResolutionSwitch(Cascade):
+    """
+    stages of the cascade are the resolutions (from the lowest to the highest), a single one runs on each frame
+    attributes :
+        current : index of the resolution used
+        latency_target : target of the latency of the backbone and the classifier (s)
+        latency : moving average of the latency of the current resolution (s)
+        switches : number of resolution changes
+    """
+
+    def __init__(self, stages, few_shot_model, latency_target, smoothing=0.9, cooldown=15, margin=0.8):
+        """
+        args :
+            - smoothing : weight of the previous latencies in the moving average
+            - cooldown : minimum number of frames between two switches
+            - margin : the resolution goes up only if its estimated latency is below margin * latency_target
+        """
+        super(ResolutionSwitch, self).__init__(stages, few_shot_model)
+        self.latency_target = latency_target
+        self.smoothing = smoothing
+        self.cooldown = cooldown
+        self.margin = margin
+        self.current = len(stages) - 1
+        self.latency = None
+        self.since_switch = 0
+        self.switches = 0
+
+    @classmethod
+    def from_specs(cls, backbone_specs, resolutions, few_shot_model, latency_target, variant_paths=None):
+        resolutions = [resolution if isinstance(resolution, tuple) else (resolution, resolution) for resolution in resolutions]
+        order = sorted(range(len(resolutions)), key=lambda index: resolutions[index][0] * resolutions[index][1])
+        paths = [variant_paths[index] for index in order] if variant_paths else None
+        resolutions = [resolutions[index] for index in order]
+        backbones = load_variants(backbone_specs, resolutions, paths)
+        stages = [CascadeStage(backbone, resolution) for backbone, resolution in zip(backbones, resolutions)]
+        print(f"Resolution variants : {resolutions}, latency target {1000 * latency_target:.1f} ms")
+        return cls(stages, few_shot_model, latency_target)
+
+    @property
+    def resolution(self):
+        return self.stages[self.current].resolution
+
+    def pixels(self, index):
+        width, height = self.stages[index].resolution
+        return width * height
+
+    def predict_class_moving_avg(self, frame, prev_probabilities):
+        """
+        classify the frame at the current resolution, then update the resolution
+        """
+        stage = self.stages[self.current]
+        start = time.time()
+        _, current_proba = self.few_shot_model.predict_class_feature(
+            stage.features(frame),
+            stage.data.get_shot_list(),
+            stage.data.get_mean_features(),
+            support_bank=stage.data.get_support_bank(),
+        )
+        elapsed = time.time() - start
+        self.frames += 1
+        self.runs[self.current] += 1
+        self.stage_times[self.current] += elapsed
+        self.control(elapsed)
+        probabilities = self.few_shot_model.moving_average(prev_probabilities, current_proba)
+        return probabilities.argmax(), probabilities
+
+    def control(self, elapsed):
+        """
+        lower resolution if the latency is above the target, higher if its latency (estimated from the number of
+        pixels) stays under the target
+        """
+        self.latency = elapsed if self.latency is None else self.smoothing * self.latency + (1 - self.smoothing) * elapsed
+        self.since_switch += 1
+        if self.since_switch < self.cooldown:
+            return
+        if self.latency > self.latency_target and self.current > 0:
+            self.switch(self.current - 1)
+        elif self.current < len(self.stages) - 1:
+            estimate = self.latency * self.pixels(self.current + 1) / self.pixels(self.current)
+            if estimate < self.margin * self.latency_target:
+                self.switch(self.current + 1)
+
+    def switch(self, index):
+        # the latency of the new resolution is estimated from the number of pixels until it is measured
+        self.latency *= self.pixels(index) / self.pixels(self.current)
+        self.current = index
+        self.since_switch = 0
+        self.switches += 1
+
+    @property
+    def escalation_rate(self):
+        """
+        fraction of the frames classified above the lowest resolution
+        """
+        return 1 - self.runs[0] / self.frames if self.frames else 0
+
+    def report(self):
+        report = super(ResolutionSwitch, self).report()
+        report["resolutions"] = [list(stage.resolution) for stage in self.stages]
+        report["switches"] = self.switches
+        report["latency_target_ms"] = 1000 * self.latency_target
+        del report["exit_rates"]
+        return report
@@ -0,0 +1,92 @@
+"""
+test time augmentation : a frame is expanded into a batch of views (flips, crops, scales), ran through the backbone
+in one batched call, and the features of the views are pooled (mean) before the classification
+
+views :
+    - flip : horizontal flip
+    - crops : 4 corners and center crops (crop_ratio of the frame)
+    - scales : center crops zooming in (scale < 1) or zoom out with reflected borders (scale > 1)
+The whole frame (resized) is always the first view.
+"""
+import cv2
+import numpy as np
+
+from backbone_loader.batching import batched_call
+from backbone_loader.preprocessing import preprocess
+
+TTA_VIEWS = ("flip", "crops", "scales")
+
+
+def center_crop(frame: np.ndarray, ratio: float):
+    height, width = frame.shape[:2]
+    crop_height, crop_width = int(ratio * height), int(ratio * width)
+    top, left = (height - crop_height) // 2, (width - crop_width) // 2
+    return frame[top : top + crop_height, left : left + crop_width]
+
+
+def zoom_out(frame: np.ndarray, scale: float):
+    height, width = frame.shape[:2]
+    pad_height, pad_width = int((scale - 1) * height / 2), int((scale - 1) * width / 2)
+    return cv2.copyMakeBorder(frame, pad_height, pad_height, pad_width, pad_width, cv2.BORDER_REFLECT)
+
+
+def augmented_views(frame: np.ndarray, resolution, views=TTA_VIEWS, crop_ratio=0.875, scales=(0.8, 1.2)):
+    """
+    args :
+        - frame (np.ndarray(h,w,3)) : frame (any resolution, the views are taken before the resize)
+        - resolution (tuple) : width, height of the backbone input
+        - views : augmentations among TTA_VIEWS
+    returns :
+        np.ndarray(n_views,height,width,3) : views at the backbone resolution
+    """
+    for view in views:
+        if view not in TTA_VIEWS:
+            raise NotImplementedError(f"view {view} is not implemented")
+    height, width = frame.shape[:2]
+    crops = [frame]
+    if "flip" in views:
+        crops.append(frame[:, ::-1])
+    if "crops" in views:
+        crop_height, crop_width = int(crop_ratio * height), int(crop_ratio * width)
+        for top, left in ((0, 0), (0, width - crop_width), (height - crop_height, 0), (height - crop_height, width - crop_width)):
+            crops.append(frame[top : top + crop_height, left : left + crop_width])
+        crops.append(center_crop(frame, crop_ratio))
+    if "scales" in views:
+        for scale in scales:
+            crops.append(center_crop(frame, scale) if scale < 1 else zoom_out(frame, scale))
+    return np.stack(
+        [cv2.resize(np.ascontiguousarray(crop), dsize=resolution, interpolation=cv2.INTER_LINEAR) for crop in crops],
+        axis=0,
+    )
+
+
+class TestTimeAugmentation:
+    """
+    features of a frame pooled over its augmented views
+    attributes :
+        backbone : wrapper of the backbone, the views are given in batches of backbone.max_batch_size
+        resolution : input resolution of the backbone (width, height)
+        views : augmentations among TTA_VIEWS
+    """
+
+    def __init__(self, backbone, resolution, views=TTA_VIEWS, crop_ratio=0.875, scales=(0.8, 1.2)):
+        self.backbone = backbone
+        self.resolution = tuple(resolution)
+        self.views = tuple(views)
+        self.crop_ratio = crop_ratio
+        self.scales = tuple(scales)
+
+    def features(self, frame: np.ndarray, pool=True):
+        """
+        returns :
+            features (np.ndarray(1,n_features)) if pool, else features of each view (np.ndarray(n_views,n_features))
+        """
+        views = augmented_views(frame, self.resolution, self.views, self.crop_ratio, self.scales)
+        batch = np.concatenate([preprocess(view) for view in views], axis=0)
+        features = batched_call(self.backbone, batch)
+        if pool:
+            return features.mean(axis=0, keepdims=True)
+        return features
+
+    def __call__(self, frame: np.ndarray):
+        return self.features(frame, pool=True)
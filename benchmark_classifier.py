@@ -0,0 +1,112 @@
+"""
+Micro-benchmark of the kernels of the few shot classifiers (few_shot_model/numpy_utils.py) against the previous
+implementation (norm of the broadcasted differences, softmax with the global max, one hot of the neighboors).
+
+Random normalized features are classified for several sizes (number of queries, classes, shots, features),
+the mean time of each implementation and the maximum difference of the probabilities are reported.
+
+python3 benchmark_classifier.py --queries 1 16 --classes 5 20 --shots 5 20 --features 512 --repeat 200
+"""
+
+import argparse
+import json
+import itertools
+import time
+import numpy as np
+
+from few_shot_model.few_shot_model import ncm, knn
+
+
+def reference_ncm(shots_mean, features):
+    features = np.expand_dims(features, axis=-2)
+    distances = np.linalg.norm(shots_mean - features, axis=-1, ord=2)
+    logits = -20 * distances
+    exponential = np.exp(logits - np.max(logits))
+    return exponential / np.sum(exponential, axis=-1, keepdims=True)
+
+
+def reference_knn(shots_points, features, target, number_neighboors):
+    number_class = np.max(target) + 1
+    features = np.expand_dims(features, axis=-2)
+    distances = np.linalg.norm(shots_points - features, axis=-1, ord=2)
+    semi_sorted = np.argpartition(distances, number_neighboors, axis=-1)
+    indices = np.take(semi_sorted, np.arange(number_neighboors), axis=-1)
+    probas = np.identity(number_class, np.int64)[target[indices]]
+    return np.sum(probas, axis=-2) / number_neighboors
+
+
+def time_call(function, repeat):
+    function()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def normalized(rng, shape):
+    array = rng.standard_normal(shape).astype(np.float32)
+    return array / np.linalg.norm(array, axis=-1, keepdims=True)
+
+
+def benchmark_classifier(args):
+    rng = np.random.default_rng(0)
+    results = []
+    print(
+        f"{'classifier':>10} | {'queries':>7} | {'classes':>7} | {'shots':>5} | {'features':>8} | "
+        f"{'before (us)':>11} | {'after (us)':>10} | {'speedup':>7} | {'max diff':>8}"
+    )
+    for n_queries, n_classes, n_shots, n_features in itertools.product(args.queries, args.classes, args.shots, args.features):
+        features = normalized(rng, (n_queries, n_features))
+        shots_mean = normalized(rng, (n_classes, n_features))
+        shots_points = normalized(rng, (n_classes * n_shots, n_features))
+        target = np.repeat(np.arange(n_classes), n_shots)
+        number_neighboors = min(args.number_neighboors, n_classes * n_shots - 1)
+
+        cases = {
+            "ncm": (lambda: reference_ncm(shots_mean, features), lambda: ncm(shots_mean, features)),
+            "knn": (
+                lambda: reference_knn(shots_points, features, target, number_neighboors),
+                lambda: knn(shots_points, features, target, number_neighboors),
+            ),
+        }
+        for name, (before, after) in cases.items():
+            time_before = time_call(before, args.repeat)
+            time_after = time_call(after, args.repeat)
+            difference = float(np.max(np.abs(before() - after())))
+            results.append(
+                {
+                    "classifier": name,
+                    "queries": n_queries,
+                    "classes": n_classes,
+                    "shots": n_shots,
+                    "features": n_features,
+                    "before_us": 1e6 * time_before,
+                    "after_us": 1e6 * time_after,
+                    "max_difference": difference,
+                }
+            )
+            print(
+                f"{name:>10} | {n_queries:7d} | {n_classes:7d} | {n_shots:5d} | {n_features:8d} | "
+                f"{1e6 * time_before:11.1f} | {1e6 * time_after:10.1f} | {time_before / time_after:6.2f}x | {difference:8.1e}"
+            )
+
+    if args.output_json is not None:
+        with open(args.output_json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+        print("Benchmark saved in: ", args.output_json)
+    return results
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, nargs="+", default=[1, 16, 64], help="Numbers of features classified at once")
+    parser.add_argument("--classes", type=int, nargs="+", default=[5, 20], help="Numbers of classes")
+    parser.add_argument("--shots", type=int, nargs="+", default=[5, 20], help="Numbers of shots per class")
+    parser.add_argument("--features", type=int, nargs="+", default=[512], help="Sizes of the features")
+    parser.add_argument("--number-neighboors", type=int, default=5, help="Number of neighboors of the knn")
+    parser.add_argument("--repeat", type=int, default=200, help="Number of calls timed per case")
+    parser.add_argument("--output-json", type=str, default=None, help="Save the results in a json file")
+    args = parser.parse_args()
+
+    benchmark_classifier(args)
@@ -0,0 +1,50 @@
+"""
+Latency of the buttons : a script of presses is replayed on a simulated gpio in virtual time (same debouncing as the
+demo, input_output/button_listener.py), the report gives the delay between each press and its event, and the presses
+missed (shorter than the debouncing). The replay does not sleep and is deterministic : the same script and settings
+give the same report.
+
+Example :
+
+python3 button_latency_report.py --button-script script.json --debounce-ms 20 --button-period-ms 1
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from input_output.button_listener import load_button_script, replay_script
+
+
+def button_latency_report(args):
+    script = load_button_script(args.button_script)
+    results = replay_script(script, args.button_period_ms / 1000, args.debounce_ms / 1000, args.bounce_ms / 1000)
+
+    print(f"{'press s':>8} | {'state':>5} | {'latency ms':>10}")
+    for state, press_time, latency in results:
+        print(f"{press_time:8.3f} | {state:>5} | " + ("    missed" if latency is None else f"{1000 * latency:10.2f}"))
+    latencies = [latency for _, _, latency in results if latency is not None]
+    if latencies:
+        print(f"mean {1000 * np.mean(latencies):.2f} ms, max {1000 * np.max(latencies):.2f} ms, "
+              f"missed {len(results) - len(latencies)}/{len(results)}")
+
+    if args.output_json is not None:
+        report = [{"state": state, "press_time": press_time, "latency": latency} for state, press_time, latency in results]
+        with open(args.output_json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+        print("Report saved in: ", args.output_json)
+    return results
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--button-script", type=str, required=True, help="json list of [press time (s), button, duration (s)]")
+    parser.add_argument("--button-period-ms", type=float, default=1, help="Sampling period of the buttons")
+    parser.add_argument("--debounce-ms", type=float, default=20, help="Time a button state must be stable to be accepted")
+    parser.add_argument("--bounce-ms", type=float, default=5, help="Duration of the contact bounce at the press and at the release")
+    parser.add_argument("--output-json", type=str, default=None, help="Save the report in a json file")
+    args = parser.parse_args()
+
+    button_latency_report(args)
@@ -0,0 +1,101 @@
+"""
+Compact a ResNet9/ResNet12 for inference : fold every BatchNorm into the convolution before it
+and remove the training only branches (see backbone_loader/backbone_pytorch/compaction.py).
+
+The script checks that the compacted model gives the same features as the original one,
+compares the latency of each layer (ConvBN2d vs folded convolution), and can export the compacted model to onnx :
+
+python3 compact_model.py --input-resolution 32 --backbone resnet9 --input-model ../resnet9_strided_16fmaps.pt --use-strides --save-name resnet9_strided_16fmaps_folded
+
+The exported onnx has the same format as the one of model_to_onnx.py (same as model_to_onnx.py --fold-bn).
+"""
+
+import argparse
+from collections import Counter
+from pathlib import Path
+import numpy as np
+import onnx
+import onnxruntime as ort
+import torch
+
+from backbone_loader.backbone_pytorch.model import get_model
+from backbone_loader.backbone_pytorch.resnet9_12 import ConvBN2d
+from backbone_loader.backbone_pytorch.compaction import (
+    compact_model,
+    check_equivalence,
+    layer_latency,
+    FoldedConv2d,
+)
+from few_shot_model.evaluation import measure_latency
+from model_to_onnx import export_onnx
+
+
+def count_onnx_ops(path_model):
+    """
+    number of nodes of each type in the onnx graph
+    """
+    return Counter(node.op_type for node in onnx.load(path_model).graph.node)
+
+
+def compact(args):
+    model = get_model(args.backbone, args.input_model, args.use_strides)
+    compacted = compact_model(model)
+
+    # numerical equivalence
+    equivalence = check_equivalence(model, compacted, args.input_resolution)
+    print(f"Max absolute error : {equivalence['max_abs']:.3e}, max relative error : {equivalence['max_relative']:.3e}")
+    assert equivalence["max_relative"] < args.tolerance, "the compacted model is not equivalent to the original one"
+
+    # latency per layer
+    batch = torch.randn(1, 3, args.input_resolution, args.input_resolution)
+    latency_original = layer_latency(model, batch, ConvBN2d, n_runs=args.n_runs)
+    latency_compact = layer_latency(compacted, batch, FoldedConv2d, n_runs=args.n_runs)
+    print(f"{'layer':>14} | {'ConvBN (ms)':>11} | {'folded (ms)':>11}")
+    for name, latency in latency_original.items():
+        print(f"{name:>14} | {latency:11.4f} | {latency_compact[name]:11.4f}")
+    with torch.no_grad():
+        total_original = measure_latency(model, batch, n_runs=args.n_runs)["mean_ms"]
+        total_compact = measure_latency(compacted, batch, n_runs=args.n_runs)["mean_ms"]
+    print(f"{'total':>14} | {total_original:11.4f} | {total_compact:11.4f}")
+
+    if args.save_name is None:
+        return
+
+    # onnx export of both models
+    parent_path = Path.cwd() / "onnx"
+    parent_path.mkdir(parents=False, exist_ok=True)
+    path_original = parent_path / f"{args.save_name}_original.onnx"
+    path_compact = parent_path / f"{args.save_name}.onnx"
+    export_onnx(model, args.input_resolution, path_original, args.output_names)
+    export_onnx(compacted, args.input_resolution, path_compact, args.output_names)
+    print("Model saved in: ", path_compact)
+
+    ops_original = count_onnx_ops(path_original)
+    ops_compact = count_onnx_ops(path_compact)
+    print(f"{'onnx op':>18} | {'original':>8} | {'folded':>8}")
+    for op_type in sorted(set(ops_original) | set(ops_compact)):
+        print(f"{op_type:>18} | {ops_original[op_type]:8d} | {ops_compact[op_type]:8d}")
+
+    # equivalence of the exported graph with the original pytorch model
+    session = ort.InferenceSession(str(path_compact))
+    inputs = np.random.randn(1, 3, args.input_resolution, args.input_resolution).astype(np.float32)
+    onnx_features = session.run(None, {session.get_inputs()[0].name: inputs})[0]
+    with torch.no_grad():
+        reference = model(torch.from_numpy(inputs)).numpy()
+    print(f"Max absolute error of the onnx graph : {np.max(np.abs(onnx_features - reference)):.3e}")
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-resolution", type=int, required=True, choices=range(32,100), metavar="[32-100]", help="Input resolution(s) of the images (squared images), must be int between 32 and 100")
+    parser.add_argument("--backbone", type=str, required=True, choices = ["resnet9", "resnet12"], help="Specification of the model")
+    parser.add_argument("--input-model", type=str, required=True, help="path to input pytorch model")
+    parser.add_argument("--use-strides", action="store_true", help="Use strides instead of maxpooling")
+    parser.add_argument("--output-names", default="Output", help="Name of the output layer")
+    parser.add_argument("--save-name", type=str, default=None, help="Name of the saved onnx model (no export if not given)")
+    parser.add_argument("--n-runs", type=int, default=50, help="Number of forward to measure latency")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Maximum relative error between the original and compacted model")
+    args = parser.parse_args()
+
+    compact(args)
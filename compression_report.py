@@ -0,0 +1,146 @@
+"""
+Memory, query speed and accuracy of the compressed support banks (few_shot_model/compression.py).
+
+The features of an image folder (one sub folder per class) are extracted once. --n-queries images of each class are
+held out as queries, and a bank of --bank-size shots is sampled from the other images. For each storage, the bank is
+registered like in the demo (DataFewShot, one frame after the other, class after class) and the report gives :
+    - the accuracy of the knn of the queries against this bank, and its change against the float32 bank (same shots)
+    - the memory of the shots stored by the demo (float shots and support bank for float32, codes of the bank and mean
+      shot of each class for the compressed storages) and the memory saved against float32
+    - the latency of the knn of one query against this bank (distances computed on the codes)
+pq learns its centroids on more than 256 shots (PQ_CENTROIDS) : with a smaller bank, the shots stay in float32 and pq
+is flagged as not coded in the report.
+
+Example :
+
+python3 compression_report.py --framework pytorch --backbone resnet9 --path-pytorch-weight ../resnet9_strided_16fmaps.pt --dataset ../images
+"""
+
+import argparse
+import json
+import numpy as np
+
+from backbone_loader.backbone_loader import get_model
+from few_shot_model.evaluation import load_image_folder, extract_features, measure_latency
+from few_shot_model.few_shot_model import FewShotModel, knn_vote, feature_preprocess
+from few_shot_model.compression import BANK_STORAGES, PQ_CENTROIDS
+from few_shot_model.data_few_shot import DataFewShot
+from precision_report import get_backbone_specs
+
+
+def split_bank(labels, bank_size, n_queries, seed=0):
+    """
+    held out queries (n_queries per class) and the shots of the bank (bank_size, sampled from the other images)
+    returns :
+        list of the shots indices of each class, list of the queries indices of each class
+    """
+    rng = np.random.default_rng(seed)
+    queries, pool = [], []
+    for label in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == label))
+        queries.append(indices[:n_queries])
+        pool.append(indices[n_queries:])
+    pool = np.concatenate(pool)
+    if len(pool) == 0:
+        raise ValueError("no image left for the bank once the queries are held out")
+    # sampled with replacement only if the folder has fewer images than the bank
+    bank = rng.choice(pool, bank_size, replace=bank_size > len(pool))
+    shots = [np.sort(bank[labels[bank] == label]) for label in np.unique(labels)]
+    # a class without shot is not registered
+    return [indices for indices in shots if len(indices) > 0], [query for query, indices in zip(queries, shots) if len(indices) > 0]
+
+
+def bank_report(features, shots, queries, storage, args):
+    """
+    accuracy of the knn of the queries and latency of the knn of one query against a DataFewShot of the shots (each
+    shot registered as one frame), and memory of the stored shots
+    """
+    mean_features = features.mean(axis=0)
+    data = DataFewShot(0, bank_storage=storage, pq_subspaces=args.pq_subspaces, seed=args.seed)
+    data.set_mean_features(mean_features)
+    for classe, indices in enumerate(shots):
+        for index in indices:
+            data.add_repr(classe, features[index : index + 1])
+    support_bank = data.get_support_bank()
+
+    few_shot_model = FewShotModel({"model_name": "knn", "kwargs": {"number_neighboors": args.number_neiboors}})
+    correct, total = 0, 0
+    for target, indices in enumerate(queries):
+        prediction, _ = few_shot_model.predict_class_feature(
+            features[indices], data.get_shot_list(), mean_features, support_bank=support_bank
+        )
+        correct += np.sum(prediction == target)
+        total += len(indices)
+
+    query = feature_preprocess(features[queries[0][:1]], mean_features)
+
+    def query_bank():
+        return knn_vote(support_bank.distances(query), support_bank.targets, args.number_neiboors, len(support_bank.counts))
+
+    latency = measure_latency(query_bank, n_runs=args.n_runs)
+    return {
+        "accuracy": float(correct / total),
+        "coded": storage == "float32" or data.encoded,
+        "knn_ms": latency["mean_ms"],
+        "data_kb": data.nbytes / 1024,
+    }
+
+
+def compression_report(args):
+    resolution = (args.resolution_input, args.resolution_input)
+    images, labels, _ = load_image_folder(args.dataset, resolution, args.max_per_class)
+    labels = np.asarray(labels)
+    shots, queries = split_bank(labels, args.bank_size, args.n_queries, seed=args.seed)
+    backbone = get_model(get_backbone_specs(args, "fp32"))
+    features = extract_features(backbone, images)
+    if "pq" in args.storages and args.bank_size <= PQ_CENTROIDS:
+        print(f"pq : a bank of {args.bank_size} shots is not coded (more than {PQ_CENTROIDS} shots needed to learn the centroids)")
+
+    results = []
+    for storage in args.storages:
+        result = {"storage": storage}
+        result.update(bank_report(features, shots, queries, storage, args))
+        results.append(result)
+    reference = next((result for result in results if result["storage"] == "float32"), results[0])
+    for result in results:
+        result["accuracy_change"] = result["accuracy"] - reference["accuracy"]
+        result["memory_saved"] = 1 - result["data_kb"] / reference["data_kb"]
+
+    print(f"{'storage':>8} | {'acc knn':>8} | {'change':>7} | {'data kb':>8} | {'saved':>6} | {'knn ms':>7}")
+    for result in results:
+        print(
+            f"{result['storage']:>8} | {100 * result['accuracy']:7.2f}% | {100 * result['accuracy_change']:+6.2f}% | "
+            f"{result['data_kb']:8.1f} | {100 * result['memory_saved']:5.1f}% | {result['knn_ms']:7.3f}"
+            + ("" if result["coded"] else " (not coded, float32 shots)")
+        )
+
+    if args.output_json is not None:
+        with open(args.output_json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+        print("Report saved in: ", args.output_json)
+    return results
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--framework", type=str, required=True, choices=["pytorch", "onnx"], help="Framework of the backbone")
+    parser.add_argument("--backbone", type=str, default="resnet9", choices=["resnet9", "resnet12"], help="Specification of the model (pytorch)")
+    parser.add_argument("--path-pytorch-weight", type=str, default="../resnet9_strided_16fmaps.pt", help="Path of the pytorch weight")
+    parser.add_argument("--no-strides", action="store_true", help="Use maxpooling instead of strides (pytorch)")
+    parser.add_argument("--device-pytorch", type=str, default="cpu", help="Device on which the backbone will be run (pytorch)")
+    parser.add_argument("--path-onnx", type=str, default="../resnet9_strided_16fmaps.onnx", help="Path of the .onnx file")
+    parser.add_argument("--dataset", type=str, required=True, help="Image folder, one sub folder per class")
+    parser.add_argument("--max-per-class", type=int, default=None, help="Maximum number of images loaded per class")
+    parser.add_argument("--resolution-input", type=int, default=32, help="Resolution of the input image")
+    parser.add_argument("--storages", type=str, nargs="+", default=list(BANK_STORAGES), choices=BANK_STORAGES, help="Storages of the bank to compare")
+    parser.add_argument("--pq-subspaces", type=int, default=8, help="Number of subspaces of the product quantization")
+    parser.add_argument("--number-neiboors", type=int, default=5, help="Number of neiboors for knn classifier")
+    parser.add_argument("--n-queries", type=int, default=20, help="Number of images of each class held out as queries")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the queries and of the bank")
+    parser.add_argument("--bank-size", type=int, default=1000, help="Number of shots of the bank measured (accuracy, memory and knn latency)")
+    parser.add_argument("--n-runs", type=int, default=200, help="Number of knn calls to measure latency")
+    parser.add_argument("--output-json", type=str, default=None, help="Save the report in a json file")
+    args = parser.parse_args()
+
+    compression_report(args)
@@ -0,0 +1,225 @@
+"""
+Analytical cost model of the ResNet9 / ResNet12Brain backbones (see backbone_loader/backbone_pytorch/resnet9_12.py).
+
+For each layer : multiply-adds, activation and weight bytes, arithmetic intensity (MACs per byte moved).
+The layers are then mapped on a tensil architecture (.tarch) :
+    - compute cycles : the systolic array (array_size x array_size) processes one input vector per cycle for each weight tile
+    - memory cycles : bytes moved from/to the DRAM (weights are reloaded when the outputs do not fit in the accumulators,
+      inputs are reloaded when the weights do not fit in the local memory) / bytes per cycle of the DRAM bus
+    - a layer is memory bound if its memory cycles are larger than its compute cycles
+The cycles do not include the instruction and host overheads : the fps are an upper bound, to rank configurations
+(tensil_summary.py gives estimations closer to the board once a model is compiled).
+
+Example, cost of one configuration :
+python3 cost_model.py --backbone resnet9 --input-resolution 32 --feature-maps 16 --use-strides --arch-path arch/custom_perf.tarch
+
+Search the configurations reaching a target fps (before training anything) :
+python3 cost_model.py --backbone resnet9 --use-strides --search --resolutions 32 48 64 --feature-maps-list 8 16 32 --target-fps 20
+"""
+
+import argparse
+import itertools
+import json
+import math
+import re
+
+from tensil_summary import DRAM_BYTES_PER_CYCLE
+
+# number of channels of each block (multiples of feature_maps), see ResNet9 and ResNet12Brain
+BLOCK_WIDTHS = {"resnet9": (1, 2.5, 5), "resnet12": (1, 2.5, 5, 10)}
+
+
+def conv_layer(name, in_channels, out_channels, kernel_size, stride, padding, in_size):
+    """
+    cost of a convolution on a square input
+    """
+    out_size = (in_size + 2 * padding - kernel_size) // stride + 1
+    return {
+        "name": name,
+        "type": "conv",
+        "in_channels": in_channels,
+        "out_channels": out_channels,
+        "kernel_size": kernel_size,
+        "stride": stride,
+        "in_size": in_size,
+        "out_size": out_size,
+        "macs": out_size ** 2 * out_channels * in_channels * kernel_size ** 2,
+        "weights": out_channels * in_channels * kernel_size ** 2,
+        "inputs": in_size ** 2 * in_channels,
+        "outputs": out_size ** 2 * out_channels,
+    }
+
+
+def elementwise_layer(name, layer_type, channels, in_size, out_size, n_inputs=1):
+    """
+    cost of an operation without weights (residual add, max pooling, global mean)
+    """
+    return {
+        "name": name,
+        "type": layer_type,
+        "in_channels": channels,
+        "out_channels": channels,
+        "kernel_size": 0,
+        "stride": 1,
+        "in_size": in_size,
+        "out_size": out_size,
+        "macs": 0,
+        "weights": 0,
+        "inputs": n_inputs * in_size ** 2 * channels,
+        "outputs": out_size ** 2 * channels,
+    }
+
+
+def backbone_layers(backbone, input_resolution, feature_maps, use_strides):
+    """
+    list of the layers of the backbone with their cost (number of elements, not bytes)
+    """
+    if backbone not in BLOCK_WIDTHS:
+        raise NotImplementedError(f"model {backbone} is not implemented")
+    layers = []
+    size = input_resolution
+    in_channels = 3
+    stride = 2 if use_strides else 1
+    for index, width in enumerate(BLOCK_WIDTHS[backbone], start=1):
+        out_channels = int(width * feature_maps)
+        block = f"block{index}"
+        layers.append(conv_layer(f"{block}.conv1", in_channels, out_channels, 3, 1, 1, size))
+        layers.append(conv_layer(f"{block}.conv2", out_channels, out_channels, 3, 1, 1, size))
+        layers.append(conv_layer(f"{block}.conv3", out_channels, out_channels, 3, stride, 1, size))
+        layers.append(conv_layer(f"{block}.sc", in_channels, out_channels, 1, stride, 0, size))
+        out_size = layers[-1]["out_size"]
+        layers.append(elementwise_layer(f"{block}.add", "add", out_channels, out_size, out_size, n_inputs=2))
+        if not use_strides:
+            layers.append(elementwise_layer(f"{block}.mp", "maxpool", out_channels, out_size, out_size // 2))
+            out_size = out_size // 2
+        size = out_size
+        in_channels = out_channels
+    layers.append(elementwise_layer("mean", "mean", in_channels, size, 1))
+    return layers
+
+
+def load_tarch(path):
+    """
+    read a .tarch file, add the number of bytes per scalar of its data type (ex : FP16BP8 -> 2)
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        tarch = json.load(file)
+    tarch["bytes_per_scalar"] = int(re.match(r"FP(\d+)", tarch["data_type"]).group(1)) / 8
+    return tarch
+
+
+def map_on_tarch(layers, tarch, dram_bytes_per_cycle=DRAM_BYTES_PER_CYCLE):
+    """
+    add to each layer its bytes, arithmetic intensity and estimated cycles on the architecture
+    """
+    array_size = tarch["array_size"]
+    scalar_bytes = tarch["bytes_per_scalar"]
+    ridge = array_size ** 2 / dram_bytes_per_cycle  # MACs per byte above which a layer is compute bound
+    for layer in layers:
+        in_vectors = math.ceil(layer["in_channels"] / array_size)
+        out_vectors = math.ceil(layer["out_channels"] / array_size)
+        layer["weight_bytes"] = layer["weights"] * scalar_bytes
+        layer["activation_bytes"] = (layer["inputs"] + layer["outputs"]) * scalar_bytes
+        layer["intensity"] = layer["macs"] / (layer["weight_bytes"] + layer["activation_bytes"])
+
+        if layer["type"] == "conv":
+            # one weight tile = array_size vectors, one input vector per cycle and per tile
+            weight_vectors = in_vectors * out_vectors * layer["kernel_size"] ** 2 * array_size
+            compute_cycles = in_vectors * out_vectors * layer["kernel_size"] ** 2 * layer["out_size"] ** 2
+            # reloads when the weights do not fit in the local memory / the outputs in the accumulators
+            weight_partitions = math.ceil(weight_vectors / tarch["local_depth"])
+            output_partitions = math.ceil(layer["out_size"] ** 2 * out_vectors / tarch["accumulator_depth"])
+        else:
+            # simd operation, one vector per cycle
+            compute_cycles = max(layer["inputs"], layer["outputs"]) / layer["in_channels"] * in_vectors
+            weight_partitions = 1
+            output_partitions = 1
+        traffic = (
+            layer["weight_bytes"] * output_partitions
+            + layer["inputs"] * scalar_bytes * weight_partitions
+            + layer["outputs"] * scalar_bytes
+        )
+        layer["dram_bytes"] = traffic
+        layer["compute_cycles"] = compute_cycles
+        layer["memory_cycles"] = traffic / dram_bytes_per_cycle
+        layer["cycles"] = max(compute_cycles, layer["memory_cycles"])
+        layer["bound"] = "memory" if layer["memory_cycles"] > compute_cycles else "compute"
+        layer["utilization"] = layer["macs"] / (layer["cycles"] * array_size ** 2) if layer["cycles"] else 0
+        layer["ridge"] = ridge
+    return layers
+
+
+def total_cost(layers, clock_mhz):
+    """
+    cost of the whole backbone
+    """
+    cycles = sum(layer["cycles"] for layer in layers)
+    return {
+        "macs": sum(layer["macs"] for layer in layers),
+        "weight_bytes": sum(layer["weight_bytes"] for layer in layers),
+        "dram_bytes": sum(layer["dram_bytes"] for layer in layers),
+        "cycles": cycles,
+        "fps": clock_mhz * 1e6 / cycles,
+        "memory_bound_layers": sum(layer["bound"] == "memory" for layer in layers),
+    }
+
+
+def print_layers(layers):
+    print(f"{'layer':>13} | {'MACs (k)':>9} | {'weights (B)':>11} | {'act. (B)':>9} | {'MAC/B':>6} | {'cycles':>9} | {'util':>5} | bound")
+    for layer in layers:
+        print(
+            f"{layer['name']:>13} | {layer['macs'] / 1e3:9.1f} | {layer['weight_bytes']:11.0f} | {layer['activation_bytes']:9.0f} | "
+            f"{layer['intensity']:6.2f} | {layer['cycles']:9.0f} | {100 * layer['utilization']:4.0f}% | {layer['bound']}"
+        )
+
+
+def cost_model(args):
+    tarch = load_tarch(args.arch_path)
+    if not args.search:
+        layers = map_on_tarch(
+            backbone_layers(args.backbone, args.input_resolution, args.feature_maps, args.use_strides), tarch, args.dram_bytes_per_cycle
+        )
+        print_layers(layers)
+        total = total_cost(layers, args.clock_mhz)
+        print(f"Total : {total['macs'] / 1e6:.2f} MMACs, {total['weight_bytes'] / 1e3:.1f} kB of weights, "
+              f"{total['cycles']:.0f} cycles, {total['fps']:.1f} fps at {args.clock_mhz} MHz, "
+              f"{total['memory_bound_layers']}/{len(layers)} memory bound layers")
+        result = {"layers": layers, "total": total}
+    else:
+        result = []
+        for input_resolution, feature_maps in itertools.product(args.resolutions, args.feature_maps_list):
+            layers = map_on_tarch(backbone_layers(args.backbone, input_resolution, feature_maps, args.use_strides), tarch, args.dram_bytes_per_cycle)
+            total = total_cost(layers, args.clock_mhz)
+            result.append(dict(total, input_resolution=input_resolution, feature_maps=feature_maps))
+        # the largest networks reaching the target first
+        result.sort(key=lambda config: (config["fps"] < args.target_fps, -config["macs"]))
+        print(f"{'res':>4} | {'fmaps':>5} | {'MMACs':>7} | {'fps':>7} | target")
+        for config in result:
+            print(f"{config['input_resolution']:>4} | {config['feature_maps']:>5} | {config['macs'] / 1e6:7.2f} | "
+                  f"{config['fps']:7.1f} | {'ok' if config['fps'] >= args.target_fps else '-'}")
+
+    if args.output_json is not None:
+        with open(args.output_json, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=4)
+        print("Cost saved in: ", args.output_json)
+    return result
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backbone", type=str, default="resnet9", choices=list(BLOCK_WIDTHS), help="Specification of the model")
+    parser.add_argument("--input-resolution", type=int, default=32, help="Input resolution of the images (squared images)")
+    parser.add_argument("--feature-maps", type=int, default=16, help="Number of feature maps of the first block")
+    parser.add_argument("--use-strides", action="store_true", help="Use strides instead of maxpooling")
+    parser.add_argument("--arch-path", type=str, default="arch/custom_perf.tarch", help="path to tensil architecture file")
+    parser.add_argument("--clock-mhz", type=float, default=50, help="Clock of the TCU")
+    parser.add_argument("--dram-bytes-per-cycle", type=float, default=DRAM_BYTES_PER_CYCLE, help="Bytes transferred per cycle between the DRAM and the TCU")
+    parser.add_argument("--search", action="store_true", help="Evaluate all the combinations of --resolutions and --feature-maps-list")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[32, 48, 64], help="Resolutions of the search")
+    parser.add_argument("--feature-maps-list", type=int, nargs="+", default=[8, 16, 32], help="Feature maps of the search")
+    parser.add_argument("--target-fps", type=float, default=20, help="Target fps of the search")
+    parser.add_argument("--output-json", type=str, default=None, help="Save the cost in a json file")
+    args = parser.parse_args()
+
+    cost_model(args)
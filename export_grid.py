@@ -0,0 +1,145 @@
+"""
+Export a grid of backbone variants to onnx (backbones x input resolutions x strides), in parallel worker processes.
+
+Each variant is identified by a hash of its weights and export options. A variant already present in the
+manifest (with its onnx file) is skipped, so the grid can be re-run after adding a resolution or changing weights
+and only the new variants are exported.
+
+python3 export_grid.py --models resnet9=../resnet9_strided_16fmaps.pt resnet12=../resnet12_strided_16fmaps.pt --resolutions 32 48 64 --strides on off --workers 4
+
+The manifest (onnx/grid/manifest.json by default) lists the multiply-adds, number of parameters and path of each variant.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# increase to invalidate all the cached variants when the export pipeline changes
+EXPORT_VERSION = 1
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """
+    sha256 of the content of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_key(weights_hash, options):
+    """
+    identifier of a variant : hash of the weights and of the export options
+    """
+    content = json.dumps({"weights": weights_hash, "options": options, "version": EXPORT_VERSION}, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def export_worker(options, save_name, output_dir):
+    """
+    export one variant (ran in a worker process)
+    """
+    import torch
+    from model_to_onnx import export_variant
+
+    torch.set_num_threads(1)  # one thread per worker, the parallelism comes from the processes
+    return export_variant(
+        options["backbone"],
+        options["input_model"],
+        options["input_resolution"],
+        options["use_strides"],
+        save_name,
+        Path(output_dir),
+        options["output_names"],
+        fold_bn=options["fold_bn"],
+    )
+
+
+def build_grid(args):
+    """
+    list of (key, save_name, options) of all the variants of the grid
+    """
+    strides = {"on": True, "off": False}
+    grid = []
+    for model in args.models:
+        backbone, input_model = model.split("=", 1)
+        weights_hash = hash_file(input_model)
+        for input_resolution, stride in itertools.product(args.resolutions, args.strides):
+            options = {
+                "backbone": backbone,
+                "input_resolution": input_resolution,
+                "use_strides": strides[stride],
+                "fold_bn": args.fold_bn,
+                "output_names": args.output_names,
+            }
+            key = variant_key(weights_hash, options)
+            save_name = f"{backbone}_{input_resolution}_{'strided' if strides[stride] else 'maxpool'}_{key}"
+            grid.append((key, save_name, dict(options, input_model=input_model)))
+    return grid
+
+
+def export_grid(args):
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / "manifest.json"
+    manifest = {}
+    if manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+
+    grid = build_grid(args)
+    to_export = [
+        (key, save_name, options)
+        for key, save_name, options in grid
+        if key not in manifest or not Path(manifest[key]["path"]).exists()
+    ]
+    print(f"{len(grid)} variants, {len(grid) - len(to_export)} already exported, {len(to_export)} to export")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(export_worker, options, save_name, str(output_dir)): (key, save_name, options)
+            for key, save_name, options in to_export
+        }
+        for future in as_completed(futures):
+            key, save_name, options = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:
+                print(f"Export of {save_name} failed : {error}")
+                continue
+            manifest[key] = dict(options, **result)
+            # saved after each variant, an interrupted grid keeps the finished exports
+            with open(manifest_path, "w", encoding="utf-8") as file:
+                json.dump(manifest, file, indent=4)
+
+    print(f"{'backbone':>9} | {'res':>4} | {'strides':>7} | {'MMACs':>8} | {'params':>8} | path")
+    for key, _, _ in grid:
+        if key not in manifest:
+            continue
+        variant = manifest[key]
+        print(
+            f"{variant['backbone']:>9} | {variant['input_resolution']:>4} | {str(variant['use_strides']):>7} | "
+            f"{variant['macs'] / 1e6:8.2f} | {variant['params']:8d} | {variant['path']}"
+        )
+    print("Manifest saved in: ", manifest_path)
+    return manifest
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", type=str, nargs="+", required=True, help="backbone=path of the pytorch weights, ex : resnet9=../resnet9_strided_16fmaps.pt")
+    parser.add_argument("--resolutions", type=int, nargs="+", required=True, choices=range(32,100), metavar="[32-100]", help="Input resolutions of the images (squared images)")
+    parser.add_argument("--strides", type=str, nargs="+", default=["on"], choices=["on", "off"], help="Use strides (on) or maxpooling (off)")
+    parser.add_argument("--fold-bn", action="store_true", help="Export the inference only models (batchnorms folded into the convolutions)")
+    parser.add_argument("--output-names", default="Output", help="Name of the output layer")
+    parser.add_argument("--output-dir", type=str, default="onnx/grid", help="Directory of the exported variants and of the manifest")
+    parser.add_argument("--workers", type=int, default=2, help="Number of export processes")
+    args = parser.parse_args()
+
+    export_grid(args)
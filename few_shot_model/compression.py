@@ -0,0 +1,197 @@
+"""
+compressed storage of the support bank (normalized shots of the knn), the distances are computed on the codes
+    - float32 : no compression
+    - float16 : half precision rows
+    - int8 : the points are normalized on the unit sphere (coordinates in [-1,1]) : one fixed scale 1/127, nothing to
+      learn and no clipping of the points added later, |q - s*c|^2 = |q|^2 - 2 (q*s).c + |s*c|^2 with the norms of the
+      codes precomputed
+    - pq : product quantization, each subspace of the features is coded by the index of its nearest centroid,
+      the distances are sums of a lookup table (distances of the query to the centroids of each subspace)
+the parameters of the coding (centroids of pq) are learned once on the points given at the creation, the points added
+later are coded with them (append) and removing points keeps the codes of the others (take)
+"""
+import numpy as np
+
+from few_shot_model.numpy_utils import pairwise_distances
+
+BANK_STORAGES = ("float32", "float16", "int8", "pq")
+PQ_CENTROIDS = 256
+
+
+def kmeans(points: np.ndarray, number_clusters: int, iterations=10, rng=None):
+    """
+    returns :
+        centroids (np.ndarray(number_clusters,n_dim)), assignment of the points (np.ndarray(n_points))
+    """
+    rng = rng or np.random.default_rng(0)
+    number_clusters = min(number_clusters, len(points))
+    centroids = points[rng.choice(len(points), number_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmin(pairwise_distances(points, centroids, squared=True), axis=-1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, points)
+        counts = np.bincount(assignment, minlength=number_clusters)
+        # empty clusters keep their centroid
+        centroids[counts > 0] = sums[counts > 0] / counts[counts > 0, None]
+    assignment = np.argmin(pairwise_distances(points, centroids, squared=True), axis=-1)
+    return centroids, assignment
+
+
+class Float32Codes:
+    points_axis = 0  # axis of the points in the codes
+
+    def __init__(self, points: np.ndarray):
+        self.fit(points)
+        self.set_codes(self.encode(points))
+
+    def fit(self, points: np.ndarray):
+        """
+        learn the parameters of the coding (none for float32)
+        """
+
+    def encode(self, points: np.ndarray):
+        return np.ascontiguousarray(points, dtype=np.float32)
+
+    def set_codes(self, codes: np.ndarray):
+        self.codes = codes
+
+    def append(self, points: np.ndarray):
+        """
+        code the new points with the parameters already learned, after the coded points
+        """
+        self.set_codes(np.concatenate((self.codes, self.encode(points)), axis=self.points_axis))
+
+    def take(self, indices):
+        """
+        keep the coded points at the given indices, in this order (the codes are not computed again)
+        """
+        self.set_codes(np.take(self.codes, np.asarray(indices, dtype=np.int64), axis=self.points_axis))
+
+    def distances(self, features: np.ndarray):
+        """
+        squared distances array(...,n_points) of the features array(...,n_dim) to the coded points
+        """
+        return pairwise_distances(features, self.codes, squared=True)
+
+    def decode(self, indices=slice(None)):
+        return self.codes[indices]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+
+class Float16Codes(Float32Codes):
+    def encode(self, points: np.ndarray):
+        return np.ascontiguousarray(points, dtype=np.float16)
+
+    def set_codes(self, codes: np.ndarray):
+        self.codes = codes
+        # norms of the coded points, computed once
+        decoded = self.decode()
+        self.norms = np.einsum("nd,nd->n", decoded, decoded)
+
+    def distances(self, features: np.ndarray):
+        # no half precision matrix product in numpy, the codes are converted for the product (saves memory, not time)
+        dot = self.codes.astype(np.float32) @ features[..., None]
+        out = np.multiply(dot[..., 0], -2, dtype=np.float32)
+        out += self.norms
+        out += np.einsum("...d,...d->...", features, features)[..., None]
+        return np.maximum(out, 0, out=out)
+
+    def decode(self, indices=slice(None)):
+        return self.codes[indices].astype(np.float32)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.norms.nbytes
+
+
+class Int8Codes(Float16Codes):
+    scale = np.float32(1 / 127)
+
+    def encode(self, points: np.ndarray):
+        return np.clip(np.round(points / self.scale), -127, 127).astype(np.int8)
+
+    def distances(self, features: np.ndarray):
+        dot = self.codes @ (features * self.scale)[..., None]
+        out = np.multiply(dot[..., 0], -2, dtype=np.float32)
+        out += self.norms
+        out += np.einsum("...d,...d->...", features, features)[..., None]
+        return np.maximum(out, 0, out=out)
+
+    def decode(self, indices=slice(None)):
+        return self.codes[indices] * self.scale
+
+
+class ProductQuantizedCodes(Float32Codes):
+    points_axis = 1  # codes (n_subspaces,n_points) : one contiguous row of codes per lookup
+
+    def __init__(self, points: np.ndarray, number_subspaces=8, number_centroids=PQ_CENTROIDS, iterations=10, seed=0):
+        number_features = points.shape[-1]
+        if number_features % number_subspaces != 0:
+            raise ValueError(f"{number_features} features can not be split in {number_subspaces} subspaces")
+        if len(points) <= number_centroids:
+            # each point would be its own centroid : no compression and no error to measure
+            raise ValueError(f"product quantization needs more than {number_centroids} points to learn its centroids, got {len(points)}")
+        self.number_subspaces = number_subspaces
+        self.number_centroids = number_centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.subspace_size = number_features // number_subspaces
+        super().__init__(points)
+
+    def fit(self, points: np.ndarray):
+        rng = np.random.default_rng(self.seed)
+        subspaces = points.reshape(len(points), self.number_subspaces, self.subspace_size)
+        self.centroids = np.zeros((self.number_subspaces, self.number_centroids, self.subspace_size), dtype=np.float32)
+        for subspace in range(self.number_subspaces):
+            self.centroids[subspace], _ = kmeans(subspaces[:, subspace], self.number_centroids, self.iterations, rng)
+
+    def encode(self, points: np.ndarray):
+        subspaces = points.reshape(len(points), self.number_subspaces, self.subspace_size)
+        codes = np.zeros((self.number_subspaces, len(points)), dtype=np.uint8 if self.number_centroids <= 256 else np.uint16)
+        for subspace in range(self.number_subspaces):
+            if len(points) > 0:
+                codes[subspace] = np.argmin(pairwise_distances(subspaces[:, subspace], self.centroids[subspace], squared=True), axis=-1)
+        return codes
+
+    def distances(self, features: np.ndarray):
+        subspaces = features.reshape(features.shape[:-1] + (len(self.centroids), 1, self.subspace_size))
+        # lookup table (...,n_subspaces,n_centroids)
+        table = np.sum((subspaces - self.centroids) ** 2, axis=-1)
+        out = np.take(table[..., 0, :], self.codes[0], axis=-1)
+        for subspace in range(1, len(self.codes)):
+            out += np.take(table[..., subspace, :], self.codes[subspace], axis=-1)
+        return out
+
+    def decode(self, indices=slice(None)):
+        return np.concatenate([centroids[codes[indices]] for centroids, codes in zip(self.centroids, self.codes)], axis=-1)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.centroids.nbytes
+
+
+def fit_points(storage="float32"):
+    """
+    number of points needed to learn the coding of the storage (pq : more points than centroids)
+    """
+    if storage == "pq":
+        return PQ_CENTROIDS + 1
+    return 1
+
+
+def encode_bank(points: np.ndarray, storage="float32", pq_subspaces=8):
+    """
+    coded points with the given storage (see BANK_STORAGES), the coding is learned on these points
+    """
+    if storage == "float32":
+        return Float32Codes(points)
+    if storage == "float16":
+        return Float16Codes(points)
+    if storage == "int8":
+        return Int8Codes(points)
+    if storage == "pq":
+        return ProductQuantizedCodes(points, pq_subspaces)
+    raise NotImplementedError(f"bank storage {storage} is not implemented")
@@ -0,0 +1,49 @@
+"""
+selection of the shots kept for a class when its capacity is reached (consecutive frames of a registration are near
+duplicates, a diverse subset keeps the accuracy with a bounded support set)
+    - kcenter : k-center greedy in feature space, each kept shot is the farthest from the shots already kept
+    - reservoir : uniform sample of all the shots seen for the class (reservoir sampling)
+"""
+import numpy as np
+
+from few_shot_model.numpy_utils import pairwise_distances
+
+CORESET_SELECTIONS = ("kcenter", "reservoir")
+
+
+def k_center_greedy(points: np.ndarray, number: int):
+    """
+    indices (sorted) of number points covering the set, starting from the point nearest to the mean
+    args :
+        - points (np.ndarray(n_points,n_features))
+    """
+    number = min(number, len(points))
+    distances = pairwise_distances(points.mean(axis=0), points, squared=True)
+    selected = [int(np.argmin(distances))]
+    distances = pairwise_distances(points[selected[0]], points, squared=True)
+    for _ in range(number - 1):
+        distances[selected] = -1  # duplicates are never selected twice
+        selected.append(int(np.argmax(distances)))
+        np.minimum(distances, pairwise_distances(points[selected[-1]], points, squared=True), out=distances)
+    return np.sort(selected)
+
+
+def reservoir_update(kept: np.ndarray, new: np.ndarray, seen: int, capacity: int, rng):
+    """
+    reservoir sampling of the new shots
+    args :
+        - kept (np.ndarray(n_kept,n_features)) : current sample, n_kept <= capacity
+        - new (np.ndarray(n_new,n_features)) : new shots
+        - seen : number of shots seen before the new ones
+    returns :
+        kept (np.ndarray(min(capacity,seen+n_new),n_features)), number of shots seen
+    """
+    free = max(capacity - len(kept), 0)
+    kept = np.concatenate((kept, new[:free]), axis=0)
+    seen += min(free, len(new))
+    for shot in new[free:]:
+        seen += 1
+        index = rng.integers(seen)
+        if index < capacity:
+            kept[index] = shot
+    return kept, seen
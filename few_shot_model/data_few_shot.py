@@ -3,6 +3,124 @@ manage saved data for the few shot algorithm
 """
 import numpy as np
 
+from few_shot_model.few_shot_model import feature_preprocess
+from few_shot_model.compression import encode_bank, fit_points
+from few_shot_model.coreset import k_center_greedy, reservoir_update, CORESET_SELECTIONS
+
+
+class SupportBank:
+    """
+    shots of all the classes ready for the knn (computed once per change of the data)
+    attributes :
+        codes : normalized shots, coded with the storage of the bank (see compression.BANK_STORAGES)
+        targets (np.ndarray(n_shots)) : class of each shot
+        counts (np.ndarray(n_class)) : number of shots of each class
+        norms (np.ndarray(n_shots)) : distance of each shot to the mean features (the shots can be decoded)
+    the coding is learned on the shots given at the creation, the shots of the classes are then updated without coding
+    the other shots again (see update)
+    """
+
+    def __init__(self, shot_list, mean_features, storage="float32", pq_subspaces=8):
+        self.counts = np.array([len(shot) for shot in shot_list], dtype=np.int64)
+        if self.counts.sum() == 0:
+            raise ValueError("the support bank needs at least one shot")
+        self.targets = np.repeat(np.arange(len(shot_list)), self.counts)
+        self.mean_features = mean_features
+        points, self.norms = self.normalize(np.concatenate(shot_list, axis=0))
+        self.codes = encode_bank(points, storage, pq_subspaces)
+
+    def normalize(self, shots: np.ndarray):
+        """
+        normalized shots and their distance to the mean features
+        """
+        points = shots - self.mean_features
+        norms = np.linalg.norm(points, axis=-1).astype(np.float32)
+        return points / norms[:, None], norms
+
+    def class_rows(self, position: int):
+        """
+        rows of the shots of the class at the given position (in the order of the classes of the bank)
+        """
+        start = int(self.counts[:position].sum())
+        return slice(start, start + int(self.counts[position]))
+
+    def shots(self, position=None):
+        """
+        decoded shots of each class (before the normalization), or of the class at the given position
+        """
+        rows = slice(None) if position is None else self.class_rows(position)
+        shots = (self.mean_features + self.norms[rows, None] * self.codes.decode(rows)).astype(np.float32)
+        if position is not None:
+            return shots
+        return np.split(shots, np.cumsum(self.counts)[:-1])
+
+    def class_points(self, position: int):
+        """
+        normalized shots (decoded) of the class at the given position
+        """
+        return self.codes.decode(self.class_rows(position))
+
+    def update(self, position: int, kept, new_shots: np.ndarray):
+        """
+        shots of the class at the given position : the shots at the indices kept (in the shots of the class followed
+        by the new shots), in this order. Only the new shots kept are coded, with the coding already learned
+        """
+        rows = self.class_rows(position)
+        total = len(self.norms)
+        kept = np.asarray(kept, dtype=np.int64)
+        new = kept >= rows.stop - rows.start
+        points, norms = self.normalize(new_shots[kept[new] - (rows.stop - rows.start)])
+        self.codes.append(points)
+        kept_rows = rows.start + kept
+        kept_rows[new] = total + np.arange(np.sum(new))
+        order = np.concatenate((np.arange(rows.start), kept_rows, np.arange(rows.stop, total)))
+        self.codes.take(order)
+        self.norms = np.concatenate((self.norms, norms))[order]
+        self.counts[position] = len(kept)
+        self.targets = np.repeat(np.arange(len(self.counts)), self.counts)
+
+    def insert_class(self, position: int):
+        """
+        new class without shots at the given position
+        """
+        self.counts = np.insert(self.counts, position, 0)
+        self.targets = np.repeat(np.arange(len(self.counts)), self.counts)
+
+    def remove_class(self, position: int):
+        """
+        remove the class at the given position and its shots
+        """
+        self.update(position, [], self.mean_features[None][:0])
+        self.counts = np.delete(self.counts, position)
+        self.targets = np.repeat(np.arange(len(self.counts)), self.counts)
+
+    def set_mean_features(self, mean_features: np.ndarray):
+        """
+        normalize the decoded shots with the new mean features, they are coded again with the coding already learned
+        (one more approximation of the shots at each change of the mean, the coding is not learned again)
+        """
+        shots = self.mean_features + self.norms[:, None] * self.codes.decode()
+        self.mean_features = mean_features
+        points, self.norms = self.normalize(shots)
+        self.codes.set_codes(self.codes.encode(points))
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.targets.nbytes + self.norms.nbytes
+
+    @property
+    def points(self):
+        """
+        normalized shots (decoded)
+        """
+        return self.codes.decode()
+
+    def distances(self, features: np.ndarray):
+        """
+        squared distances of the features (normalized) to the shots, computed on the codes
+        """
+        return self.codes.distances(features)
+
 
 class DataFewShot:
     """represent the data saved for few shot learning
@@ -13,37 +131,194 @@ class DataFewShot:
             mean of the feature / list of feature to aggregate
         registered_classes : registered class
         shot_list : list of the regitered data
+        version : incremented at each change of the data (invalidates the support bank)
+        projection (FeatureProjection) : applied to the features before storage (and to the queries, see project),
+            fitted on the initialization features if not already fitted
+        bank_storage : storage of the support bank (float32, float16, int8, pq). With a compressed storage, once the
+            mean features are known and there are enough shots to learn the coding (see compression.fit_points), the
+            float shots are encoded and the bank is the only copy of the shots : the slots of shot_list are empty,
+            get_shot_list gives the mean shot of each class (ncm), the knn uses the support bank and the new shots
+            are encoded with the coding learned on the float shots (the bank is never encoded again)
+        class_capacity : maximum number of shots of a class, a subset is selected with coreset (kcenter, reservoir)
+        max_total_shots : maximum number of shots of all the classes, the least recently used classes
+            (registered or predicted) are evicted
     """
 
-    def __init__(self, num_class: int):
+    def __init__(
+        self,
+        num_class: int,
+        projection=None,
+        bank_storage="float32",
+        pq_subspaces=8,
+        class_capacity=None,
+        coreset="kcenter",
+        max_total_shots=None,
+        seed=0,
+    ):
+        if coreset not in CORESET_SELECTIONS:
+            raise NotImplementedError(f"coreset selection {coreset} is not implemented")
+        if class_capacity is not None and class_capacity < 1:
+            raise ValueError("the capacity of a class must be at least one shot")
+        if max_total_shots is not None and class_capacity is not None and max_total_shots < class_capacity:
+            raise ValueError("the budget of shots must be at least the capacity of a class")
         self.shot_list = []
         self.num_class = num_class
         self.mean_features = []
         self.registered_classes = []
         self.is_recorded = False
+        self.version = 0
+        self.bank = None
+        self.bank_version = None
+        self.projection = projection
+        self.bank_storage = bank_storage
+        self.pq_subspaces = pq_subspaces
+        self.fit_projection = projection is not None and not projection.fitted
+        self.class_capacity = class_capacity
+        self.coreset = coreset
+        self.max_total_shots = max_total_shots
+        self.rng = np.random.default_rng(seed)
+        self.seen = {}  # number of shots seen for each class (reservoir)
+        self.clock = 0
+        self.last_used = {}  # clock of the last registration or prediction of each class
+        self.compressed = bank_storage != "float32"
+        self.encoded = False  # the shots are stored in the compressed bank
+        self.bank_classes = []  # classes of the bank (ascending order)
+        self.class_means = []  # mean shot of the classes of the bank (compressed storage)
 
     def add_repr(self, classe: int, repr: np.ndarray):
         """
         add the given repr to the given classe
         """
+        repr = self.project(repr)
+        if len(repr) == 0:
+            return  # a registered class always has shots
         self.is_recorded = True
+        self.version += 1
         if classe not in self.registered_classes:
-            try :
-                self.registered_classes.append(classe)
-                self.shot_list.append(repr)
-            except:
-                print("",end="")
+            # slot of the class (classes registered out of order, or evicted then registered again)
+            while len(self.shot_list) <= classe:
+                self.shot_list.append(repr[:0])
+            self.shot_list[classe] = repr[:0]
+            self.seen[classe] = 0
+            self.registered_classes.append(classe)
+            if self.encoded:
+                self.bank_classes = sorted(self.bank_classes + [classe])
+                self.bank.insert_class(self.bank_classes.index(classe))
+                self.class_means.insert(self.bank_classes.index(classe), None)
+        if self.encoded:
+            self.add_encoded(classe, repr)
         else:
-            try:
-                self.shot_list[classe] = np.concatenate((self.shot_list[classe], repr), axis=0)
-            except:
-                print("",end="")
+            shots = np.concatenate((self.shot_list[classe], repr), axis=0)
+            points = shots
+            if isinstance(self.mean_features, np.ndarray):
+                # selection on the normalized features (space of the knn) once the mean is aggregated
+                points = feature_preprocess(shots, self.mean_features)
+            self.shot_list[classe] = shots[self.bounded_shots(classe, points[:-len(repr)], points[-len(repr):])]
+        self.record_prediction(classe)
+        if self.max_total_shots is not None:
+            self.evict(keep=classe)
+        self.compress()
+
+    def add_encoded(self, classe: int, repr: np.ndarray):
+        """
+        add the repr to the compressed bank : only the new shots kept are encoded, the shots of the class which are
+        not kept are removed from the codes
+        """
+        position = self.bank_classes.index(classe)
+        kept = self.bounded_shots(classe, self.bank.class_points(position), feature_preprocess(repr, self.mean_features))
+        self.bank.update(position, kept, repr)
+        self.class_means[position] = self.bank.shots(position).mean(axis=0, keepdims=True)
+
+    def compress(self):
+        """
+        encode the float shots in the bank and empty the slots of shot_list (compressed storage, once the mean features
+        are known and there are enough shots to learn the coding), the coding is learned once on these float shots
+        """
+        if not self.compressed or self.encoded or not isinstance(self.mean_features, np.ndarray):
+            return
+        shot_list = self.registered_shots()
+        if sum(len(shots) for shots in shot_list) < fit_points(self.bank_storage):
+            return  # float shots (and float32 bank) until then
+        self.bank = SupportBank(shot_list, self.mean_features, self.bank_storage, self.pq_subspaces)
+        self.bank_version = self.version
+        self.encoded = True
+        self.bank_classes = sorted(self.registered_classes)
+        self.class_means = [shots.mean(axis=0, keepdims=True) for shots in shot_list]
+        self.shot_list = [shots[:0] for shots in self.shot_list]
+
+    def number_shots(self, classe: int):
+        """
+        number of shots stored for the classe
+        """
+        if self.encoded:
+            return int(self.bank.counts[self.bank_classes.index(classe)]) if classe in self.bank_classes else 0
+        return len(self.shot_list[classe]) if classe < len(self.shot_list) else 0
+
+    @property
+    def nbytes(self):
+        """
+        memory of the stored shots (float shots, bank and mean shots)
+        """
+        nbytes = sum(shots.nbytes for shots in self.shot_list) + sum(mean.nbytes for mean in self.class_means)
+        if self.encoded:
+            nbytes += self.bank.nbytes
+        return nbytes
+
+    def bounded_shots(self, classe: int, shots: np.ndarray, repr: np.ndarray):
+        """
+        indices (in the shots of the classe followed by the new repr) of the shots kept, a subset of class_capacity
+        shots if the capacity is reached
+        """
+        number = len(shots) + len(repr)
+        capacity = self.class_capacity
+        if self.coreset == "reservoir" and capacity is not None:
+            kept, self.seen[classe] = reservoir_update(np.arange(len(shots)), np.arange(len(shots), number), self.seen[classe], capacity, self.rng)
+            return kept
+        if capacity is None or number <= capacity:
+            return np.arange(number)
+        return k_center_greedy(np.concatenate((shots, repr), axis=0), capacity)
+
+    def record_prediction(self, classe: int):
+        """
+        mark the classe as used (least recently used classes are evicted first)
+        """
+        self.clock += 1
+        self.last_used[classe] = self.clock
+
+    def evict(self, keep=None):
+        """
+        evict the least recently used classes (but keep) until the number of shots is within max_total_shots
+        """
+        while sum(self.number_shots(classe) for classe in self.registered_classes) > self.max_total_shots:
+            candidates = [classe for classe in self.registered_classes if classe != keep]
+            if not candidates:
+                return
+            evicted = min(candidates, key=lambda classe: self.last_used.get(classe, 0))
+            self.registered_classes.remove(evicted)
+            self.shot_list[evicted] = self.shot_list[evicted][:0]
+            if self.encoded:
+                position = self.bank_classes.index(evicted)
+                self.bank.remove_class(position)
+                self.bank_classes.pop(position)
+                self.class_means.pop(position)
+            print(f"\r--- Class {evicted} evicted (budget of {self.max_total_shots} shots) ---")
 
     def get_shot_list(self):
         """
-        getter for shot_list
+        getter for shot_list (shots of the registered classes, in ascending order of class)
+        with a compressed storage, the mean shot of each class
         """
-        return self.shot_list
+        if self.encoded:
+            return self.class_means
+        return self.registered_shots()
+
+    def registered_shots(self):
+        """
+        float shots of the registered classes, in ascending order of class
+        """
+        if sorted(self.registered_classes) == list(range(len(self.shot_list))):
+            return self.shot_list
+        return [self.shot_list[classe] for classe in sorted(self.registered_classes)]
 
     def get_mean_features(self):
         """
@@ -51,6 +326,27 @@ class DataFewShot:
         """
         return self.mean_features
 
+    def project(self, features: np.ndarray):
+        """
+        features in the space of the stored data (projected if there is a projection)
+        """
+        if self.projection is None:
+            return features
+        return self.projection(features)
+
+    def get_support_bank(self):
+        """
+        support bank of the shots, rebuilt only if the data changed since the last call
+        (requires the aggregated mean features)
+        """
+        if self.encoded:
+            return self.bank  # updated at each change
+        if self.bank_version != self.version:
+            # float32 until the shots of a compressed storage are encoded
+            self.bank = SupportBank(self.get_shot_list(), self.mean_features)
+            self.bank_version = self.version
+        return self.bank
+
     def is_data_recorded(self):
         """
         is there any data recorded
@@ -64,7 +360,22 @@ class DataFewShot:
 
         """
         self.mean_features = np.concatenate(self.mean_features, axis=0)
-        self.mean_features = self.mean_features.mean(axis=0)
+        if self.fit_projection:
+            self.projection.fit(self.mean_features)
+        self.mean_features = self.project(self.mean_features).mean(axis=0)
+        self.version += 1
+        self.compress()
+
+    def set_mean_features(self, mean_features: np.ndarray):
+        """
+        replace the aggregated mean features
+        """
+        self.mean_features = mean_features
+        self.version += 1
+        if self.encoded:
+            self.bank.set_mean_features(mean_features)
+            self.class_means = [shots.mean(axis=0, keepdims=True) for shots in self.bank.shots()]
+        self.compress()
 
     def add_mean_repr(self, features: np.ndarray):
         """
@@ -80,3 +391,12 @@ class DataFewShot:
         self.registered_classes = []
         self.is_recorded = False
         self.mean_features = []
+        self.seen = {}
+        self.last_used = {}
+        self.bank = None
+        self.encoded = False
+        self.bank_classes = []
+        self.class_means = []
+        self.version += 1
+        if self.fit_projection:
+            self.projection.matrix = None
@@ -0,0 +1,157 @@
+"""
+offline evaluation of a backbone : few shot accuracy on an image folder and latency
+(used by the benchmarking scripts)
+"""
+import os
+import time
+import cv2
+import numpy as np
+
+from backbone_loader.preprocessing import preprocess
+from few_shot_model.few_shot_model import FewShotModel
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def load_image_folder(path, resolution, max_per_class=None):
+    """
+    load an image folder (one sub folder per class), images are resized to the backbone resolution
+    args :
+        - path : root of the image folder
+        - resolution (tuple(int,int)) : width/height of the backbone input
+        - max_per_class (int) : maximum number of images per class (all if None)
+    returns :
+        - images (np.ndarray(n_images,h,w,3)) : uint8 images (BGR, as read by the demo)
+        - labels (np.ndarray(n_images)) : class index of each image
+        - class_names (list(str)) : name of the sub folder of each class
+    """
+    class_names = sorted(
+        name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name))
+    )
+    images = []
+    labels = []
+    for label, class_name in enumerate(class_names):
+        class_path = os.path.join(path, class_name)
+        file_names = sorted(
+            name for name in os.listdir(class_path) if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        for file_name in file_names[:max_per_class]:
+            img = cv2.imread(os.path.join(class_path, file_name))
+            if img is None:
+                print(f"could not read {file_name}, skipped")
+                continue
+            images.append(cv2.resize(img, dsize=resolution, interpolation=cv2.INTER_LINEAR))
+            labels.append(label)
+    if len(images) == 0:
+        raise ValueError(f"no image found in {path}")
+    return np.stack(images, axis=0), np.array(labels, dtype=np.int64), class_names
+
+
+def extract_features(backbone, images, batch_size=1):
+    """
+    run the backbone on all the images
+    args :
+        - backbone : callable taking a preprocessed batch (channel last)
+        - images (np.ndarray(n_images,h,w,3)) : uint8 images
+        - batch_size (int) : number of images per backbone call
+    returns :
+        features (np.ndarray(n_images,n_features))
+    """
+    features = []
+    for start in range(0, len(images), batch_size):
+        batch = np.concatenate(
+            [preprocess(img) for img in images[start : start + batch_size]], axis=0
+        )
+        features.append(backbone(batch))
+    return np.concatenate(features, axis=0)
+
+
+def sample_episodes(labels, n_ways, n_shots, n_queries, n_episodes, seed=0):
+    """
+    sample few shot episodes (same seed = same episodes, to compare several backbones)
+    returns :
+        list of (shots, queries), each one being a list (one element per way) of indices array
+    """
+    classes, counts = np.unique(labels, return_counts=True)
+    classes = classes[counts >= n_shots + n_queries]
+    if len(classes) < n_ways:
+        raise ValueError(
+            f"only {len(classes)} classes have at least {n_shots + n_queries} images, {n_ways} are needed"
+        )
+    rng = np.random.default_rng(seed)
+    episodes = []
+    for _ in range(n_episodes):
+        shots = []
+        queries = []
+        for classe in rng.choice(classes, size=n_ways, replace=False):
+            indices = rng.permutation(np.flatnonzero(labels == classe))
+            shots.append(indices[:n_shots])
+            queries.append(indices[n_shots : n_shots + n_queries])
+        episodes.append((shots, queries))
+    return episodes
+
+
+def few_shot_accuracy(features, episodes, classifier_specs, mean_feature=None):
+    """
+    mean accuracy of the few shot classifier over the episodes
+    args :
+        - features (np.ndarray(n_images,n_features)) : features of the dataset
+        - episodes : output of sample_episodes
+        - classifier_specs (dict) : specs of the FewShotModel
+        - mean_feature (np.ndarray(n_features)) : mean used for the normalisation
+          (mean of the dataset if None, the demo uses the background)
+    """
+    few_shot_model = FewShotModel(classifier_specs)
+    if mean_feature is None:
+        mean_feature = features.mean(axis=0)
+    correct = 0
+    total = 0
+    for shots, queries in episodes:
+        shots_list = [features[indices] for indices in shots]
+        for target, indices in enumerate(queries):
+            prediction, _ = few_shot_model.predict_class_feature(
+                features[indices], shots_list, mean_feature
+            )
+            correct += np.sum(prediction == target)
+            total += len(indices)
+    return correct / total
+
+
+def feature_drift(features, reference):
+    """
+    distance between features and the reference features (same images)
+    returns :
+        dict : mean relative l2 error, mean cosine similarity, max absolute error
+    """
+    features = features.astype(np.float32)
+    reference = reference.astype(np.float32)
+    norm_reference = np.linalg.norm(reference, axis=-1)
+    norm_features = np.linalg.norm(features, axis=-1)
+    relative_error = np.linalg.norm(features - reference, axis=-1) / norm_reference
+    cosine = np.sum(features * reference, axis=-1) / (norm_features * norm_reference)
+    return {
+        "relative_l2": float(np.mean(relative_error)),
+        "cosine": float(np.mean(cosine)),
+        "max_abs": float(np.max(np.abs(features - reference))),
+    }
+
+
+def measure_latency(function, *inputs, n_warmup=5, n_runs=50):
+    """
+    latency (ms) of function(*inputs)
+    returns :
+        dict : mean, median and 90th percentile latency in ms
+    """
+    for _ in range(n_warmup):
+        function(*inputs)
+    durations = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        function(*inputs)
+        durations.append(time.perf_counter() - start)
+    durations = 1000 * np.array(durations)
+    return {
+        "mean_ms": float(np.mean(durations)),
+        "median_ms": float(np.median(durations)),
+        "p90_ms": float(np.percentile(durations, 90)),
+    }
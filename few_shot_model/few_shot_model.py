@@ -5,7 +5,7 @@ handle loading, inference and prediction
 import numpy as np
 from typing import Union, Sequence
 
-from few_shot_model.numpy_utils import softmax, one_hot, k_small
+from few_shot_model.numpy_utils import distance_softmax, pairwise_distances, top_k, vote_counts
 
 
 def feature_preprocess(features: np.ndarray, mean_base_features: np.ndarray):
@@ -29,10 +29,7 @@ def ncm(shots_mean: np.ndarray, features: np.ndarray):
         - shots_mean array(...,n_class,n_dim) : mean of the saved shots for each classe
         - features array(...,n_dim) : features to classify (leading dims same as previous array)
     """
-    features = np.expand_dims(features, axis=-2)  # broadcastable along class axis
-    distances = np.linalg.norm(shots_mean - features, axis=-1, ord=2)
-    probas = softmax(-20 * distances, dim=-1)
-    return probas
+    return distance_softmax(features, shots_mean, temperature=20)
 
 
 def knn(
@@ -47,19 +44,30 @@ def knn(
         - shots_mean array(...,n_points,n_dim) : mean of the saved shots for each classe
         - features array(...,n_dim) : features to classify (leading dims same as previous array)
         - target : array(n_points) : represent feature assignement. Expected to have value in [0, ...,n_class-1]
-        - number_neighboors (int) : number of neighboors to take
+        - number_neighboors (int) : number of neighboors to take (all the points if there are less points)
     """
-    number_class = np.max(target) + 1
+    # squared distances : same neighboors, no sqrt
+    distances = pairwise_distances(features, shots_points, squared=True)
+    return knn_vote(distances, target, number_neighboors)
 
-    features = np.expand_dims(features, axis=-2)  # broadcastable along point axis
-    distances = np.linalg.norm(shots_points - features, axis=-1, ord=2)
 
-    indices = k_small(distances, number_neighboors, axis=-1)
+def knn_vote(distances: np.ndarray, target: np.ndarray, number_neighboors: int, number_class=None):
+    """
+    class attribution probas of the knn from the distances to the shots
+    args :
+        - distances array(...,n_points) : distances (or squared distances) of the features to the shots
+        - target, number_neighboors : see knn
+        - number_class : number of classes (classes without shots get no vote), max of target + 1 if None
+    """
+    if distances.shape[-1] == 0:
+        raise ValueError("the knn needs at least one shot")
+    if number_class is None:
+        number_class = np.max(target) + 1
 
-    probas = one_hot(target[indices], number_class)
+    indices = top_k(distances, number_neighboors, axis=-1)
 
-    # mean along neighboors
-    probas = np.sum(probas, axis=-2) / number_neighboors
+    # mean of the votes of the neighboors
+    probas = vote_counts(target[indices], number_class) / indices.shape[-1]
 
     return probas
 
@@ -164,6 +172,7 @@ class FewShotModel:
         shots_list: Sequence[np.ndarray],
         mean_feature: np.ndarray,
         preprocess_feature=True,
+        support_bank=None,
     ):
         """
         predict the class of a features
@@ -175,6 +184,8 @@ class FewShotModel:
                 - sequence(array(n_shots_i,n_features)) (each element of sequence = 1 class)
             mean_feature :
                 - array(n_features)
+            support_bank :
+                - SupportBank of the shots (knn), avoids normalizing the shots at each call
             model_name : wich model do we use
             **kwargs : additional parameters of the model
         returns :
@@ -205,30 +216,23 @@ class FewShotModel:
 
         elif model_name == "knn":
             number_neighboors = model_arguments["number_neighboors"]
-            number_samples_class_1 = shots_list[0].shape[0]
-            for shot in shots_list:
-                assert (
-                    shot.shape[0] == number_samples_class_1
-                ), "knn requires an even number of samples per class"
-
-            # sequence -> array
-            shots = np.concatenate(shots_list, axis=0)
-            # shots : (n_exemples, nfeatures)
-
-            if preprocess_feature:
-                shots = feature_preprocess(shots, mean_feature)
+            if support_bank is not None:
+                # already normalized, distances computed on the (compressed) codes of the bank
+                distances = support_bank.distances(features)
+                probas = knn_vote(distances, support_bank.targets, number_neighboors, len(support_bank.counts))
+            else:
+                # sequence -> array
+                shots = np.concatenate(shots_list, axis=0)
+                # shots : (n_exemples, nfeatures)
 
-            number_ways = len(shots_list)  # ok for sequence and array
+                if preprocess_feature:
+                    shots = feature_preprocess(shots, mean_feature)
 
-            targets = np.concatenate(
-                [
-                    class_id * np.ones(shots_list[class_id].shape[0], dtype=np.int64)
-                    for class_id in range(number_ways)
-                ],
-                axis=0,
-            )
+                targets = np.repeat(
+                    np.arange(len(shots_list)), [shot.shape[0] for shot in shots_list]
+                )
 
-            probas = knn(shots, features, targets, number_neighboors)
+                probas = knn(shots, features, targets, number_neighboors)
 
         else:
             raise NotImplementedError(f"classifier : {model_name} is not implemented")
@@ -242,6 +246,7 @@ class FewShotModel:
         prev_probabilities: Union[None, np.ndarray],
         shots_list: Sequence[np.ndarray],
         mean_feature: np.ndarray,
+        support_bank=None,
     ):
         """
 
@@ -250,25 +255,29 @@ class FewShotModel:
             features(np.ndarray((1,n_features))) : features of the current img
             prev_probabilities(?) : probability of each class for previous prediction
             recorded_data (DataFewShot) : data recorded for classification
+            support_bank (SupportBank) : see predict_class_feature
 
         returns :
             classe_prediction : class prediction
             probas : probability of belonging to each class
         """
-        model_name = self.classifier_specs["model_name"]
-
         _, current_proba = self.predict_class_feature(
-            features, shots_list, mean_feature
+            features, shots_list, mean_feature, support_bank=support_bank
         )
 
-
-        if prev_probabilities is None:
-            probabilities = current_proba
-        else:
-            if model_name == "ncm":
-                probabilities = prev_probabilities * 0.85 + current_proba * 0.15
-            elif model_name == "knn":
-                probabilities = prev_probabilities * 0.95 + current_proba * 0.05
-
+        probabilities = self.moving_average(prev_probabilities, current_proba)
         classe_prediction = probabilities.argmax()
         return classe_prediction, probabilities
+
+    def moving_average(self, prev_probabilities: Union[None, np.ndarray], current_proba: np.ndarray):
+        """
+        smooth the probabilities of the current image with the previous ones
+        """
+        model_name = self.classifier_specs["model_name"]
+
+        if prev_probabilities is None:
+            return current_proba
+        if model_name == "ncm":
+            return prev_probabilities * 0.85 + current_proba * 0.15
+        elif model_name == "knn":
+            return prev_probabilities * 0.95 + current_proba * 0.05
@@ -1,21 +1,25 @@
 """
 Redefine some equivalent of classical torch function not implemented in numpy
+and the kernels of the few shot classifiers (distances, softmax, top k, votes), batched along the leading dims
 """
 
 import numpy as np
 
 
-def softmax(x: np.ndarray, dim=0):
+def softmax(x: np.ndarray, dim=0, out=None):
     """
     ref : https://stackoverflow.com/questions/34968722/how-to-implement-the-softmax-function-in-python
 
     args :
         - x (np.array(np.ndarray [...]) : array with at least dim+1 dimensions
         - dim : dim allong wich to perform softmax
+        - out : output buffer (same shape as x, can be x)
     """
-    # stability trick( cond of exp(x)=x )
-    e_x = np.exp(x - np.max(x))
-    return e_x / np.sum(e_x, axis=dim, keepdims=True)
+    # stability trick( cond of exp(x)=x ), max along dim so that each softmax is stable
+    out = np.subtract(x, np.max(x, axis=dim, keepdims=True), out=out)
+    np.exp(out, out=out)
+    out /= np.sum(out, axis=dim, keepdims=True)
+    return out
 
 
 def one_hot(array: np.ndarray, num_classes: int, dtype=np.int64):
@@ -29,6 +33,31 @@ def one_hot(array: np.ndarray, num_classes: int, dtype=np.int64):
     return np.identity(num_classes, dtype)[array]
 
 
+def top_k(x: np.ndarray, number: int, axis=-1, largest=False):
+    """
+    indices of the number smallest (or largest) values along the axis (not sorted)
+    args:
+        - x : array
+        - number : number of indices to outputs (all the indices if number >= size of the axis)
+        - axis : on wich axis should we look for the values
+        - largest : largest values instead of the smallest
+    """
+    size = x.shape[axis]
+    if number >= size:
+        shape = [1] * x.ndim
+        shape[axis] = size
+        return np.broadcast_to(np.arange(size).reshape(shape), x.shape)
+    if largest:
+        semi_sorted = np.argpartition(x, size - number, axis=axis)
+        start = size - number
+    else:
+        semi_sorted = np.argpartition(x, number - 1, axis=axis)
+        start = 0
+    index = [slice(None)] * x.ndim
+    index[axis] = slice(start, start + number)
+    return semi_sorted[tuple(index)]
+
+
 def k_small(distance: np.ndarray, number: int, axis=-1):
     """
     ref : https://stackoverflow.com/questions/34226400/find-the-index-of-the-k-smallest-values-of-a-numpy-array
@@ -38,5 +67,55 @@ def k_small(distance: np.ndarray, number: int, axis=-1):
         - axis :  on wich axis should we look for the k smallest values
 
     """
-    semi_sorted_dist = np.argpartition(distance, number, axis=axis)
-    return np.take(semi_sorted_dist, np.arange(0, number), axis=axis)
+    return top_k(distance, number, axis=axis)
+
+
+def pairwise_distances(features: np.ndarray, points: np.ndarray, squared=False, out=None):
+    """
+    euclidean distances between the features and the points (|f|^2 + |p|^2 - 2 f.p, one matrix product)
+    args :
+        - features array(...,n_dim) : features to classify
+        - points array(...,n_points,n_dim) : leading dims broadcastable with the features
+        - squared : squared distances
+        - out : output buffer array(...,n_points)
+    returns :
+        distances array(...,n_points)
+    """
+    dot = np.matmul(points, features[..., None])[..., 0]
+    out = np.multiply(dot, -2, out=out)
+    out += np.einsum("...d,...d->...", points, points)
+    out += np.einsum("...d,...d->...", features, features)[..., None]
+    np.maximum(out, 0, out=out)  # rounding errors
+    if not squared:
+        np.sqrt(out, out=out)
+    return out
+
+
+def distance_softmax(features: np.ndarray, points: np.ndarray, temperature=20, out=None):
+    """
+    softmax(-temperature * distance) along the points (probabilities of the ncm classifier)
+    args : see pairwise_distances
+    """
+    out = pairwise_distances(features, points, out=out)
+    out *= -temperature
+    return softmax(out, dim=-1, out=out)
+
+
+def vote_counts(labels: np.ndarray, num_classes: int, out=None):
+    """
+    number of votes for each class (one bincount for all the leading dims)
+    args :
+        - labels array(...,k) : votes, values from 0 to num_classes-1
+        - num_classes : number of classes
+        - out : output buffer array(...,num_classes)
+    returns :
+        counts array(...,num_classes)
+    """
+    number_rows = int(np.prod(labels.shape[:-1]))
+    offsets = np.arange(0, number_rows * num_classes, num_classes).reshape(labels.shape[:-1] + (1,))
+    counts = np.bincount((labels + offsets).ravel(), minlength=number_rows * num_classes)
+    counts = counts.reshape(labels.shape[:-1] + (num_classes,))
+    if out is None:
+        return counts
+    out[...] = counts
+    return out
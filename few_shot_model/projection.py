@@ -0,0 +1,86 @@
+"""
+projection of the features on fewer dimensions, applied once per feature before storage and matching (smaller
+support bank, cheaper distances)
+    - pca : principal components of features of the scene (initialization frames) or of a dataset
+    - random : random orthogonal projection (no fit)
+"""
+import numpy as np
+
+PROJECTIONS = ("pca", "random")
+
+
+def random_orthogonal(number_features: int, dim: int, rng, basis=None):
+    """
+    orthonormal columns (number_features, dim), orthogonal to the columns of basis if given
+    """
+    matrix = rng.standard_normal((number_features, dim))
+    if basis is not None:
+        matrix -= basis @ (basis.T @ matrix)
+    q, r = np.linalg.qr(matrix)
+    return q * np.sign(np.diag(r))  # unique decomposition
+
+
+class FeatureProjection:
+    """
+    attributes :
+        method : pca or random
+        dim : number of dimensions of the projected features
+        mean (np.ndarray(n_features)) : mean removed before the projection
+        matrix (np.ndarray(n_features,dim)) : orthonormal columns, None before the fit
+    """
+
+    def __init__(self, method: str, dim: int, seed=0):
+        if method not in PROJECTIONS:
+            raise NotImplementedError(f"projection {method} is not implemented")
+        self.method = method
+        self.dim = dim
+        self.seed = seed
+        self.mean = None
+        self.matrix = None
+
+    @property
+    def fitted(self):
+        return self.matrix is not None
+
+    def fit(self, features: np.ndarray):
+        """
+        args :
+            features (np.ndarray(n_samples,n_features)) : features of the scene or of a dataset
+        with less samples than dim, the principal components are completed with random orthogonal directions
+        """
+        number_features = features.shape[-1]
+        if self.dim > number_features:
+            raise ValueError(f"can not project {number_features} features on {self.dim} dimensions")
+        rng = np.random.default_rng(self.seed)
+        self.mean = features.mean(axis=0)
+        if self.method == "random":
+            self.matrix = random_orthogonal(number_features, self.dim, rng)
+        else:
+            _, singular_values, components = np.linalg.svd(features - self.mean, full_matrices=False)
+            components = components[singular_values > 1e-6 * singular_values[0]][: self.dim].T
+            if components.shape[1] < self.dim:
+                completion = random_orthogonal(number_features, self.dim - components.shape[1], rng, components)
+                components = np.concatenate([components, completion], axis=1)
+            self.matrix = components
+        self.matrix = self.matrix.astype(np.float32)
+        self.mean = self.mean.astype(np.float32)
+        return self
+
+    def __call__(self, features: np.ndarray):
+        """
+        features (np.ndarray(...,n_features)) -> (np.ndarray(...,dim))
+        """
+        if features.shape[-1] != self.matrix.shape[0]:
+            raise ValueError(f"projection of {self.matrix.shape[0]} features, got {features.shape[-1]} features")
+        return (features - self.mean) @ self.matrix
+
+    def save(self, path):
+        np.savez(path, method=self.method, mean=self.mean, matrix=self.matrix)
+
+    @classmethod
+    def load(cls, path):
+        saved = np.load(path)
+        projection = cls(str(saved["method"]), saved["matrix"].shape[1])
+        projection.mean = saved["mean"]
+        projection.matrix = saved["matrix"]
+        return projection
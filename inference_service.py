@@ -0,0 +1,215 @@
+"""
+Local inference service : the backbone and the few shot model behind an http server on localhost.
+
+The concurrent requests are gathered into micro batches for the backbone (at most --max-batch frames, the first
+frame of a batch waits at most --max-wait-ms). Endpoints (POST, json body, images encoded in png/jpg then base64) :
+    - /calibrate {"image": ...} : add the image to the mean features (frames of the background, as the initialization of the demo)
+    - /register {"image": ..., "class": 0} : add the image as a shot of the class
+    - /classify {"image": ...} : {"class": .., "probabilities": [..], "queue_ms": .., "compute_ms": ..}
+    - /reset {} : forget the shots and the mean features
+    - /stats (GET) : queueing and compute latencies, batch sizes
+
+python3 inference_service.py --framework onnx --path-onnx ../resnet9_strided_16fmaps.onnx --port 8765
+python3 load_generator.py --url http://127.0.0.1:8765 --dataset ../images --clients 8 --duration 30
+"""
+
+import argparse
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+
+from args import create_args, check_precision, framework_choice, args_treatement
+from backbone_loader.backbone_loader import get_model
+from backbone_loader.batching import MicroBatcher
+from backbone_loader.preprocessing import preprocess
+from few_shot_model.data_few_shot import DataFewShot
+from few_shot_model.few_shot_model import FewShotModel
+
+
+def encode_image(img: np.ndarray, extension=".png"):
+    """
+    image -> base64 string (body of the requests)
+    """
+    _, buffer = cv2.imencode(extension, img)
+    return base64.b64encode(buffer.tobytes()).decode("ascii")
+
+
+def decode_image(text: str):
+    img = cv2.imdecode(np.frombuffer(base64.b64decode(text), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("could not decode the image")
+    return img
+
+
+def percentiles(values):
+    if len(values) == 0:
+        return {"mean": 0, "p50": 0, "p90": 0, "p99": 0}
+    values = 1000 * np.array(values)
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+    }
+
+
+class InferenceService:
+    """
+    few shot state of the service (shared by all the clients)
+    """
+
+    def __init__(self, backbone, classifier_specs, resolution, max_batch_size, max_wait):
+        self.batcher = MicroBatcher(backbone, max_batch_size, max_wait)
+        self.few_shot_model = FewShotModel(classifier_specs)
+        self.resolution = resolution
+        self.lock = threading.Lock()
+        self.data = DataFewShot(0)
+        self.calibration_features = []
+        self.queue_times = []
+        self.compute_times = []
+
+    def features(self, img):
+        frame = cv2.resize(img, dsize=self.resolution, interpolation=cv2.INTER_LINEAR)
+        features, queue_time, compute_time = self.batcher(preprocess(frame))
+        with self.lock:
+            self.queue_times.append(queue_time)
+            self.compute_times.append(compute_time)
+        return features, queue_time, compute_time
+
+    def calibrate(self, body):
+        features, queue_time, compute_time = self.features(decode_image(body["image"]))
+        with self.lock:
+            # the state changes only once the new mean is computed (a failed request leaves it unchanged)
+            calibration_features = self.calibration_features + [features]
+            mean_features = np.concatenate(calibration_features, axis=0).mean(axis=0)
+            self.calibration_features = calibration_features
+            self.data.set_mean_features(mean_features)
+            number = len(self.calibration_features)
+        return {"calibration_frames": number, "queue_ms": 1000 * queue_time, "compute_ms": 1000 * compute_time}
+
+    def register(self, body):
+        classe = int(body["class"])
+        features, queue_time, compute_time = self.features(decode_image(body["image"]))
+        with self.lock:
+            if classe not in self.data.registered_classes and classe != len(self.data.registered_classes):
+                raise ValueError(f"classes must be registered in order, next class is {len(self.data.registered_classes)}")
+            self.data.add_repr(classe, features)
+            number_shots = self.data.number_shots(classe)
+        return {"class": classe, "shots": number_shots, "queue_ms": 1000 * queue_time, "compute_ms": 1000 * compute_time}
+
+    def classify(self, body):
+        features, queue_time, compute_time = self.features(decode_image(body["image"]))
+        with self.lock:
+            if not self.data.is_data_recorded() or len(self.calibration_features) == 0:
+                raise ValueError("register shots and calibrate before classifying")
+            shot_list = list(self.data.get_shot_list())
+            mean_features = self.data.get_mean_features()
+            support_bank = self.data.get_support_bank()
+        classe_prediction, probabilities = self.few_shot_model.predict_class_feature(
+            features, shot_list, mean_features, support_bank=support_bank
+        )
+        return {
+            "class": int(classe_prediction[0]),
+            "probabilities": probabilities[0].tolist(),
+            "queue_ms": 1000 * queue_time,
+            "compute_ms": 1000 * compute_time,
+        }
+
+    def reset(self, body):
+        with self.lock:
+            self.data.reset()
+            self.calibration_features = []
+        return {}
+
+    def stats(self):
+        with self.lock:
+            queue_times, compute_times = list(self.queue_times), list(self.compute_times)
+        batch_sizes = self.batcher.batch_sizes
+        return {
+            "requests": len(queue_times),
+            "queue_ms": percentiles(queue_times),
+            "compute_ms": percentiles(compute_times),
+            "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes else 0,
+            "batches": len(batch_sizes),
+        }
+
+
+def make_handler(service):
+    endpoints = {
+        "/calibrate": service.calibrate,
+        "/register": service.register,
+        "/classify": service.classify,
+        "/reset": service.reset,
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, code, content):
+            data = json.dumps(content).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self.send_json(200, service.stats())
+            else:
+                self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+        def do_POST(self):
+            if self.path not in endpoints:
+                self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                self.send_json(200, endpoints[self.path](body))
+            except (KeyError, ValueError) as error:
+                self.send_json(400, {"error": str(error)})
+            except Exception as error:
+                # the service state is only changed under its lock, once the request succeeded
+                self.send_json(500, {"error": f"{type(error).__name__}: {error}"})
+
+        def log_message(self, format, *args):
+            pass  # one line per request would flood the terminal
+
+    return Handler
+
+
+def inference_service(args):
+    backbone = get_model(args.backbone_specs)
+    service = InferenceService(
+        backbone, args.classifier_specs, args.resolution_input, args.max_batch, args.max_wait_ms / 1000
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.batcher.stop()
+        stats = service.stats()
+        print(f"\n{stats['requests']} requests, mean batch size {stats['mean_batch_size']:.2f}, "
+              f"queue {stats['queue_ms']['mean']:.2f} ms, compute {stats['compute_ms']['mean']:.2f} ms")
+
+
+if __name__ == "__main__":
+    # backbone and classifier arguments of the demo, and the arguments of the server
+    parser = argparse.ArgumentParser(description="Local few shot inference service")
+    create_args(parser)
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address of the server (localhost only by default)")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the server")
+    parser.add_argument("--max-batch", type=int, default=8, help="Maximum number of frames per backbone call")
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="Maximum waiting time of the first frame of a batch")
+    args = parser.parse_args()
+    check_precision(parser, args)
+    framework_choice(args)
+    args_treatement(args)
+
+    inference_service(args)
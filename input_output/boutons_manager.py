@@ -29,15 +29,23 @@ class ButtonsManager:
         self.wait = time.time()
         self.start = time.time()
 
-    def change_state(self):
-        
+    def read_state(self):
+        """
+        state of the buttons : bits of the pressed buttons (pynq buttons | external buttons)
+        """
         pynq = self.pynq_button.read()
         external = self.external_button.read()
         if external not in [1,2,4,8,16,32,17]:
             external = 0
+        return pynq | external
 
-        state = pynq | external
+    def change_state(self):
+        return self.key_of_state(self.read_state())
 
+    def key_of_state(self, state):
+        """
+        key corresponding to a new state of the buttons ("NO_KEY_PRESSED" if the state did not change or is released)
+        """
         if state != self.last_state:
             if state != 0:
                 if state == 1:
@@ -112,57 +120,7 @@ class ButtonsManager:
             key = 32
         else:
             key = 0
-        state = key
-
-        if state != self.last_state:
-            if state != 0:
-                if state == 1:
-                    # take a shot of the current class
-                    if self.key_pressed == "p" or self.key_pressed == "i":
-                        self.key_pressed = "1"
-                    self.last_state = state
-                    return self.key_pressed
-
-                if state == 2:
-                    # change class
-                    if self.key_pressed == "i":
-                        self.key_pressed = "1"
-                    if int(self.key_pressed) >= self.nb_class_max:
-                        print(" Maximum class reached.")
-                        self.reach_max = True
-                    else:
-                        print(" Now registering class " + self.key_pressed + ".", end='')
-                        self.key_pressed = str(int(self.key_pressed) + 1)
-                    self.last_state = state
-                    return self.key_pressed
-
-                if state == 4:
-                    # do inference
-                    self.key_pressed = "i"
-                    self.last_state = state
-                    return self.key_pressed
-
-                if state == 8:
-                    # reset
-                    self.key_pressed = "r"
-                    self.last_state = state
-                    return self.key_pressed
-                
-                if state == 16:
-                    # pause (on/off)
-                    self.key_pressed = "p"
-                    self.last_state = state
-                    return self.key_pressed
-                
-                if state == 32:
-                    # quit
-                    self.key_pressed = "q"
-                    self.last_state = state
-                    return self.key_pressed
-
-            self.last_state = state
-
-        return "NO_KEY_PRESSED"
+        return self.key_of_state(key)
     
 
     def button_sequence(self, period=1, timeout=15):
@@ -0,0 +1,194 @@
+"""
+sample the buttons in a thread (short presses are not missed, the gpio reads do not add to the frame time),
+debounce them in time and queue timestamped events for the main loop
+
+SimulatedGpio replays a script of presses (with contact bounce) with the read() of the pynq AxiGPIO channels,
+to run and measure the buttons without the board. With a SimulatedClock, the replay runs in virtual time
+(replay_script : deterministic, no sleep)
+"""
+import json
+import queue
+import threading
+import time
+
+from input_output.input_events import NO_KEY
+
+# state of the buttons (bits read on the gpio), see ButtonsManager.key_of_state
+BUTTON_STATES = {"shot": 1, "class": 2, "inference": 4, "reset": 8, "pause": 16, "quit": 32, "reboot": 17}
+
+
+class ButtonListener:
+    """
+    attributes :
+        read_state : function returning the state of the buttons (ex : ButtonsManager.read_state)
+        period : sampling period (s)
+        debounce : time a new state must be stable to be accepted (s)
+        events : queue of (state, timestamp of the first edge of the change, debounce delay of the event)
+    """
+
+    def __init__(self, read_state, period=0.001, debounce=0.02, clock=time.time):
+        self.read_state = read_state
+        self.period = period
+        self.debounce = debounce
+        self.clock = clock
+        self.events = queue.Queue()
+        self.running = False
+        self.thread = None
+        self.stable = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def loop(self):
+        while self.running:
+            self.sample()
+            time.sleep(self.period)
+
+    def sample(self):
+        """
+        read the buttons once and update the debouncing (called every period by the thread, or by replay_script)
+        """
+        if self.stable is None:
+            self.stable = self.read_state()
+            self.candidate, self.candidate_time = self.stable, self.clock()
+            self.first_edge, self.last_difference = None, None
+            return
+        state = self.read_state()
+        now = self.clock()
+        if state != self.stable:
+            if self.first_edge is None:
+                self.first_edge = now
+            self.last_difference = now
+            if state != self.candidate:
+                self.candidate, self.candidate_time = state, now
+            elif now - self.candidate_time >= self.debounce:
+                # new state stable long enough
+                self.stable = state
+                self.events.put((state, self.first_edge, now - self.first_edge))
+                self.first_edge = None
+        else:
+            self.candidate = self.stable
+            if self.first_edge is not None and now - self.last_difference >= self.debounce:
+                self.first_edge = None  # glitch
+
+    def get_event(self):
+        """
+        returns :
+            (state, timestamp, delay) of the oldest event, None if there is no event
+        """
+        try:
+            return self.events.get_nowait()
+        except queue.Empty:
+            return None
+
+
+def button_source(listener: ButtonListener, buttons_manager):
+    """
+    source of InputEvents : keys of the events of the listener (converted by the ButtonsManager in the main thread)
+    """
+
+    def poll():
+        event = listener.get_event()
+        if event is None:
+            return None
+        state, timestamp, _ = event
+        key = buttons_manager.key_of_state(state)
+        return None if key == NO_KEY else (key, timestamp)
+
+    return poll
+
+
+class SimulatedClock:
+    """
+    virtual time (s), set by the replay instead of sleeping
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class SimulatedGpio:
+    """
+    scripted gpio channel, same read() as the channels of pynq.lib.AxiGPIO
+    attributes :
+        script : list of (press time (s), state, duration (s)), times relative to the first read
+        bounce : duration of the contact bounce at the press and at the release (s), the state toggles every ms
+    """
+
+    def __init__(self, script, bounce=0.005, clock=time.time):
+        self.script = sorted(tuple(press) for press in script)
+        self.bounce = bounce
+        self.clock = clock
+        self.start = None
+
+    def read(self):
+        now = self.clock()
+        if self.start is None:
+            self.start = now
+        elapsed = now - self.start
+        for press_time, state, duration in self.script:
+            if press_time <= elapsed < press_time + duration:
+                since_edge = min(elapsed - press_time, press_time + duration - elapsed)
+                if since_edge < self.bounce and int(1000 * since_edge) % 2 == 1:
+                    return 0
+                return state
+        return 0
+
+    @property
+    def duration(self):
+        return max((press_time + duration for press_time, _, duration in self.script), default=0)
+
+
+def load_button_script(path):
+    """
+    json list of [press time (s), button, duration (s)], button being a name of BUTTON_STATES or a state
+    ex : [[1.0, "shot", 0.1], [2.0, "class", 0.05], [3.0, "shot", 0.1], [4.0, "inference", 0.1]]
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        script = json.load(file)
+    return [(float(press_time), BUTTON_STATES.get(button, button), float(duration)) for press_time, button, duration in script]
+
+
+def replay_script(script, period=0.001, debounce=0.02, bounce=0.005):
+    """
+    replay the script on a simulated gpio in virtual time (deterministic), the listener samples it every period
+    returns :
+        list of (state, press time, latency (s)) : delay between each press and the end of the debouncing of its
+        event, latency is None if the press was missed
+    """
+    clock = SimulatedClock()
+    gpio = SimulatedGpio(script, bounce, clock)
+    gpio.read()  # start of the script
+    listener = ButtonListener(gpio.read, period, debounce, clock)
+    # integer number of periods : no accumulated rounding of the virtual time
+    for step in range(int(round((gpio.duration + 2 * debounce) / period)) + 1):
+        clock.now = gpio.start + step * period
+        listener.sample()
+    events = []
+    while True:
+        event = listener.get_event()
+        if event is None:
+            break
+        if event[0] != 0:
+            events.append(event)
+    results = []
+    for press_time, state, _ in sorted(script):
+        absolute_time = gpio.start + press_time
+        matching = [event for event in events if event[0] == state and event[1] >= absolute_time - 1e-3]
+        latency = matching[0][1] + matching[0][2] - absolute_time if matching else None
+        if matching:
+            events.remove(matching[0])
+        results.append((state, press_time, latency))
+    return results
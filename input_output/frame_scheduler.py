@@ -0,0 +1,145 @@
+"""
+deadline of the frames of the demo : target fps (or latency budget per frame), per stage budgets, and shedding of
+the optional work when the deadlines are missed
+
+shedding policies, activated one after the other while the frames keep missing their deadline
+(and deactivated once the frames are back under the budget) :
+    - overlay : the interface (headband, text, indicators) is not drawn
+    - classification : the backbone and the classifier are skipped, the last prediction is kept
+    - stale_frame : the oldest frame buffered by the camera is dropped before reading
+the deadline misses are recorded with the stages that caused them (stages over their budget, or the longest stage)
+"""
+import json
+import time
+import numpy as np
+
+SHED_POLICIES = ("overlay", "classification", "stale_frame")
+# columns of the Timer measuring a stage of the frame
+STAGES = ("BUTTONS READ", "FRAME READ", "BACKBONE", "PREDI", "TEXT", "INDICATORS", "TEXT FPS CLOCK", "FRAME", "WRITEFRAME")
+
+
+class FrameScheduler:
+    """
+    attributes :
+        budget : time budget of a frame (s)
+        stage_budgets : budget of some stages (s), ex : {"BACKBONE": 0.02}
+        shed : shedding policies, in activation order
+        level : number of activated shedding policies
+        pace : sleep until the end of the budget when the frame is early (constant fps)
+    """
+
+    def __init__(
+        self,
+        target_fps=None,
+        budget_ms=None,
+        stage_budgets_ms=None,
+        shed=SHED_POLICIES,
+        escalate_after=3,
+        relax_after=30,
+        relax_margin=0.8,
+    ):
+        if target_fps is None and budget_ms is None:
+            raise ValueError("give a target fps or a latency budget")
+        for policy in shed:
+            if policy not in SHED_POLICIES:
+                raise NotImplementedError(f"shedding policy {policy} is not implemented")
+        self.budget = budget_ms / 1000 if budget_ms is not None else 1 / target_fps
+        self.pace = target_fps is not None
+        self.stage_budgets = {stage: budget / 1000 for stage, budget in (stage_budgets_ms or {}).items()}
+        self.shed = tuple(shed)
+        self.escalate_after = escalate_after
+        self.relax_after = relax_after
+        self.relax_margin = relax_margin
+        self.level = 0
+        self.consecutive_misses = 0
+        self.consecutive_hits = 0
+        self.frame_start = time.time()
+        self.frames = 0
+        self.misses = 0
+        self.miss_causes = {}
+        self.shed_counts = {policy: 0 for policy in self.shed}
+        self.frame_times = []
+        self.stage_times = {}
+
+    def start_frame(self):
+        self.frame_start = time.time()
+
+    def remaining(self):
+        """
+        time left before the deadline of the current frame (s)
+        """
+        return self.budget - (time.time() - self.frame_start)
+
+    def run(self, policy):
+        """
+        False if the work of the policy must be shed on this frame
+        """
+        if policy in self.shed[: self.level]:
+            self.shed_counts[policy] += 1
+            return False
+        return True
+
+    def end_frame(self, stage_times):
+        """
+        record the frame, update the shedding level and wait for the deadline (if paced)
+        args :
+            stage_times (dict) : duration of the stages that ran on this frame (s), ex : Timer.frame_columns
+                (the columns not in STAGES are ignored)
+        """
+        frame_time = time.time() - self.frame_start
+        self.frames += 1
+        self.frame_times.append(frame_time)
+        stage_times = {stage: value for stage, value in stage_times.items() if stage in STAGES}
+        for stage, value in stage_times.items():
+            self.stage_times.setdefault(stage, []).append(value)
+
+        if frame_time > self.budget:
+            self.misses += 1
+            causes = [stage for stage, budget in self.stage_budgets.items() if stage_times.get(stage, 0) > budget]
+            if len(causes) == 0 and len(stage_times) > 0:
+                causes = [max(stage_times, key=stage_times.get)]
+            for stage in causes:
+                self.miss_causes[stage] = self.miss_causes.get(stage, 0) + 1
+            self.consecutive_misses += 1
+            self.consecutive_hits = 0
+            if self.consecutive_misses >= self.escalate_after and self.level < len(self.shed):
+                self.level += 1
+                self.consecutive_misses = 0
+        else:
+            self.consecutive_misses = 0
+            if frame_time < self.relax_margin * self.budget:
+                self.consecutive_hits += 1
+                if self.consecutive_hits >= self.relax_after and self.level > 0:
+                    self.level -= 1
+                    self.consecutive_hits = 0
+            if self.pace:
+                time.sleep(max(0, self.remaining()))
+
+    def report(self):
+        frame_times = 1000 * np.array(self.frame_times) if self.frame_times else np.zeros(1)
+        return {
+            "budget_ms": 1000 * self.budget,
+            "frames": self.frames,
+            "misses": self.misses,
+            "miss_rate": self.misses / self.frames if self.frames else 0,
+            "miss_causes": self.miss_causes,
+            "shed_counts": self.shed_counts,
+            "frame_ms": {"mean": float(frame_times.mean()), "p90": float(np.percentile(frame_times, 90)), "max": float(frame_times.max())},
+            "stages_ms": {
+                stage: {"mean": float(1000 * np.mean(values)), "p90": float(1000 * np.percentile(values, 90))}
+                for stage, values in self.stage_times.items()
+            },
+        }
+
+    def print_report(self, path=None):
+        report = self.report()
+        print(f"\nDeadline misses : {report['misses']}/{report['frames']} frames ({100 * report['miss_rate']:.1f}%), "
+              f"budget {report['budget_ms']:.1f} ms, frame time mean {report['frame_ms']['mean']:.1f} ms, p90 {report['frame_ms']['p90']:.1f} ms")
+        for stage, count in sorted(report["miss_causes"].items(), key=lambda item: -item[1]):
+            print(f"    {stage} : {count} misses")
+        print("Shed : " + ", ".join(f"{policy} {count} frames" for policy, count in report["shed_counts"].items()))
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=4)
+            print("Scheduler report saved in: ", path)
+        return report
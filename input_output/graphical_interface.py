@@ -284,26 +284,32 @@ class OpencvInterface:
         self.video_capture.release()
         cv2.destroyAllWindows()
 
-    def get_key(self):
+    def get_key(self, delay=1):
         """
-        if a key was pressed, get the key
+        if a key was pressed, get the key (255 if none)
+        delay (ms) : time waited for a key, 1 to only process the window events without pacing the frame loop
         """
-        return cv2.waitKey(33) & 0xFF
+        return cv2.waitKey(delay) & 0xFF
 
 
 
 def ms(value,width):
         return '{:^{width}.2f}'.format(1000*value,width=width)
 
+def scaled(value,scale,width):
+        return '{:^{width}.2f}'.format(scale*value,width=width)
+
 class Timer:
     """
     Class to display timers on the terminal
     Easy to use :
         - columns : a dictionary in which keys and values will be display on the terminal 
+        - frame_columns : the steps timed with toc() since the last tic(init=True) (only the steps of the current frame)
         - tic() : save instantaneous time. If init = True, save initial time
         - toc(step) : save the duration since tic() and associate with the step in the dictionary "columns". Save also instantaneous time like tic().
                       If end = true, calculate and save total time
-        - timer() : display the dictionary on the terminal, i.e. texts and associate values in ms
+        - metric(name,value,scale) : save a value which is not a duration (rate, resolution...) in "columns", displayed as scale*value
+        - timer() : display the dictionary on the terminal, i.e. texts and associate values in ms (metrics as they are)
         - fps_() : calculate and save fps
         - reset() : reset of Timer
     For example : 
@@ -317,6 +323,8 @@ class Timer:
         self.period = period
         self.columns = {"FPS":0,"TOTAL TIME (ms)":0}
         self.saved_columns = {"FPS":0,"TOTAL TIME (ms)":0}
+        self.frame_columns = {}
+        self.metric_scales = {}
         self.time = time.time()
         self.wait = time.time()
         self.initial_time = 0
@@ -339,13 +347,17 @@ class Timer:
                 print("|",end="")
                 for txt in self.columns:
                     l1 = len(txt)+4 #length of texts
-                    print(ms(self.columns[txt],width=l1),end="")
+                    if txt in self.metric_scales:
+                        print(scaled(self.columns[txt],self.metric_scales[txt],width=l1),end="")
+                    else:
+                        print(ms(self.columns[txt],width=l1),end="")
                     print("|",end="")
     
     def tic(self,init=False):
         self.time = time.time()
         if init:
             self.initial_time = time.time()
+            self.frame_columns = {}
 
     def toc(self,step,end=False):
         if not end:
@@ -353,13 +365,19 @@ class Timer:
         else:
             self.total_time = time.time() - self.initial_time
             self.columns[step] = self.total_time
+        self.frame_columns[step] = self.columns[step]
         self.time = time.time()
 
+    def metric(self,name,value,scale=1):
+        self.columns[name] = value
+        self.metric_scales[name] = scale
+
     def fps_(self):
         self.fps = 1/(1000*self.total_time)
     
     def reset(self):
         self.columns = self.saved_columns.copy()
+        self.frame_columns = {}
         self.time = time.time()
         self.wait = time.time()
         self.initial_time = 0
@@ -0,0 +1,87 @@
+"""
+inputs of the demo (keyboard, buttons, scripted sequences) delivered to the state machine through an event queue
+
+the sources are polled without blocking once per frame (pump), or put their events from their own thread (put),
+so that reading the inputs does not pace the frame loop
+"""
+import queue
+import time
+
+NO_KEY = "NO_KEY_PRESSED"
+
+
+class InputEvents:
+    """
+    queue of the input events (key, timestamp)
+    attributes :
+        sources : functions polled by pump, returning a key or None
+        last_timestamp : time of the last event given by get_key
+    """
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.sources = []
+        self.last_timestamp = None
+
+    def add_source(self, poll):
+        """
+        add a function polled at each pump (must not block), returning the key pressed, (key, timestamp) or None
+        """
+        self.sources.append(poll)
+
+    def put(self, key, timestamp=None):
+        """
+        add an event (can be called from any thread)
+        """
+        self.events.put((key, time.time() if timestamp is None else timestamp))
+
+    def pump(self):
+        """
+        poll all the sources
+        """
+        for poll in self.sources:
+            key = poll()
+            if isinstance(key, tuple):
+                self.put(*key)
+            elif key is not None:
+                self.put(key)
+
+    def get_key(self):
+        """
+        next key of the queue, NO_KEY if there is no event (does not wait)
+        """
+        try:
+            key, self.last_timestamp = self.events.get_nowait()
+        except queue.Empty:
+            return NO_KEY
+        return key
+
+    def clear(self):
+        while not self.events.empty():
+            self.events.get_nowait()
+
+
+def keyboard_source(get_key):
+    """
+    source of the keys of the opencv window
+    args :
+        - get_key : function returning the code of the key pressed (255 if none), ex : OpencvInterface.get_key
+    """
+
+    def poll():
+        key = get_key()
+        return None if key == 255 else chr(key)
+
+    return poll
+
+
+def filter_source(poll, no_event=(NO_KEY, "0")):
+    """
+    wrap a source returning a placeholder (ex : "NO_KEY_PRESSED" for ButtonsManager) when no key is pressed
+    """
+
+    def filtered_poll():
+        key = poll()
+        return None if key in no_event else key
+
+    return filtered_poll
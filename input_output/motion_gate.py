@@ -0,0 +1,103 @@
+"""
+detect changes of the scene on the frame given to the backbone, to run the backbone only when the scene changed
+(the features and probabilities of the last run are reused otherwise)
+
+2 possible detections :
+    - diff : mean absolute difference of the grayscale frames (in gray levels, 0-255)
+    - phash : perceptual hash (sign of the low frequencies of the dct), number of different bits
+The frame is compared to the last frame given to the backbone, so that a slow drift of the scene is detected too.
+"""
+import cv2
+import numpy as np
+
+# threshold used if none is given
+DEFAULT_THRESHOLDS = {"diff": 4.0, "phash": 6}
+
+
+def grayscale(frame: np.ndarray):
+    """
+    grayscale float32 copy of a bgr (or already gray) uint8 frame
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return frame.astype(np.float32)
+
+
+def perceptual_hash(frame: np.ndarray, hash_size: int = 8):
+    """
+    hash_size*hash_size bits : lowest frequencies of the dct of the frame, compared to their median
+    """
+    gray = cv2.resize(grayscale(frame), (4 * hash_size, 4 * hash_size), interpolation=cv2.INTER_AREA)
+    low_frequencies = cv2.dct(gray)[:hash_size, :hash_size]
+    return (low_frequencies > np.median(low_frequencies)).flatten()
+
+
+class MotionGate:
+    """
+    decide if the backbone needs to run on the current frame
+
+    attributes :
+        mode : diff or phash
+        threshold : change above which the backbone runs
+        refresh : the backbone runs at least once every refresh frames (bounds the staleness of the features)
+        number_frames, number_skipped : counters since the last reset
+    """
+
+    def __init__(self, mode: str = "diff", threshold=None, refresh: int = 30):
+        if mode not in DEFAULT_THRESHOLDS:
+            raise NotImplementedError(f"motion gate {mode} is not implemented")
+        self.mode = mode
+        self.threshold = DEFAULT_THRESHOLDS[mode] if threshold is None else threshold
+        self.refresh = refresh
+        self.reset()
+
+    def signature(self, frame: np.ndarray):
+        if self.mode == "diff":
+            return grayscale(frame)
+        return perceptual_hash(frame)
+
+    def distance(self, signature: np.ndarray):
+        """
+        change between the reference (last frame given to the backbone) and the signature of the current frame
+        """
+        if self.mode == "diff":
+            return float(np.mean(np.abs(signature - self.reference)))
+        return int(np.count_nonzero(signature != self.reference))
+
+    def should_run(self, frame: np.ndarray):
+        """
+        args :
+            frame : frame at the resolution of the backbone (before preprocessing)
+        returns :
+            bool : True if the backbone must run (first frame, change detected, or refresh)
+        """
+        self.number_frames += 1
+        signature = self.signature(frame)
+        run = (
+            self.reference is None
+            or self.since_last_run + 1 >= self.refresh
+            or self.distance(signature) > self.threshold
+        )
+        if run:
+            self.reference = signature
+            self.since_last_run = 0
+        else:
+            self.since_last_run += 1
+            self.number_skipped += 1
+        return run
+
+    @property
+    def skip_rate(self):
+        """
+        proportion of frames for which the backbone was skipped
+        """
+        return self.number_skipped / self.number_frames if self.number_frames else 0.0
+
+    def reset(self):
+        """
+        forget the reference frame (the next frame always runs the backbone) and the counters
+        """
+        self.reference = None
+        self.since_last_run = 0
+        self.number_frames = 0
+        self.number_skipped = 0
@@ -0,0 +1,134 @@
+"""
+Load generator of inference_service.py : several clients send classification requests concurrently.
+
+The shots (and the calibration frames) are first registered from an image folder (one sub folder per class), then
+each client sends /classify requests in a loop (closed loop), or at a fixed rate (--rate, open loop, requests per
+second per client). The end to end latency measured by the clients and the queueing / compute latency of the
+server are reported, to size a deployment (number of clients, batch size, max wait).
+
+python3 load_generator.py --url http://127.0.0.1:8765 --dataset ../images --clients 1 2 4 8 --duration 20
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.request
+import numpy as np
+
+from few_shot_model.evaluation import load_image_folder
+from inference_service import encode_image, percentiles
+
+
+def post(url, endpoint, body):
+    request = urllib.request.Request(
+        url + endpoint, data=json.dumps(body).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def get(url, endpoint):
+    with urllib.request.urlopen(url + endpoint) as response:
+        return json.loads(response.read())
+
+
+def setup_service(url, images, labels, n_shots, n_calibration, seed=0):
+    """
+    reset the service, calibrate on images sampled across the classes and register n_shots images per class
+    returns :
+        indices of the images not registered (queries)
+    """
+    post(url, "/reset", {})
+    # the image folder is sorted by class, a seeded permutation gives a calibration with all the classes
+    for index in np.random.default_rng(seed).permutation(len(images))[:n_calibration]:
+        post(url, "/calibrate", {"image": encode_image(images[index])})
+    queries = []
+    for label in np.unique(labels):
+        indices = np.flatnonzero(labels == label)
+        for index in indices[:n_shots]:
+            post(url, "/register", {"image": encode_image(images[index]), "class": int(label)})
+        queries.extend(indices[n_shots:].tolist())
+    return queries
+
+
+def client(url, encoded, labels, duration, rate, seed, results):
+    rng = np.random.default_rng(seed)
+    end = time.time() + duration
+    next_time = time.time()
+    while time.time() < end:
+        index = rng.integers(len(encoded))
+        start = time.time()
+        answer = post(url, "/classify", {"image": encoded[index]})
+        answer["latency"] = time.time() - start
+        answer["correct"] = answer["class"] == labels[index]
+        results.append(answer)
+        if rate:
+            next_time += 1 / rate
+            time.sleep(max(0, next_time - time.time()))
+
+
+def run_load(url, encoded, labels, n_clients, duration, rate):
+    results = []
+    threads = [
+        threading.Thread(target=client, args=(url, encoded, labels, duration, rate, seed, results))
+        for seed in range(n_clients)
+    ]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    return {
+        "clients": n_clients,
+        "throughput": len(results) / elapsed,
+        "accuracy": float(np.mean([result["correct"] for result in results])) if results else 0,
+        "latency_ms": percentiles([result["latency"] for result in results]),
+        "queue_ms": percentiles([result["queue_ms"] / 1000 for result in results]),
+        "compute_ms": percentiles([result["compute_ms"] / 1000 for result in results]),
+    }
+
+
+def load_generator(args):
+    images, labels, _ = load_image_folder(args.dataset, (args.resolution_input, args.resolution_input), args.max_per_class)
+    queries = setup_service(args.url, images, labels, args.n_shots, args.n_calibration, args.seed)
+    encoded = [encode_image(images[index]) for index in queries]
+    query_labels = labels[queries]
+
+    reports = []
+    print(f"{'clients':>7} | {'req/s':>8} | {'accuracy':>8} | {'p50 ms':>8} | {'p90 ms':>8} | {'queue ms':>8} | {'compute ms':>10}")
+    for n_clients in args.clients:
+        report = run_load(args.url, encoded, query_labels, n_clients, args.duration, args.rate)
+        reports.append(report)
+        print(
+            f"{n_clients:>7} | {report['throughput']:8.1f} | {100 * report['accuracy']:7.2f}% | {report['latency_ms']['p50']:8.2f} | "
+            f"{report['latency_ms']['p90']:8.2f} | {report['queue_ms']['mean']:8.2f} | {report['compute_ms']['mean']:10.2f}"
+        )
+    server_stats = get(args.url, "/stats")
+    print(f"Server : {server_stats['requests']} requests, mean batch size {server_stats['mean_batch_size']:.2f}")
+
+    if args.output_json is not None:
+        with open(args.output_json, "w", encoding="utf-8") as file:
+            json.dump({"runs": reports, "server": server_stats}, file, indent=4)
+        print("Report saved in: ", args.output_json)
+    return reports
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8765", help="Address of the inference service")
+    parser.add_argument("--dataset", type=str, required=True, help="Image folder, one sub folder per class")
+    parser.add_argument("--max-per-class", type=int, default=None, help="Maximum number of images loaded per class")
+    parser.add_argument("--resolution-input", type=int, default=32, help="Resolution of the images sent")
+    parser.add_argument("--n-shots", type=int, default=5, help="Number of shots registered per class")
+    parser.add_argument("--n-calibration", type=int, default=10, help="Number of images of the calibration (mean features)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the calibration images")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8], help="Numbers of concurrent clients to test")
+    parser.add_argument("--duration", type=float, default=10, help="Duration of each run (s)")
+    parser.add_argument("--rate", type=float, default=None, help="Requests per second per client (default : closed loop)")
+    parser.add_argument("--output-json", type=str, default=None, help="Save the report in a json file")
+    args = parser.parse_args()
+
+    load_generator(args)
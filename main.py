@@ -16,27 +16,22 @@ import time
 
 from input_output.graphical_interface import OpencvInterface
 from input_output.graphical_interface import Timer
+from input_output.motion_gate import MotionGate
+from input_output.frame_scheduler import FrameScheduler
+from input_output.input_events import InputEvents, keyboard_source, filter_source, NO_KEY
 from few_shot_model.few_shot_model import FewShotModel
 from backbone_loader.backbone_loader import get_model
+from backbone_loader.preprocessing import preprocess
+from backbone_loader.background_inference import BackgroundClassifier
+from backbone_loader.test_time_augmentation import TestTimeAugmentation
+from backbone_loader.cascade import Cascade
+from backbone_loader.early_exit import EarlyExit
+from backbone_loader.resolution_switch import ResolutionSwitch
 from few_shot_model.data_few_shot import DataFewShot
+from few_shot_model.projection import FeatureProjection
 from args import get_args_demo
 print("Imports done.")
 
-def preprocess(img, dtype=np.float32):
-    """
-    Args : img(np.ndarray(h,w,c)) :
-    """
-    assert len(img.shape) == 3
-    assert img.shape[-1] == 3
-
-    if img.dtype != dtype:
-        # not that this copy the image
-        img = img.astype(dtype)
-    img = img[None, :]
-    mean = np.array([0.485, 0.456, 0.406], dtype=dtype)
-    std = np.array([0.229, 0.224, 0.225], dtype=dtype)
-    return (img / 255 - mean/std)
-
 def get_gpio(overlay):
     from input_output.boutons_manager import ButtonsManager
     from pynq.lib import AxiGPIO
@@ -65,8 +60,30 @@ def launch_demo(args):
     GSCALE = args.general_scale # General scale (=1 for the pynq screen)
 
     # Fewshot model
-    backbone = get_model(args.backbone_specs)
     few_shot_model = FewShotModel(args.classifier_specs)
+    # Cascade (or early exits) : the next backbones (blocks) only run when the margin of the prediction is low
+    # Resolution variants : the resolution follows the latency
+    cascade = None
+    if (args.cascade_config is not None or args.early_exit_margins or args.resolutions) and (args.tta or args.backbone_process or args.classification_rate is not None):
+        raise ValueError("--cascade-config, --early-exit-margins and --resolutions can not be used with --tta, --backbone-process or --classification-rate")
+    if args.cascade_config is not None:
+        cascade = Cascade.from_config(args.cascade_config, few_shot_model, args.backbone_specs)
+        backbone = None # each stage has its backbone
+    elif args.resolutions:
+        cascade = ResolutionSwitch.from_specs(args.backbone_specs, args.resolutions, few_shot_model, args.resolution_latency_ms/1000, args.variant_paths)
+        backbone = None # one backbone per resolution
+    elif args.backbone_process:
+        # backbone in a worker process, frames and features in shared memory
+        from backbone_loader.backbone_process import BackboneProcess
+        backbone = BackboneProcess(args.backbone_specs, (args.resolution_input[1], args.resolution_input[0], 3))
+    else:
+        backbone = get_model(args.backbone_specs)
+        if args.early_exit_margins:
+            cascade = EarlyExit(backbone, args.resolution_input, args.early_exit_margins, few_shot_model)
+    # Test time augmentation : features pooled over augmented views of the camera frame
+    tta = None
+    if args.tta:
+        tta = TestTimeAugmentation(backbone, args.resolution_input, args.tta)
     probabilities = None
     probas = None
 
@@ -76,7 +93,20 @@ def launch_demo(args):
     nb_class_max = 0
     registered_class = None
 
-    current_data = DataFewShot(nb_class_max) # useless parameters in DataFewShot (delete?)
+    # Projection of the features (fitted on the initialization frames, or offline)
+    projection = None
+    if args.projection_path is not None:
+        projection = FeatureProjection.load(args.projection_path)
+    elif args.projection != "none":
+        projection = FeatureProjection(args.projection, args.projection_dim)
+    if projection is not None and cascade is not None:
+        raise ValueError("the projection can not be used with --cascade-config, --early-exit-margins or --resolutions")
+    if (args.class_capacity is not None or args.max_total_shots is not None) and cascade is not None:
+        raise ValueError("--class-capacity and --max-total-shots can not be used with --cascade-config, --early-exit-margins or --resolutions")
+
+    current_data = DataFewShot(nb_class_max, projection, args.bank_storage, args.pq_subspaces, args.class_capacity, args.coreset, args.max_total_shots) # useless parameters in DataFewShot (delete?)
+    if cascade is not None:
+        current_data = cascade # one support set per stage
 
     # State activation variable
     demo_ON = True
@@ -100,6 +130,13 @@ def launch_demo(args):
         pynq_button, external_button = get_gpio(args.overlay)
         from input_output.boutons_manager import ButtonsManager
         btn_manager = ButtonsManager(pynq_button, external_button, nb_class_max)
+    elif args.button == "simulated":
+        # scripted presses replayed on simulated gpios (test of the buttons without the board)
+        possible_input = possible_input_pynq
+        nb_class_max = len(possible_input)
+        from input_output.boutons_manager import ButtonsManager
+        from input_output.button_listener import SimulatedGpio, load_button_script
+        btn_manager = ButtonsManager(SimulatedGpio(load_button_script(args.button_script)), SimulatedGpio([]), nb_class_max)
     elif args.button == "keyboard":
         possible_input = possible_input_keyboard
         nb_class_max = len(possible_input)
@@ -114,10 +151,58 @@ def launch_demo(args):
     # Terminal Interface
     T = Timer()
 
+    # Deadline of the frames, the optional work is shed under overload
+    scheduler = None
+    if args.target_fps is not None or args.latency_budget_ms is not None:
+        stage_budgets = {stage: float(budget) for stage, budget in (item.rsplit("=", 1) for item in args.stage_budgets)}
+        scheduler = FrameScheduler(args.target_fps, args.latency_budget_ms, stage_budgets, args.shed)
+
+    # Skip the backbone when the scene is static (features and probabilities of the last run are reused)
+    motion_gate = None
+    if args.motion_gate != "none":
+        motion_gate = MotionGate(args.motion_gate, args.motion_threshold, args.motion_refresh)
+
+    def backbone_features(frame, pool=True):
+        """
+        features of the frame resized for the backbone, or of the augmented views of the camera frame (tta)
+        with the cascade, the camera frame (the features are computed by each stage)
+        """
+        if cascade is not None:
+            return cv_interface.frame
+        if tta is not None:
+            return tta.features(cv_interface.frame, pool)
+        return backbone(preprocess(frame))
+
+    # Classification in a background thread, decoupled from the display
+    background_classifier = None
+    if args.classification_rate is not None:
+        extract_features = tta if tta is not None else lambda frame: backbone(preprocess(frame))
+        if projection is not None:
+            extract_features = lambda frame, extract_features=extract_features: current_data.project(extract_features(frame))
+        background_classifier = BackgroundClassifier(extract_features, few_shot_model, args.classification_rate or None)
+
+    # Frames given to the backbone, saved for the calibration of quantize_onnx.py
+    recorded_frames = [] if args.record_frames is not None else None
+
     # Camera
     cap = init_camera()
     cv_interface = OpencvInterface(cap, RES_OUTPUT, GSCALE, FONT, nb_class_max, args.max_fps)
 
+    # Inputs : sources polled without blocking, events delivered through a queue
+    input_events = InputEvents()
+    button_listener = None
+    if args.button == "pynq" or args.button == "simulated":
+        # the buttons are sampled and debounced in a thread
+        from input_output.button_listener import ButtonListener, button_source
+        button_listener = ButtonListener(btn_manager.read_state, args.button_period_ms/1000, args.debounce_ms/1000).start()
+        input_events.add_source(button_source(button_listener, btn_manager))
+    elif args.button == "keyboard":
+        input_events.add_source(keyboard_source(lambda: cv_interface.get_key()))
+    elif args.button == "keyboard-pynq":
+        input_events.add_source(filter_source(lambda: btn_manager.change_state2(cv_interface.get_key())))
+    elif args.button == "sequence":
+        input_events.add_source(filter_source(lambda: btn_manager.button_sequence() if current_state in ("idle", "inference") else None))
+
     # Hdmi port
     if args.hdmi_display:
         from pynq.lib.video import VideoMode
@@ -133,25 +218,21 @@ def launch_demo(args):
     try:
         while True:
             T.tic(1) #initial time
+            if scheduler is not None:
+                scheduler.start_frame()
             ###------# GET INPUTS #------###
             ### KEYBOARD/BUTTON INPUT
-            if args.button == "pynq":
-                key = btn_manager.change_state()
-            elif args.button == "keyboard":
-                key = cv_interface.get_key()
-                key = chr(key)  # key convertion to char
-            elif args.button == "keyboard-pynq":
-                key = cv_interface.get_key()
-                key = btn_manager.change_state2(key)
-            elif args.button == "sequence" and (current_state=="idle" or current_state=="inference"):
-                key = btn_manager.button_sequence()
-            else:
-                key = "0"
+            input_events.pump() # non blocking
+            key = input_events.get_key()
+            if key != NO_KEY and button_listener is not None:
+                T.columns["BUTTON LATENCY"] = time.time() - input_events.last_timestamp # from the press
             T.toc("BUTTONS READ")
 
             if demo_ON:
                 ### FRAME INPUT ###
                 try:
+                    if scheduler is not None and current_state == "inference" and not scheduler.run("stale_frame"):
+                        cv_interface.video_capture.grab() # drop the oldest buffered frame
                     cv_interface.read_frame()
                 except:
                     reset_camera = True
@@ -165,9 +246,10 @@ def launch_demo(args):
                 if current_state == "initialization":
                     # learn background during {nb_frame_init} frame
                     frame = cv_interface.resize_for_backbone(args.resolution_input)
-                    frame = preprocess(frame)
+                    if recorded_frames is not None and len(recorded_frames) < args.record_frames_max:
+                        recorded_frames.append(frame)
                     T.tic()
-                    features = backbone(frame)
+                    features = backbone_features(frame)
                     T.toc("BACKBONE")
                     current_data.add_mean_repr(features)
                     if k_init >= nb_frame_init:
@@ -187,9 +269,11 @@ def launch_demo(args):
                 elif current_state == "registration":
                     # 10 (nb_features) following frames after pressing the button will be saved as features
                     frame = cv_interface.resize_for_backbone(args.resolution_input)
-                    frame = preprocess(frame)
+                    if recorded_frames is not None and len(recorded_frames) < args.record_frames_max:
+                        recorded_frames.append(frame)
                     T.tic()
-                    features = backbone(frame)
+                    # with tta, each view can be registered as a shot
+                    features = backbone_features(frame, pool=not args.tta_register_views)
                     T.toc("BACKBONE")
                     current_data.add_repr(classe, features)
                     if k_reg >= nb_features:
@@ -209,20 +293,52 @@ def launch_demo(args):
                 elif current_state == "inference":
                     # do the inference
                     frame = cv_interface.resize_for_backbone(args.resolution_input)
-                    frame = preprocess(frame)
-                    T.tic()
-                    features = backbone(frame)
-                    T.toc("BACKBONE")
-                    (classe_prediction, probabilities) = few_shot_model.predict_class_moving_avg(features, probabilities, current_data.get_shot_list(), current_data.get_mean_features())
-                    T.toc("PREDI")
+                    run_classification = scheduler is None or probabilities is None or scheduler.run("classification")
+                    if run_classification and (motion_gate is None or motion_gate.should_run(frame)):
+                        if recorded_frames is not None and len(recorded_frames) < args.record_frames_max:
+                            recorded_frames.append(frame)
+                        if background_classifier is not None:
+                            background_classifier.submit(cv_interface.frame.copy() if tta is not None else frame)
+                        else:
+                            T.tic()
+                            features = backbone_features(frame)
+                            if cascade is not None:
+                                (classe_prediction, probabilities) = cascade.predict_class_moving_avg(features, probabilities)
+                                T.toc("BACKBONE") # backbones and classifiers of the stages
+                                T.columns["PREDI"] = 0
+                                T.metric("ESCALATED (%)", cascade.escalation_rate, 100)
+                                if args.resolutions:
+                                    T.metric("RESOLUTION", cascade.resolution[0])
+                            else:
+                                features = current_data.project(features)
+                                T.toc("BACKBONE")
+                                (classe_prediction, probabilities) = few_shot_model.predict_class_moving_avg(features, probabilities, current_data.get_shot_list(), current_data.get_mean_features(), support_bank=current_data.get_support_bank())
+                                T.toc("PREDI")
+                    elif background_classifier is None:
+                        # static scene (or overload) : last prediction is kept
+                        T.columns["BACKBONE"] = 0
+                        T.columns["PREDI"] = 0
+                    if background_classifier is not None:
+                        # interpolated between the last classifications of the background thread
+                        T.tic()
+                        (classe_prediction, probabilities) = background_classifier.get_prediction()
+                        T.toc("PREDI")
+                        T.columns["BACKBONE"] = background_classifier.backbone_time
+                        T.metric("CLASSIF (Hz)", background_classifier.classification_rate)
                     k = 0
                     for index in registered_class: # reorganize probabilities
                         probas[index] = probabilities[0,k]
                         k += 1
+                    predicted_class = registered_class[int(classe_prediction)] # index among the registered classes -> class
+                    if cascade is None:
+                        current_data.record_prediction(predicted_class) # least recently used classes are evicted first
+                    if motion_gate is not None:
+                        T.metric("SKIP (%)", motion_gate.skip_rate, 100)
                     # headband, text and indicator
+                    cv_interface.draw_interface = not args.max_fps and (scheduler is None or scheduler.run("overlay"))
                     cv_interface.draw_headband()
                     T.tic()
-                    cv_interface.put_text(f"Object is from class : {classe_prediction}", 0.38)
+                    cv_interface.put_text(f"Object is from class : {predicted_class}", 0.38)
                     T.toc("TEXT")
                     cv_interface.draw_indicator(probas)
                     T.toc("INDICATORS")
@@ -254,12 +370,14 @@ def launch_demo(args):
                     current_data.reset()
                     cv_interface.reset_snapshot()
                     T.reset()
-                    if args.button == "pynq" or args.button == "keyboard-pynq":
+                    if args.button == "pynq" or args.button == "keyboard-pynq" or args.button == "simulated":
                         btn_manager.reset_button()
                     cv_interface.draw_interface = not args.max_fps
                     cv_interface.ERROR = False
                     cv_interface.empty_classe = []
                     probabilities = None
+                    if motion_gate is not None:
+                        motion_gate.reset()
                     next_state = "initialization"
                     # camera
                     if reset_camera:
@@ -304,7 +422,11 @@ def launch_demo(args):
                     T.display = True
                     registered_class = sorted(list(map(int, current_data.registered_classes))) # transform list of string into list of int, and sort in ascending order
                     nb_class = registered_class[-1]+1
-                    probas = nb_class*[0]
+                    probas = np.zeros(nb_class) # evicted classes keep a null probability
+                    if motion_gate is not None:
+                        motion_gate.reset()
+                    if background_classifier is not None:
+                        background_classifier.start(current_data.get_shot_list(), current_data.get_mean_features(), current_data.get_support_bank())
                     next_state = "inference"
 
                 ### PAUSE ###
@@ -336,6 +458,10 @@ def launch_demo(args):
                 else:
                     current_state = next_state
 
+                # the backbone is used by the main loop outside of the inference
+                if background_classifier is not None and not current_state=="inference":
+                    background_classifier.stop()
+
 
                 ###------# OUTPUTS #------###
                 # Add fps and clock on frame
@@ -359,8 +485,11 @@ def launch_demo(args):
                 else:
                     cv_interface.show()
 
+                if scheduler is not None:
+                    scheduler.end_frame(T.frame_columns) # only the stages that ran on this frame
 
             else:
+                time.sleep(0.01) # the inputs do not pace the loop anymore
                 if key == "p":
                     # Turn on the program
                     print("\n--- Turn on the demo ---")
@@ -376,9 +505,22 @@ def launch_demo(args):
 
     finally:
         # close all
+        if scheduler is not None:
+            scheduler.print_report(args.scheduler_report)
+        if cascade is not None:
+            cascade.print_report(args.cascade_report)
+        if background_classifier is not None:
+            background_classifier.stop()
+        if button_listener is not None:
+            button_listener.stop()
         cv_interface.close()
+        if args.backbone_process:
+            backbone.close()
         if args.hdmi_display:
             hdmi_out.close()
+        if recorded_frames:
+            np.save(args.record_frames, np.stack(recorded_frames, axis=0))
+            print(f"\n{len(recorded_frames)} frames saved in {args.record_frames}")
 
 
 if __name__ == "__main__":
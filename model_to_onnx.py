@@ -25,6 +25,11 @@ onnx.save(model_simp, path_model)
 
 If the model feature ReduceMean, use the function replace_reduce_mean.
 
+With --segments, the model is also exported as one graph per block (early exits, see
+backbone_loader/backbone_pytorch/segments.py) : {save_name}_exit1.onnx, {save_name}_exit2.onnx, ... each graph gives
+the feature map of the next graph (features_map) and the pooled features of its block (Output). The segments are
+meant for onnxruntime (BackboneOnnxSegmentsWrapper), their ReduceMean is kept.
+
 """
 
 import argparse
@@ -37,6 +42,7 @@ import numpy as np
 import warnings
 
 from backbone_loader.backbone_pytorch.model import get_model
+from backbone_loader.backbone_pytorch.segments import block_segments, segment_inputs
 
 
 def replace_reduce_mean(onnx_model):
@@ -149,49 +155,117 @@ def replace_reduce_mean(onnx_model):
     return onnx_model
 
 
-def model_to_onnx(args):
-    # create model path
-    # one model = sevral possible resolutions
-    # generate summary and save it
+def export_onnx(model, input_resolution, path_model, output_names="Output"):
+    """
+    export the model to onnx (opset 10 for tensil), replace ReduceMean with GlobalAveragePool
+    and simplify the graph
+    """
+    dummy_input = torch.randn(1, 3, input_resolution, input_resolution, device="cpu")
+    torch.onnx.export(model, dummy_input, path_model, verbose=False, opset_version=10, output_names=[output_names])
 
-    # handling path
-    model = get_model(args.backbone, args.input_model, args.use_strides)
+    #load onnx
+    onnx_model = onnx.load(path_model)
+    onnx_model = replace_reduce_mean(onnx_model)
+
+    # convert model
+    model_simp, check = simplify(onnx_model)
+    assert check, "Simplified ONNX model could not be validated"
+
+    onnx.save(model_simp, path_model)
+
+
+def export_variant(backbone, input_model, input_resolution, use_strides, save_name, parent_path, output_names="Output", fold_bn=False):
+    """
+    export one variant of the backbone (torchinfo summary and simplified onnx)
+    args :
+        - backbone, input_model, use_strides, fold_bn : see backbone_pytorch.model.get_model
+        - input_resolution (int) : resolution of the (squared) input
+        - save_name (str) : name of the saved model
+        - parent_path (Path) : directory of the onnx file (the summary is saved in parent_path/infos)
+    returns :
+        dict : path of the onnx and summary files, number of multiply-adds and parameters
+    """
+    model = get_model(backbone, input_model, use_strides, fold_bn=fold_bn)
 
-    parent_path = Path.cwd() / "onnx"
     parent_path.mkdir(parents=False, exist_ok=True)
     info_path = parent_path / "infos"
     info_path.mkdir(parents=False, exist_ok=True)
 
     # not sure it's needed, but it might be for uninitilized network
-    dummy_input = torch.randn(1, 3, args.input_resolution, args.input_resolution, device="cpu")
+    dummy_input = torch.randn(1, 3, input_resolution, input_resolution, device="cpu")
     _ = model(dummy_input)
 
-    ans=torchinfo.summary(model,(3,args.input_resolution,args.input_resolution),batch_dim = 0,verbose=0,device="cpu",col_names=
+    ans=torchinfo.summary(model,(3,input_resolution,input_resolution),batch_dim = 0,verbose=0,device="cpu",col_names=
         ["input_size",
         "output_size",
         "num_params",
         "kernel_size",
         "mult_adds"])
 
-    with open(info_path/ f"{args.save_name}_torchinfo.txt","w",encoding="utf-8") as file:
+    with open(info_path/ f"{save_name}_torchinfo.txt","w",encoding="utf-8") as file:
         to_write= str(ans)
         file.write(to_write)
-        print("Infos saved in: ", info_path/ f"{args.save_name}_torchinfo.txt")
+        print("Infos saved in: ", info_path/ f"{save_name}_torchinfo.txt")
 
     # generate onnx
-    path_model=parent_path/ f"{args.save_name}.onnx"
+    path_model=parent_path/ f"{save_name}.onnx"
     print("Model saved in: ",path_model)
-    torch.onnx.export(model, dummy_input, path_model, verbose=False, opset_version=10, output_names=[args.output_names])
+    export_onnx(model, input_resolution, path_model, output_names)
 
-    #load onnx
-    onnx_model = onnx.load(path_model)
-    onnx_model = replace_reduce_mean(onnx_model)
+    return {
+        "path": str(path_model),
+        "torchinfo": str(info_path/ f"{save_name}_torchinfo.txt"),
+        "macs": int(ans.total_mult_adds),
+        "params": int(ans.total_params),
+    }
 
-    # convert model
-    model_simp, check = simplify(onnx_model)
-    assert check, "Simplified ONNX model could not be validated"
 
-    onnx.save(model_simp, path_model)
+def export_segments(backbone, input_model, input_resolution, use_strides, save_name, parent_path, fold_bn=False):
+    """
+    export the model cut after each block, one onnx graph per segment
+    returns :
+        list of the paths of the segments, from the first block to the last one
+    """
+    model = get_model(backbone, input_model, use_strides, fold_bn=fold_bn)
+    segments = block_segments(model)
+    parent_path.mkdir(parents=False, exist_ok=True)
+    paths = []
+    for index, (segment, dummy_input) in enumerate(zip(segments, segment_inputs(segments, input_resolution))):
+        path_model = parent_path / f"{save_name}_exit{index + 1}.onnx"
+        segment.eval()
+        torch.onnx.export(segment, dummy_input, path_model, verbose=False, opset_version=10, output_names=["features_map", "Output"])
+        model_simp, check = simplify(onnx.load(path_model))
+        assert check, "Simplified ONNX model could not be validated"
+        onnx.save(model_simp, path_model)
+        print("Segment saved in: ", path_model)
+        paths.append(str(path_model))
+    return paths
+
+
+def model_to_onnx(args):
+    # create model path
+    # one model = sevral possible resolutions
+    # generate summary and save it
+    export_variant(
+        args.backbone,
+        args.input_model,
+        args.input_resolution,
+        args.use_strides,
+        args.save_name,
+        Path.cwd() / "onnx",
+        args.output_names,
+        fold_bn=args.fold_bn,
+    )
+    if args.segments:
+        export_segments(
+            args.backbone,
+            args.input_model,
+            args.input_resolution,
+            args.use_strides,
+            args.save_name,
+            Path.cwd() / "onnx",
+            fold_bn=args.fold_bn,
+        )
 
 if __name__ == "__main__":
     # Define the command line arguments for the script
@@ -202,6 +276,8 @@ if __name__ == "__main__":
     parser.add_argument("--output-names", default="Output", help="Name of the output layer")
     parser.add_argument("--save-name", required=True, default="mymodel", help="Name of the saved model")
     parser.add_argument("--use-strides", action="store_true", help="Use strides instead of maxpooling")
+    parser.add_argument("--fold-bn", action="store_true", help="Export the inference only model (batchnorms folded into the convolutions)")
+    parser.add_argument("--segments", action="store_true", help="Also export one graph per block (early exits)")
     args = parser.parse_args()
 
     model_to_onnx(args)
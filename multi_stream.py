@@ -0,0 +1,240 @@
+"""
+Serve several camera streams (or video files) with one backbone.
+
+Each stream has its own few shot state (DataFewShot, moving average of the probabilities). The frames of all the
+streams are gathered into batches for the shared backbone : a batch is closed when it is full (--max-batch) or when
+--deadline-ms passed since its first frame. A stream gives a new frame only once its previous frame is classified
+(the frames read in between are dropped), so a slow backbone does not accumulate latency.
+
+The first --init-frames frames of each stream give its mean features (as the initialization of the demo), the shots
+are loaded from an image folder (one sub folder per class), shared by all the streams or one per stream.
+
+python3 multi_stream.py --framework pytorch --path-pytorch-weight ../resnet9_strided_16fmaps.pt --sources 0 1 video.mp4 --support-dirs ../images --duration 60
+
+The throughput (classified and dropped frames per second), latency (capture to classification) and mean batch size
+are reported per stream and in aggregate.
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+
+from args import create_args, check_precision, framework_choice, args_treatement
+from backbone_loader.backbone_loader import get_model
+from backbone_loader.batching import batched_call, gather_batch
+from backbone_loader.preprocessing import preprocess
+from few_shot_model.data_few_shot import DataFewShot
+from few_shot_model.evaluation import load_image_folder
+from few_shot_model.few_shot_model import FewShotModel
+
+
+class StreamReader(threading.Thread):
+    """
+    read the frames of a source (camera id or video file) in a thread and give them to the output queue
+    attributes :
+        pending : set while a frame of the stream waits for its classification
+        frames_read, frames_dropped : counters
+    """
+
+    def __init__(self, stream_id, source, resolution, output_queue, loop=False):
+        super().__init__(daemon=True)
+        self.stream_id = stream_id
+        self.source = source
+        self.resolution = resolution
+        self.output_queue = output_queue
+        self.loop = loop
+        self.pending = threading.Event()
+        self.stopped = threading.Event()
+        self.frames_read = 0
+        self.frames_dropped = 0
+
+    def run(self):
+        is_camera = self.source.isdigit()
+        video_capture = cv2.VideoCapture(int(self.source) if is_camera else self.source)
+        # video files are read at their frame rate, as a camera
+        period = 0 if is_camera else 1 / (video_capture.get(cv2.CAP_PROP_FPS) or 30)
+        next_time = time.time()
+        while not self.stopped.is_set():
+            ok, frame = video_capture.read()
+            if not ok:
+                if self.loop and not is_camera and self.frames_read > 0:
+                    video_capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                break
+            self.frames_read += 1
+            if self.pending.is_set():
+                self.frames_dropped += 1
+            else:
+                self.pending.set()
+                frame = cv2.resize(frame, dsize=self.resolution, interpolation=cv2.INTER_LINEAR)
+                self.output_queue.put((self.stream_id, frame, time.time()))
+            if period:
+                next_time += period
+                time.sleep(max(0, next_time - time.time()))
+        video_capture.release()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class StreamState:
+    """
+    few shot state of one stream
+    """
+
+    def __init__(self, shots, init_frames):
+        self.data = DataFewShot(len(shots))
+        for classe, shot in enumerate(shots):
+            self.data.add_repr(classe, shot)
+        self.init_frames = init_frames
+        self.number_init = 0
+        self.probabilities = None
+        self.prediction = None
+        self.classified = 0
+        self.latencies = []
+
+    def update(self, few_shot_model, features, capture_time):
+        """
+        add the features to the mean features during the initialization, classify them afterwards
+        """
+        if self.number_init < self.init_frames:
+            self.data.add_mean_repr(features)
+            self.number_init += 1
+            if self.number_init == self.init_frames:
+                self.data.aggregate_mean_rep()
+            return
+        self.prediction, self.probabilities = few_shot_model.predict_class_moving_avg(
+            features,
+            self.probabilities,
+            self.data.get_shot_list(),
+            self.data.get_mean_features(),
+            support_bank=self.data.get_support_bank(),
+        )
+        self.classified += 1
+        self.latencies.append(time.time() - capture_time)
+
+
+def load_shots(backbone, support_dir, resolution):
+    """
+    features of the images of the folder, one array per class
+    """
+    images, labels, class_names = load_image_folder(support_dir, resolution)
+    features = batched_call(backbone, np.concatenate([preprocess(img) for img in images], axis=0))
+    print(f"{support_dir} : {len(images)} shots of {len(class_names)} classes {class_names}")
+    return [features[labels == label] for label in range(len(class_names))]
+
+
+def latency_stats(latencies):
+    if len(latencies) == 0:
+        return {"mean_latency_ms": 0, "p90_latency_ms": 0}
+    latencies = 1000 * np.array(latencies)
+    return {"mean_latency_ms": float(latencies.mean()), "p90_latency_ms": float(np.percentile(latencies, 90))}
+
+
+def multi_stream(args):
+    backbone = get_model(args.backbone_specs)
+    few_shot_model = FewShotModel(args.classifier_specs)
+    if len(args.support_dirs) not in (1, len(args.sources)):
+        raise ValueError("give one support folder shared by all the streams or one per stream")
+    support_dirs = args.support_dirs * len(args.sources) if len(args.support_dirs) == 1 else args.support_dirs
+    shots_cache = {}
+    states = []
+    for support_dir in support_dirs:
+        if support_dir not in shots_cache:
+            shots_cache[support_dir] = load_shots(backbone, support_dir, args.resolution_input)
+        states.append(StreamState(shots_cache[support_dir], args.init_frames))
+
+    frames_queue = queue.Queue()
+    readers = [
+        StreamReader(stream_id, source, args.resolution_input, frames_queue, loop=args.loop)
+        for stream_id, source in enumerate(args.sources)
+    ]
+    for reader in readers:
+        reader.start()
+
+    max_batch_size = args.max_batch or len(readers)
+    batch_sizes = []
+    start = time.time()
+    last_print = start
+    try:
+        while time.time() - start < args.duration:
+            batch = gather_batch(frames_queue, max_batch_size, args.deadline_ms / 1000)
+            if len(batch) == 0:
+                if not any(reader.is_alive() for reader in readers):
+                    break
+                continue
+            stream_ids, frames, capture_times = zip(*batch)
+            features = batched_call(backbone, np.concatenate([preprocess(frame) for frame in frames], axis=0))
+            batch_sizes.append(len(batch))
+            for index, stream_id in enumerate(stream_ids):
+                states[stream_id].update(few_shot_model, features[index : index + 1], capture_times[index])
+                readers[stream_id].pending.clear()
+
+            if time.time() - last_print > 1:
+                last_print = time.time()
+                print("\r" + " | ".join(f"stream {i} : {state.prediction}" for i, state in enumerate(states)), end="")
+    finally:
+        for reader in readers:
+            reader.stop()
+        for reader in readers:
+            reader.join()
+    elapsed = time.time() - start
+    print("")
+
+    report = {"streams": []}
+    print(f"{'stream':>6} | {'source':>12} | {'fps':>7} | {'dropped/s':>9} | {'mean ms':>8} | {'p90 ms':>8} | prediction")
+    for stream_id, (reader, state) in enumerate(zip(readers, states)):
+        stream = {
+            "source": reader.source,
+            "fps": state.classified / elapsed,
+            "dropped_per_second": reader.frames_dropped / elapsed,
+            "prediction": None if state.prediction is None else int(state.prediction),
+        }
+        stream.update(latency_stats(state.latencies))
+        report["streams"].append(stream)
+        print(
+            f"{stream_id:>6} | {reader.source[-12:]:>12} | {stream['fps']:7.1f} | {stream['dropped_per_second']:9.1f} | "
+            f"{stream['mean_latency_ms']:8.2f} | {stream['p90_latency_ms']:8.2f} | {stream['prediction']}"
+        )
+    report["aggregate"] = {
+        "fps": sum(stream["fps"] for stream in report["streams"]),
+        "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes else 0,
+        "backbone_calls_per_second": len(batch_sizes) / elapsed,
+    }
+    report["aggregate"].update(latency_stats([latency for state in states for latency in state.latencies]))
+    aggregate = report["aggregate"]
+    print(
+        f"Aggregate : {aggregate['fps']:.1f} fps, mean batch size {aggregate['mean_batch_size']:.2f}, "
+        f"{aggregate['backbone_calls_per_second']:.1f} backbone calls/s, latency {aggregate['mean_latency_ms']:.2f} ms "
+        f"(p90 {aggregate['p90_latency_ms']:.2f} ms)"
+    )
+
+    if args.output_json is not None:
+        with open(args.output_json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+        print("Report saved in: ", args.output_json)
+    return report
+
+
+if __name__ == "__main__":
+    # backbone and classifier arguments of the demo, and the arguments of the streams
+    parser = argparse.ArgumentParser(description="Serve several streams with one backbone")
+    create_args(parser)
+    parser.add_argument("--sources", type=str, nargs="+", required=True, help="Camera ids or video files, one per stream")
+    parser.add_argument("--support-dirs", type=str, nargs="+", required=True, help="Image folders of the shots (one sub folder per class), shared by all the streams or one per stream")
+    parser.add_argument("--init-frames", type=int, default=5, help="Number of frames of each stream giving its mean features")
+    parser.add_argument("--max-batch", type=int, default=None, help="Maximum number of frames per backbone call (default : number of streams)")
+    parser.add_argument("--deadline-ms", type=float, default=10, help="Maximum time waited for the other streams after the first frame of a batch")
+    parser.add_argument("--duration", type=float, default=60, help="Duration of the run in seconds (stops earlier when all the video files ended)")
+    parser.add_argument("--loop", action="store_true", help="Loop the video files")
+    parser.add_argument("--output-json", type=str, default=None, help="Save the report in a json file")
+    args = parser.parse_args()
+    check_precision(parser, args)
+    framework_choice(args)
+    args_treatement(args)
+
+    multi_stream(args)
@@ -1,129 +1,357 @@
 """
 Compile all models using tensil package, user_specified architecture and onnx
 Save :
-    - logs of the compilation in a csv file
-    - tensil model files (.tmodel, .tarch, .tdata)
+    - logs of the compilation in a txt file, and the parsed summaries in a json file (see tensil_summary.py)
+    - tensil model files (.tmodel, .tprog, .tdata) and rtl files
+
+Compilations are cached : the key of a compilation is the hash of the onnx graph, of the .tarch and of the
+compiler version. On a hit, the artifacts are copied from the cache without running tensil.
+Several onnx files can be given, they are compiled concurrently (--workers).
+
+The compiler is pluggable : tensil can be ran through docker (default) or with a local command
+(--compiler local --tensil-command "tensil"), which can also be a fake compiler for testing.
 """
 
-import docker
-import os
 import argparse
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from tensil_summary import parse_summary
+
+TENSIL_IMAGE = "tensilai/tensil:latest"
+# files produced by tensil which are kept in the cache
+ARTIFACT_EXTENSIONS = (".tmodel", ".tprog", ".tdata", ".txt", ".v", ".sv", ".tcl", ".json")
+
+
+class CompilationError(RuntimeError):
+    """
+    raised when tensil fails, logs contains the output of the compiler
+    """
+
+    def __init__(self, message, logs=b""):
+        super().__init__(message)
+        self.logs = logs
+
 
-def move_file(compiled_model_name, output_path):
+class DockerTensilCompiler:
     """
-    Move tmodel, tprog and tdata to the specified directory
-    Args :
-        - compiled_model_name (str) : *_onnx_{arch}, correspond to output of tensil
+    run tensil in the docker image (the working directory is mounted on /work)
     """
-    print("Moving file...")
 
-    print(os.getcwd())
-    print(compiled_model_name)
+    def __init__(self, image=TENSIL_IMAGE):
+        import docker
+
+        try:
+            self.client = docker.from_env()
+        except docker.errors.DockerException as er:
+            raise docker.errors.DockerException("Error when initializing docker client, maybe it's not launch ?") from er
+        self.image = image
+
+    def version(self):
+        """
+        id of the docker image (changes when the image is updated), the image is pulled if it is not available
+        """
+        import docker
+
+        try:
+            return self.client.images.get(self.image).id
+        except docker.errors.ImageNotFound:
+            print(f"Pulling {self.image}...")
+            return self.client.images.pull(self.image).id
+
+    def run(self, command, working_dir):
+        """
+        run a tensil command (ex : ["tensil", "compile", ...]) in working_dir, return the logs (bytes)
+        """
+        import docker
+
+        try:
+            return self.client.containers.run(
+                self.image,
+                command,
+                volumes=[os.path.abspath(working_dir) + ":/work"],
+                working_dir="/work",
+                stderr=True,
+            )
+        except docker.errors.ContainerError as exc:
+            raise CompilationError(f"{' '.join(command[:2])} failed", exc.container.logs()) from exc
+
+
+class LocalTensilCompiler:
+    """
+    run tensil with a local command, the first element of the tensil command is replaced by tensil_command
+    (ex : ["tensil"], or ["python3", "fake_tensil.py"] to test without the compiler)
+    """
+
+    def __init__(self, tensil_command=("tensil",), version=None):
+        self.tensil_command = list(tensil_command)
+        self._version = version
+
+    def version(self):
+        """
+        given version, or hash of the executable (changes when the compiler is updated)
+        """
+        if self._version is not None:
+            return self._version
+        digest = hashlib.sha256(" ".join(self.tensil_command).encode("utf-8"))
+        for element in self.tensil_command:
+            path = shutil.which(element) or (element if os.path.isfile(element) else None)
+            if path is not None:
+                digest.update(hash_file(path).encode("utf-8"))
+        return digest.hexdigest()
+
+    def run(self, command, working_dir):
+        """
+        run a tensil command (ex : ["tensil", "compile", ...]) in working_dir, return the logs (bytes)
+        """
+        result = subprocess.run(
+            self.tensil_command + command[1:],
+            cwd=working_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        if result.returncode != 0:
+            raise CompilationError(f"{' '.join(command[:2])} failed", result.stdout)
+        return result.stdout
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """
+    sha256 of the content of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compilation_key(onnx_path, arch_path, compiler_version, options):
+    """
+    key of a compilation : hash of the onnx graph, of the architecture, of the compiler version and of the options
+    """
+    content = json.dumps(
+        {
+            "onnx": hash_file(onnx_path),
+            "arch": hash_file(arch_path),
+            "compiler": compiler_version,
+            "options": options,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class CompilationCache:
+    """
+    content addressed directory : root/<key>/ contains the artifacts of one compilation
+    and a manifest.json listing them (written last, a directory without manifest is not a hit)
+    """
 
-    compiled_model_name = compiled_model_name.replace("-", "_")
-    print(compiled_model_name)
-    # Moving Compiled model
-    try :
-        os.rename(compiled_model_name + ".tmodel", output_path + compiled_model_name + ".tmodel")
-    except :
-        print("No tmodel file")
-    try :
-        os.rename(compiled_model_name + ".tprog", output_path + compiled_model_name + ".tprog")
-    except :
-        print("No tprog file")
-    try :
-        os.rename(compiled_model_name + ".tdata", output_path + compiled_model_name + ".tdata")
-    except :
-        print("No tdata file")
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def lookup(self, key):
+        """
+        list of the cached artifacts of the key, None if the compilation is not cached
+        """
+        manifest = self.root / key / "manifest.json"
+        if not manifest.exists():
+            return None
+        with open(manifest, "r", encoding="utf-8") as file:
+            return [self.root / key / name for name in json.load(file)["artifacts"]]
+
+    def store(self, key, job_dir, artifacts):
+        """
+        move the artifacts of a finished compilation into the cache, return their cached path
+        """
+        with open(Path(job_dir) / "manifest.json", "w", encoding="utf-8") as file:
+            json.dump({"artifacts": [path.name for path in artifacts]}, file, indent=4)
+        try:
+            os.rename(job_dir, self.root / key)
+        except OSError:
+            # the same compilation finished concurrently, keep the first one
+            shutil.rmtree(job_dir, ignore_errors=True)
+        return self.lookup(key)
 
 
 def save_compilation_result(logs, name, path):
     """
-    Save the logs in a csv file
+    Save the logs in a txt file
     """
-    print("logs in:", path+name+".txt")
+    path = Path(path) / (name + ".txt")
+    print("logs in:", path)
 
-    with open(path+name+".txt","wb") as file:
+    with open(path, "wb") as file:
         file.write(logs)
+    return path
 
 
-def onnx_to_tensil(args):
-    # Create output directory
-    if not os.path.exists(args.output_dir):
-        os.makedirs(args.output_dir)
+def run_tensil(onnx_path, arch_path, job_dir, compiler, onnx_output="Output", rtl=True):
+    """
+    compile the onnx model (and generate the rtl) in job_dir, return the list of artifacts
+    the onnx and tarch are copied in job_dir, so every compilation is isolated
+    """
+    name_net = Path(onnx_path).stem
+    shutil.copy(onnx_path, Path(job_dir) / Path(onnx_path).name)
+    shutil.copy(arch_path, Path(job_dir) / Path(arch_path).name)
+    inputs = {Path(onnx_path).name, Path(arch_path).name}
 
-    # Network Compilation
+    # -a : architecture
+    # -m : onnx model
+    # -v  : verbose
 
-    pwd = os.getcwd()
+    # additional summary (all default to true):
+    # -s : print summary
+    # --layers-summary
+    # --scheduler-summary
+    # --partition-summary
+    # --strides-summary
+    # --instructions-summary
+    summary_flags=["-s", "true","--layers-summary","true","--scheduler-summary","true","--partitions-summary","true","--strides-summary","true","--instructions-summary","true"]
     try:
-        client = docker.from_env()
-    except docker.errors.DockerException as er:
-        raise docker.errors.DockerException("Error when initializing docker client, maybe it's not launch ?") from er#
-    
-    name_net = args.onnx_path.stem
-    try:
-        # -a : architecture
-        # -m : onnx model
-        # -v  : verbose
-
-        # additional summary (all default to true):
-        # -s : print summary
-        # --layers-summary
-        # --scheduler-summary
-        # --partition-summary
-        # --strides-summary
-        # --instructions-summary
-
-        print("Tensil compiling...")
-        summary_flags=["-s", "true","--layers-summary","true","--scheduler-summary","true","--partitions-summary","true","--strides-summary","true","--instructions-summary","true"]
-        log_compile = client.containers.run("tensilai/tensil:latest",
-                                            ["tensil", "compile", "-a", args.arch_path, "-m", args.onnx_path.as_posix(),
-                                            "-o", args.onnx_output, "-t", args.output_dir]+summary_flags,
-                                            volumes=[pwd + ":/work"],
-                                            working_dir="/work",
-                                            stderr=True)
-    
-        print("Tensil rtl generation...")
-        log_rtl = client.containers.run("tensilai/tensil:latest",
-                                        ["tensil", "rtl", "-a", args.arch_path, "-d", "64", "-t", args.output_dir, "-s", "true" ],
-                                        volumes=[pwd + ":/work"],
-                                        working_dir="/work",
-                                        stderr=True)
-        
-        save_compilation_result(log_rtl, name_net+"_rtl", args.output_dir)
-        save_compilation_result(log_compile, name_net, args.output_dir)
+        print(f"Tensil compiling {name_net}...")
+        log_compile = compiler.run(
+            ["tensil", "compile", "-a", Path(arch_path).name, "-m", Path(onnx_path).name, "-o", onnx_output, "-t", "."] + summary_flags,
+            job_dir,
+        )
+    except CompilationError as exc:
+        save_compilation_result(exc.logs, name_net, job_dir)
+        raise
+    save_compilation_result(log_compile, name_net, job_dir)
+    with open(Path(job_dir) / f"{name_net}_summary.json", "w", encoding="utf-8") as file:
+        json.dump(parse_summary(log_compile), file, indent=4)
 
-        print("---------------------------------------")
-        print("---------------------------------------")
-        print("---------------------------------------")
-        print("------ Compilation successful !! ------")
-        print("---------------------------------------")
-        print("---------------------------------------")
-        print("---------------------------------------")
+    if rtl:
+        print(f"Tensil rtl generation {name_net}...")
+        log_rtl = compiler.run(["tensil", "rtl", "-a", Path(arch_path).name, "-d", "64", "-t", ".", "-s", "true"], job_dir)
+        save_compilation_result(log_rtl, name_net + "_rtl", job_dir)
 
-    except docker.errors.ContainerError as exc:
-        with open(args.output_dir + name_net + ".txt","wb") as file:
-            file.write(exc.container.logs())
-        print("---------------------------------------")
-        print("---------------------------------------")
-        print("---------------------------------------")
-        print("------ Compilation unsuccessful -------")
-        print("------ Error was : --------------------")
-        print("---------------------------------------")
-        print("---------------------------------------")
-        print(exc.container.logs())
+    artifacts = [
+        path
+        for path in sorted(Path(job_dir).iterdir())
+        if path.is_file() and path.name not in inputs and path.suffix in ARTIFACT_EXTENSIONS
+    ]
+    if not any(path.suffix == ".tmodel" for path in artifacts):
+        raise CompilationError(f"tensil did not produce a .tmodel for {name_net}", log_compile)
+    return artifacts
+
+
+def compile_model(onnx_path, arch_path, output_dir, compiler, cache=None, onnx_output="Output", rtl=True):
+    """
+    compile one model, using the cache if possible, and copy the artifacts to output_dir
+    returns :
+        dict : name of the model, key, is it a cache hit, path of the artifacts in output_dir
+    """
+    name_net = Path(onnx_path).stem
+    # the name of the network is part of the key since tensil names the artifacts after it
+    options = {"name": name_net, "onnx_output": onnx_output, "rtl": rtl}
+    key = compilation_key(onnx_path, arch_path, compiler.version(), options)
+
+    cached = cache.lookup(key) if cache is not None else None
+    hit = cached is not None
+    if not hit:
+        job_root = cache.root if cache is not None else Path(output_dir)
+        job_dir = tempfile.mkdtemp(prefix=f"{key[:16]}-", dir=job_root)
+        try:
+            artifacts = run_tensil(onnx_path, arch_path, job_dir, compiler, onnx_output, rtl)
+        except CompilationError:
+            # keep the logs of the failed compilation next to the other results
+            for log in Path(job_dir).glob("*.txt"):
+                shutil.copy(log, Path(output_dir) / log.name)
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        if cache is not None:
+            cached = cache.store(key, job_dir, artifacts)
+        else:
+            cached = artifacts
+
+    outputs = []
+    for path in cached:
+        # tensil writes "-" as "_" in the name of the compiled model
+        destination = Path(output_dir) / path.name.replace("-", "_")
+        shutil.copy(path, destination)
+        outputs.append(destination)
+    if cache is None and not hit:
+        shutil.rmtree(job_dir, ignore_errors=True)
+    print(f"{name_net} : {'cache hit' if hit else 'compiled'} ({key[:16]})")
+    return {"name": name_net, "key": key, "cached": hit, "artifacts": outputs}
+
+
+def compile_many(onnx_paths, arch_path, output_dir, compiler, cache=None, onnx_output="Output", rtl=True, max_workers=2):
+    """
+    compile several models concurrently (at most max_workers tensil processes at the same time)
+    returns :
+        list of (onnx path, result of compile_model or the exception raised by the compilation)
+    a failed compilation (tensil error, docker api error, file error...) does not stop the others
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    def job(onnx_path):
+        try:
+            return compile_model(onnx_path, arch_path, output_dir, compiler, cache, onnx_output, rtl)
+        except Exception as exc:
+            return exc
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(job, onnx_paths))
+    return list(zip(onnx_paths, results))
+
+
+def onnx_to_tensil(args):
+    if args.compiler == "docker":
+        compiler = DockerTensilCompiler()
+    else:
+        compiler = LocalTensilCompiler(shlex.split(args.tensil_command))
+    cache = None if args.no_cache else CompilationCache(args.cache_dir)
+
+    results = compile_many(
+        args.onnx_path,
+        args.arch_path,
+        args.output_dir,
+        compiler,
+        cache,
+        args.onnx_output,
+        rtl=not args.no_rtl,
+        max_workers=args.workers,
+    )
+
+    for onnx_path, result in results:
         print("---------------------------------------")
+        if isinstance(result, Exception):
+            print(f"------ Compilation of {onnx_path.stem} unsuccessful -------")
+            print("------ Error was : --------------------")
+            if isinstance(result, CompilationError):
+                print(result.logs.decode("utf-8", errors="replace"))
+            else:
+                print(f"{type(result).__name__}: {result}")
+        else:
+            print(f"------ Compilation of {onnx_path.stem} successful ({'cached' if result['cached'] else 'compiled'}) !! ------")
+    print("---------------------------------------")
+    return results
 
 
 if __name__ == "__main__":
     # Define the command line arguments for the script
     parser = argparse.ArgumentParser()
-    parser.add_argument('--onnx-path', type=Path, required=True, help='path to onnx file')
+    parser.add_argument('--onnx-path', type=Path, nargs="+", required=True, help='path to onnx file(s)')
     parser.add_argument('--arch-path', type=str, default= "arch/custom_perf.tarch", help='path to tensil architecture file')
     parser.add_argument('--output-dir', type=str, default= "tensil/", help='path to script output directory')
     parser.add_argument('--onnx-output', type=str, default= "Output", help='name of the onnx output layer (better to keep default) (default = Output)')
+    parser.add_argument('--cache-dir', type=str, default= "tensil/cache", help='directory of the compilation cache')
+    parser.add_argument('--no-cache', action="store_true", help='always compile, without reading or writing the cache')
+    parser.add_argument('--no-rtl', action="store_true", help='do not generate the rtl files')
+    parser.add_argument('--workers', type=int, default=2, help='maximum number of concurrent compilations')
+    parser.add_argument('--compiler', type=str, default="docker", choices=["docker", "local"], help='run tensil with docker or with a local command')
+    parser.add_argument('--tensil-command', type=str, default="tensil", help='tensil command of the local compiler')
     args = parser.parse_args()
 
-    onnx_to_tensil(args)
\ No newline at end of file
+    onnx_to_tensil(args)
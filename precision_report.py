@@ -0,0 +1,132 @@
+"""
+Compare the numeric precisions of a backbone against the fp32 reference.
+
+For each precision mode, report :
+    - the drift of the features (relative l2 error, cosine similarity, max absolute error)
+    - the few shot accuracy on an image folder (one sub folder per class), on the same episodes for all modes
+    - the latency of one backbone call (batch of one image, as in the demo)
+
+Example :
+
+python3 precision_report.py --framework pytorch --backbone resnet9 --path-pytorch-weight ../resnet9_strided_16fmaps.pt --dataset ../images
+python3 precision_report.py --framework onnx --path-onnx ../resnet9_strided_16fmaps.onnx --dataset ../images --modes fp32 fp16 int8
+
+The tensil_sim mode (onnx framework) simulates the fixed point inference of the tensil architecture (--path-tarch),
+without the board :
+python3 precision_report.py --framework onnx --path-onnx ../resnet9_strided_16fmaps.onnx --dataset ../images --modes fp32 tensil_sim --batch-size 64
+
+"""
+
+import argparse
+import json
+
+from backbone_loader.backbone_loader import get_model
+from backbone_loader.preprocessing import preprocess
+from few_shot_model.evaluation import (
+    load_image_folder,
+    extract_features,
+    sample_episodes,
+    few_shot_accuracy,
+    feature_drift,
+    measure_latency,
+)
+
+DEFAULT_MODES = {"pytorch": ["fp32", "fp16", "bf16"], "onnx": ["fp32", "fp16", "int8", "tensil_sim"]}
+
+
+def get_backbone_specs(args, precision):
+    """
+    backbone specification of the given precision (same format as args.framework_choice)
+    """
+    if args.framework == "pytorch":
+        return {
+            "type": "pytorch",
+            "device": args.device_pytorch,
+            "model_name": args.backbone,
+            "weight": args.path_pytorch_weight,
+            "use_strides": not args.no_strides,
+            "precision": precision,
+        }
+    if precision == "tensil_sim":
+        return {"type": "tensil_sim", "path_onnx": args.path_onnx, "path_tarch": args.path_tarch}
+    return {"type": "onnx", "path_onnx": args.path_onnx, "precision": precision}
+
+
+def precision_report(args):
+    resolution = (args.resolution_input, args.resolution_input)
+    images, labels, _ = load_image_folder(args.dataset, resolution, args.max_per_class)
+    episodes = sample_episodes(
+        labels, args.n_ways, args.n_shots, args.n_queries, args.n_episodes, seed=args.seed
+    )
+    classifier_specs = {"model_name": args.classifier_type}
+    if args.classifier_type == "knn":
+        classifier_specs["kwargs"] = {"number_neighboors": args.number_neiboors}
+
+    modes = args.modes or DEFAULT_MODES[args.framework]
+    if "fp32" not in modes:
+        modes = ["fp32"] + modes
+
+    reference = None
+    results = []
+    for mode in modes:
+        try:
+            backbone = get_model(get_backbone_specs(args, mode))
+        except NotImplementedError as error:
+            print(f"{mode} : {error}")
+            results.append({"precision": mode, "error": str(error)})
+            continue
+        # the onnx runtime wrapper only takes batches of one image
+        batch_size = args.batch_size if mode == "tensil_sim" else 1
+        features = extract_features(backbone, images, batch_size=batch_size)
+        if reference is None:
+            reference = features
+        result = {"precision": mode}
+        result.update(feature_drift(features, reference))
+        result["accuracy"] = float(few_shot_accuracy(features, episodes, classifier_specs))
+        result.update(measure_latency(backbone, preprocess(images[0]), n_runs=args.n_runs))
+        results.append(result)
+
+    print(f"{'precision':>10} | {'rel l2':>8} | {'cosine':>8} | {'max abs':>8} | {'accuracy':>8} | {'mean ms':>8} | {'p90 ms':>8}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['precision']:>10} | not supported")
+            continue
+        print(
+            f"{result['precision']:>10} | {result['relative_l2']:8.5f} | {result['cosine']:8.5f} | "
+            f"{result['max_abs']:8.5f} | {100 * result['accuracy']:7.2f}% | {result['mean_ms']:8.3f} | {result['p90_ms']:8.3f}"
+        )
+
+    if args.output_json is not None:
+        with open(args.output_json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+        print("Report saved in: ", args.output_json)
+    return results
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--framework", type=str, required=True, choices=["pytorch", "onnx"], help="Framework of the backbone")
+    parser.add_argument("--modes", type=str, nargs="+", default=None, help="Precisions to compare (default : every precision supported by the framework)")
+    parser.add_argument("--backbone", type=str, default="resnet9", choices=["resnet9", "resnet12"], help="Specification of the model (pytorch)")
+    parser.add_argument("--path-pytorch-weight", type=str, default="../resnet9_strided_16fmaps.pt", help="Path of the pytorch weight")
+    parser.add_argument("--no-strides", action="store_true", help="Use maxpooling instead of strides (pytorch)")
+    parser.add_argument("--device-pytorch", type=str, default="cpu", help="Device on which the backbone will be run (pytorch)")
+    parser.add_argument("--path-onnx", type=str, default="../resnet9_strided_16fmaps.onnx", help="Path of the .onnx file")
+    parser.add_argument("--path-tarch", type=str, default="arch/custom_perf.tarch", help="Tensil architecture simulated by the tensil_sim mode (onnx)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Batch size of the tensil_sim mode")
+    parser.add_argument("--dataset", type=str, required=True, help="Image folder, one sub folder per class")
+    parser.add_argument("--max-per-class", type=int, default=None, help="Maximum number of images loaded per class")
+    parser.add_argument("--resolution-input", type=int, default=32, help="Resolution of the input image")
+    parser.add_argument("--classifier-type", type=str, default="ncm", choices=["ncm", "knn"], help="Type of classifier")
+    parser.add_argument("--number-neiboors", type=int, default=5, help="Number of neiboors for knn classifier")
+    parser.add_argument("--n-ways", type=int, default=4, help="Number of classes per episode")
+    parser.add_argument("--n-shots", type=int, default=5, help="Number of shots per class")
+    parser.add_argument("--n-queries", type=int, default=5, help="Number of queries per class")
+    parser.add_argument("--n-episodes", type=int, default=200, help="Number of episodes")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the episodes")
+    parser.add_argument("--n-runs", type=int, default=50, help="Number of backbone calls to measure latency")
+    parser.add_argument("--output-json", type=str, default=None, help="Save the report in a json file")
+    args = parser.parse_args()
+
+    precision_report(args)
@@ -0,0 +1,119 @@
+"""
+Accuracy versus dimension of the projected features (few_shot_model/projection.py).
+
+The features of an image folder (one sub folder per class) are extracted once, the projections (pca fitted on
+--n-fit images, random orthogonal) are applied for each dimension, and the report gives :
+    - the few shot accuracy of each classifier, on the same episodes for all dimensions
+    - the latency of the knn against a support bank of --bank-size shots, and the memory of the bank
+
+Example :
+
+python3 projection_report.py --framework pytorch --backbone resnet9 --path-pytorch-weight ../resnet9_strided_16fmaps.pt --dataset ../images --dims 8 16 32 64
+
+The fitted projections can be saved (--save-projection) and given to the demo with --projection-path.
+"""
+
+import argparse
+import json
+import numpy as np
+
+from backbone_loader.backbone_loader import get_model
+from few_shot_model.evaluation import (
+    load_image_folder,
+    extract_features,
+    sample_episodes,
+    few_shot_accuracy,
+    measure_latency,
+)
+from few_shot_model.few_shot_model import knn
+from few_shot_model.projection import FeatureProjection, PROJECTIONS
+from precision_report import get_backbone_specs
+
+
+def bank_cost(number_features, bank_size, number_neighboors, n_runs, seed=0):
+    """
+    latency of the knn of one query against a bank of bank_size shots, and memory of the bank (fp32)
+    """
+    rng = np.random.default_rng(seed)
+    bank = rng.standard_normal((bank_size, number_features)).astype(np.float32)
+    query = rng.standard_normal((1, number_features)).astype(np.float32)
+    targets = np.arange(bank_size) % 10
+    latency = measure_latency(knn, bank, query, targets, number_neighboors, n_runs=n_runs)
+    return {"knn_ms": latency["mean_ms"], "bank_kb": bank.nbytes / 1024}
+
+
+def projection_report(args):
+    resolution = (args.resolution_input, args.resolution_input)
+    images, labels, _ = load_image_folder(args.dataset, resolution, args.max_per_class)
+    episodes = sample_episodes(labels, args.n_ways, args.n_shots, args.n_queries, args.n_episodes, seed=args.seed)
+    backbone = get_model(get_backbone_specs(args, "fp32"))
+    features = extract_features(backbone, images)
+    number_features = features.shape[-1]
+    fit_indices = np.random.default_rng(args.seed).permutation(len(features))[: args.n_fit]
+
+    classifiers = {}
+    for classifier in args.classifiers:
+        classifiers[classifier] = {"model_name": classifier}
+        if classifier == "knn":
+            classifiers[classifier]["kwargs"] = {"number_neighboors": args.number_neiboors}
+
+    configurations = [("none", number_features)]
+    configurations += [(method, dim) for method in args.methods for dim in args.dims if dim < number_features]
+    results = []
+    for method, dim in configurations:
+        projected = features
+        if method != "none":
+            projection = FeatureProjection(method, dim, seed=args.seed).fit(features[fit_indices])
+            projected = projection(features)
+            if args.save_projection is not None:
+                projection.save(f"{args.save_projection}_{method}_{dim}.npz")
+        result = {"projection": method, "dim": dim}
+        for classifier, classifier_specs in classifiers.items():
+            result[f"accuracy_{classifier}"] = float(few_shot_accuracy(projected, episodes, classifier_specs))
+        result.update(bank_cost(dim, args.bank_size, args.number_neiboors, args.n_runs))
+        results.append(result)
+
+    header = " | ".join(f"{'acc ' + classifier:>9}" for classifier in classifiers)
+    print(f"{'projection':>10} | {'dim':>5} | {header} | {'knn ms':>7} | {'bank kb':>8}")
+    for result in results:
+        accuracies = " | ".join(f"{100 * result['accuracy_' + classifier]:8.2f}%" for classifier in classifiers)
+        print(
+            f"{result['projection']:>10} | {result['dim']:5d} | {accuracies} | {result['knn_ms']:7.3f} | {result['bank_kb']:8.1f}"
+        )
+
+    if args.output_json is not None:
+        with open(args.output_json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+        print("Report saved in: ", args.output_json)
+    return results
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--framework", type=str, required=True, choices=["pytorch", "onnx"], help="Framework of the backbone")
+    parser.add_argument("--backbone", type=str, default="resnet9", choices=["resnet9", "resnet12"], help="Specification of the model (pytorch)")
+    parser.add_argument("--path-pytorch-weight", type=str, default="../resnet9_strided_16fmaps.pt", help="Path of the pytorch weight")
+    parser.add_argument("--no-strides", action="store_true", help="Use maxpooling instead of strides (pytorch)")
+    parser.add_argument("--device-pytorch", type=str, default="cpu", help="Device on which the backbone will be run (pytorch)")
+    parser.add_argument("--path-onnx", type=str, default="../resnet9_strided_16fmaps.onnx", help="Path of the .onnx file")
+    parser.add_argument("--dataset", type=str, required=True, help="Image folder, one sub folder per class")
+    parser.add_argument("--max-per-class", type=int, default=None, help="Maximum number of images loaded per class")
+    parser.add_argument("--resolution-input", type=int, default=32, help="Resolution of the input image")
+    parser.add_argument("--methods", type=str, nargs="+", default=list(PROJECTIONS), choices=PROJECTIONS, help="Projections to compare")
+    parser.add_argument("--dims", type=int, nargs="+", default=[8, 16, 32, 64], help="Dimensions of the projected features")
+    parser.add_argument("--n-fit", type=int, default=100, help="Number of images the pca is fitted on")
+    parser.add_argument("--classifiers", type=str, nargs="+", default=["ncm", "knn"], choices=["ncm", "knn"], help="Classifiers evaluated")
+    parser.add_argument("--number-neiboors", type=int, default=5, help="Number of neiboors for knn classifier")
+    parser.add_argument("--n-ways", type=int, default=4, help="Number of classes per episode")
+    parser.add_argument("--n-shots", type=int, default=5, help="Number of shots per class")
+    parser.add_argument("--n-queries", type=int, default=5, help="Number of queries per class")
+    parser.add_argument("--n-episodes", type=int, default=200, help="Number of episodes")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the episodes and of the projections")
+    parser.add_argument("--bank-size", type=int, default=1000, help="Number of shots of the bank timed with the knn")
+    parser.add_argument("--n-runs", type=int, default=200, help="Number of knn calls to measure latency")
+    parser.add_argument("--save-projection", type=str, default=None, help="Save the fitted projections as PREFIX_method_dim.npz")
+    parser.add_argument("--output-json", type=str, default=None, help="Save the report in a json file")
+    args = parser.parse_args()
+
+    projection_report(args)
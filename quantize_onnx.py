@@ -0,0 +1,187 @@
+"""
+Post training static quantization (INT8, QDQ format) of an onnx backbone exported with model_to_onnx.py.
+
+The activations are calibrated on real frames, either :
+    - an image folder (images are searched recursively, sub folders per class are allowed)
+    - a .npy file of frames recorded by the demo (main.py --record-frames frames.npy)
+
+The quantized model is then compared with the float model on the onnx runtime backend :
+speed up of one backbone call, drift of the features and few shot accuracy (if --dataset is given).
+
+python3 quantize_onnx.py --onnx-path onnx/resnet9_strided_16fmaps.onnx --calibration frames.npy --dataset ../images
+
+The quantized model can be used in the demo with --framework onnx --path-onnx onnx/resnet9_strided_16fmaps_int8.onnx
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+import cv2
+import numpy as np
+import onnxruntime as ort
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+
+from backbone_loader.backbone_onnx import BackboneOnnxWrapper
+from backbone_loader.preprocessing import preprocess
+from few_shot_model.evaluation import (
+    IMAGE_EXTENSIONS,
+    load_image_folder,
+    extract_features,
+    sample_episodes,
+    few_shot_accuracy,
+    feature_drift,
+    measure_latency,
+)
+
+CALIBRATION_METHODS = {
+    "minmax": CalibrationMethod.MinMax,
+    "entropy": CalibrationMethod.Entropy,
+    "percentile": CalibrationMethod.Percentile,
+}
+
+
+def load_calibration_frames(path, resolution, max_frames=None, seed=0):
+    """
+    load the calibration frames, resized to the backbone resolution
+    args :
+        - path : .npy file of frames (n,h,w,3) or image folder
+        - resolution (tuple(int,int)) : width/height of the backbone input
+        - max_frames (int) : maximum number of frames (all if None), sampled with a seeded permutation
+          (the folders are sorted by class and the recordings by time)
+    returns :
+        frames (np.ndarray(n,h,w,3)) : uint8 frames
+    """
+    if str(path).endswith(".npy"):
+        frames = np.load(path)
+        frames = [frames[index] for index in np.random.default_rng(seed).permutation(len(frames))[:max_frames]]
+    else:
+        file_paths = []
+        for root, _, file_names in sorted(os.walk(path)):
+            for file_name in sorted(file_names):
+                if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                    file_paths.append(os.path.join(root, file_name))
+        frames = []
+        for index in np.random.default_rng(seed).permutation(len(file_paths)):
+            if max_frames is not None and len(frames) >= max_frames:
+                break
+            frame = cv2.imread(file_paths[index])
+            if frame is None:
+                print(f"could not read {file_paths[index]}, skipped")
+                continue
+            frames.append(frame)
+    if len(frames) == 0:
+        raise ValueError(f"no calibration frame found in {path}")
+    frames = [
+        frame if frame.shape[1::-1] == tuple(resolution) else cv2.resize(frame, dsize=resolution, interpolation=cv2.INTER_LINEAR)
+        for frame in frames
+    ]
+    return np.stack(frames, axis=0)
+
+
+class FramesCalibrationReader(CalibrationDataReader):
+    """
+    give the calibration frames one by one to the onnxruntime calibrator (same preprocessing as the demo)
+    """
+
+    def __init__(self, frames, input_name):
+        self.frames = frames
+        self.input_name = input_name
+        self.index = 0
+
+    def get_next(self):
+        if self.index >= len(self.frames):
+            return None
+        img = preprocess(self.frames[self.index])
+        self.index += 1
+        return {self.input_name: np.transpose(img, (0, 3, 1, 2)).astype(np.float32)}
+
+    def rewind(self):
+        self.index = 0
+
+
+def quantize_onnx(args):
+    session = ort.InferenceSession(str(args.onnx_path))
+    model_input = session.get_inputs()[0]
+    resolution = (model_input.shape[3], model_input.shape[2])
+    print(f"Input {model_input.name} of resolution {resolution[0]}x{resolution[1]}")
+
+    frames = load_calibration_frames(args.calibration, resolution, args.max_calibration_frames, args.seed)
+    print(f"Calibration on {len(frames)} frames")
+
+    output_path = args.output_path
+    if output_path is None:
+        output_path = args.onnx_path.with_name(f"{args.onnx_path.stem}_int8.onnx")
+    quantize_static(
+        str(args.onnx_path),
+        str(output_path),
+        FramesCalibrationReader(frames, model_input.name),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=args.per_channel,
+        calibrate_method=CALIBRATION_METHODS[args.calibrate_method],
+    )
+    print("Quantized model saved in: ", output_path)
+
+    # comparison with the float model
+    float_backbone = BackboneOnnxWrapper(args.onnx_path)
+    int8_backbone = BackboneOnnxWrapper(output_path)
+    img = preprocess(frames[0])
+    report = {
+        "float": measure_latency(float_backbone, img, n_runs=args.n_runs),
+        "int8": measure_latency(int8_backbone, img, n_runs=args.n_runs),
+    }
+    report["speed_up"] = report["float"]["mean_ms"] / report["int8"]["mean_ms"]
+    print(f"Latency float : {report['float']['mean_ms']:.3f} ms, int8 : {report['int8']['mean_ms']:.3f} ms, speed up : x{report['speed_up']:.2f}")
+
+    if args.dataset is not None:
+        images, labels, _ = load_image_folder(args.dataset, resolution, args.max_per_class)
+        episodes = sample_episodes(labels, args.n_ways, args.n_shots, args.n_queries, args.n_episodes, seed=args.seed)
+        classifier_specs = {"model_name": args.classifier_type}
+        if args.classifier_type == "knn":
+            classifier_specs["kwargs"] = {"number_neighboors": args.number_neiboors}
+        float_features = extract_features(float_backbone, images)
+        int8_features = extract_features(int8_backbone, images)
+        report["drift"] = feature_drift(int8_features, float_features)
+        report["float"]["accuracy"] = float(few_shot_accuracy(float_features, episodes, classifier_specs))
+        report["int8"]["accuracy"] = float(few_shot_accuracy(int8_features, episodes, classifier_specs))
+        print(f"Feature drift : relative l2 {report['drift']['relative_l2']:.5f}, cosine {report['drift']['cosine']:.5f}")
+        print(f"Few shot accuracy float : {100 * report['float']['accuracy']:.2f}%, int8 : {100 * report['int8']['accuracy']:.2f}%")
+
+    if args.output_json is not None:
+        with open(args.output_json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+        print("Report saved in: ", args.output_json)
+    return report
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--onnx-path", type=Path, required=True, help="path to the float onnx file")
+    parser.add_argument("--calibration", type=str, required=True, help="image folder or .npy file of recorded frames")
+    parser.add_argument("--output-path", type=Path, default=None, help="path of the quantized model (default : <onnx name>_int8.onnx)")
+    parser.add_argument("--max-calibration-frames", type=int, default=500, help="maximum number of calibration frames")
+    parser.add_argument("--calibrate-method", type=str, default="minmax", choices=list(CALIBRATION_METHODS), help="calibration method of the activations")
+    parser.add_argument("--per-channel", action="store_true", help="quantize the weights per output channel")
+    parser.add_argument("--dataset", type=str, default=None, help="image folder (one sub folder per class) to measure the few shot accuracy")
+    parser.add_argument("--max-per-class", type=int, default=None, help="maximum number of images loaded per class")
+    parser.add_argument("--classifier-type", type=str, default="ncm", choices=["ncm", "knn"], help="type of classifier")
+    parser.add_argument("--number-neiboors", type=int, default=5, help="number of neiboors for knn classifier")
+    parser.add_argument("--n-ways", type=int, default=4, help="number of classes per episode")
+    parser.add_argument("--n-shots", type=int, default=5, help="number of shots per class")
+    parser.add_argument("--n-queries", type=int, default=5, help="number of queries per class")
+    parser.add_argument("--n-episodes", type=int, default=200, help="number of episodes")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the episodes and of the calibration frames")
+    parser.add_argument("--n-runs", type=int, default=50, help="number of backbone calls to measure latency")
+    parser.add_argument("--output-json", type=str, default=None, help="save the report in a json file")
+    args = parser.parse_args()
+
+    quantize_onnx(args)
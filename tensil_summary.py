@@ -0,0 +1,248 @@
+"""
+Parse the summaries printed by the tensil compiler (saved in the .txt logs by onnx_to_tensil.py)
+and estimate the throughput of the compiled model on the board.
+
+Parsed sections : COMPILER SUMMARY (key/values) and the LAYERS, SCHEDULER, PARTITIONS, STRIDES and
+INSTRUCTIONS summaries (tables). They are saved as json (all sections) or csv (one file per table).
+
+Throughput estimation : cycles per frame are estimated from the compiler summary as
+    cycles = a_compute * MACs / array_size^2 + a_dram * vectors moved from/to DRAM * cycles per vector
+             + a_instruction * number of instructions + overhead
+and fps = clock / cycles. The coefficients default to 1 (0 overhead) and can be fitted on fps measured on the board (--fit).
+
+python3 tensil_summary.py tensil/resnet9_strided_16fmaps.txt --json tensil/resnet9_strided_16fmaps_summary.json --clock-mhz 50 125
+"""
+
+import argparse
+import csv
+import json
+import math
+import re
+from pathlib import Path
+import numpy as np
+
+SEPARATOR = re.compile(r"^-{10,}\s*$")
+TITLE = re.compile(r"^([A-Z][A-Z0-9 #/()_-]*SUMMARY)\s*$")
+KEY_VALUE = re.compile(r"^(.+?):\s+(\S.*?)\s*$")
+COLUMNS = re.compile(r"\s{2,}")
+# width of the AXI bus between the TCU and the DRAM (rtl generated with -d 64)
+DRAM_BYTES_PER_CYCLE = 8
+DEFAULT_COEFFICIENTS = {"compute": 1.0, "dram": 1.0, "instruction": 1.0, "overhead": 0.0}
+
+
+def parse_value(text):
+    """
+    convert a value of the summary ("2,097,152", "74.763", "FP16BP8") to int / float / str
+    """
+    text = text.strip()
+    number = text.replace(",", "")
+    try:
+        return int(number)
+    except ValueError:
+        pass
+    try:
+        return float(number)
+    except ValueError:
+        return text
+
+
+def parse_key_value(lines):
+    """
+    parse "Key (a/b/c):   value_a value_b value_c" lines
+    keys with several values are parsed to a dict, ex : {"vectors": .., "scalars": .., "bits": ..}
+    """
+    section = {}
+    for line in lines:
+        match = KEY_VALUE.match(line)
+        if match is None:
+            continue
+        key, value = match.group(1).strip(), match.group(2)
+        values = value.split()
+        names = re.search(r"\(([^()]*/[^()]*)\)\s*$", key)
+        if len(values) > 1 and names is not None and len(names.group(1).split("/")) == len(values):
+            section[key] = {name: parse_value(v) for name, v in zip(names.group(1).split("/"), values)}
+        else:
+            section[key] = parse_value(value)
+    return section
+
+
+def parse_table(lines):
+    """
+    parse a table : first line is the header (columns separated by at least 2 spaces), one record per line
+    """
+    header = [name.strip().rstrip(":") for name in COLUMNS.split(lines[0].strip())]
+    records = []
+    for line in lines[1:]:
+        values = COLUMNS.split(line.strip())
+        if len(values) != len(header):
+            values = line.split()
+        if len(values) != len(header):
+            continue
+        records.append({name: parse_value(value) for name, value in zip(header, values)})
+    return records
+
+
+def is_key_value(lines):
+    """
+    key/value sections have one "Key:   value" per line, tables have several "Column:" in their header
+    """
+    return sum(KEY_VALUE.match(line) is not None and line.count(":") == 1 for line in lines) > len(lines) / 2
+
+
+def parse_summary(text):
+    """
+    parse all the summaries of a tensil log
+    returns :
+        dict : title of the section -> dict (key/value sections) or list of dict (tables)
+    """
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", errors="replace")
+    lines = text.splitlines()
+    summaries = {}
+    index = 0
+    while index < len(lines):
+        match = TITLE.match(lines[index].strip())
+        if match is None:
+            index += 1
+            continue
+        title = match.group(1)
+        index += 1
+        if index < len(lines) and SEPARATOR.match(lines[index]):
+            index += 1
+        content = []
+        while index < len(lines) and not SEPARATOR.match(lines[index]) and TITLE.match(lines[index].strip()) is None:
+            if lines[index].strip():
+                content.append(lines[index])
+            index += 1
+        if len(content) == 0:
+            continue
+        summaries[title] = parse_key_value(content) if is_key_value(content) else parse_table(content)
+    return summaries
+
+
+def summary_value(section, prefix, default=None):
+    """
+    value of the first key of the section starting with prefix (case insensitive)
+    """
+    for key, value in section.items():
+        if key.lower().startswith(prefix.lower()):
+            return value
+    return default
+
+
+def cost_features(summaries):
+    """
+    cost features of a compiled model, from its COMPILER SUMMARY
+    returns :
+        dict : compute cycles (MACs / array_size^2), dram cycles, number of instructions
+    """
+    compiler = summaries["COMPILER SUMMARY"]
+    array_size = summary_value(compiler, "Array size")
+    data_type = str(summary_value(compiler, "Data type", "FP16BP8"))
+    bits = int(re.match(r"FP(\d+)", data_type).group(1)) if data_type.startswith("FP") else 16
+    macs = summary_value(compiler, "True MACs (M)", 0) * 1e6
+
+    vectors = 0
+    for prefix in ("Consts memory aggregate usage", "Vars memory aggregate usage"):
+        usage = summary_value(compiler, prefix, 0)
+        vectors += usage.get("vectors", 0) if isinstance(usage, dict) else usage
+    cycles_per_vector = math.ceil(array_size * bits / 8 / DRAM_BYTES_PER_CYCLE)
+
+    return {
+        "compute": macs / array_size ** 2,
+        "dram": vectors * cycles_per_vector,
+        "instruction": summary_value(compiler, "Total number of instructions", 0),
+    }
+
+
+def predict_cycles(features, coefficients=DEFAULT_COEFFICIENTS):
+    """
+    estimated number of cycles per frame
+    """
+    return coefficients["overhead"] + sum(coefficients[name] * features[name] for name in ("compute", "dram", "instruction"))
+
+
+def predict_fps(features, clock_mhz, coefficients=DEFAULT_COEFFICIENTS):
+    """
+    estimated fps of the backbone at the given clock (MHz)
+    """
+    return clock_mhz * 1e6 / predict_cycles(features, coefficients)
+
+
+def fit_coefficients(features_list, measured_fps, clocks_mhz):
+    """
+    least square fit of the coefficients on fps measured on the board
+    args :
+        - features_list : cost_features of each measured model
+        - measured_fps, clocks_mhz : measured fps of each model and the clock it was measured at
+    """
+    matrix = np.array([[f["compute"], f["dram"], f["instruction"], 1.0] for f in features_list])
+    cycles = np.array(clocks_mhz) * 1e6 / np.array(measured_fps)
+    solution, *_ = np.linalg.lstsq(matrix, cycles, rcond=None)
+    return dict(zip(("compute", "dram", "instruction", "overhead"), solution.tolist()))
+
+
+def save_csv(summaries, directory, name):
+    """
+    save every table of the summaries in a csv file (directory/name_<section>.csv)
+    """
+    paths = []
+    for title, section in summaries.items():
+        if not isinstance(section, list) or len(section) == 0:
+            continue
+        path = Path(directory) / f"{name}_{title.lower().replace(' ', '_')}.csv"
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=list(section[0]))
+            writer.writeheader()
+            writer.writerows(section)
+        paths.append(path)
+    return paths
+
+
+def tensil_summary(args):
+    coefficients = dict(DEFAULT_COEFFICIENTS)
+    if args.fit is not None:
+        # csv with columns log, clock_mhz, fps
+        with open(args.fit, "r", encoding="utf-8") as file:
+            rows = list(csv.DictReader(file))
+        features_list = [cost_features(parse_summary(Path(row["log"]).read_text(errors="replace"))) for row in rows]
+        coefficients = fit_coefficients(features_list, [float(row["fps"]) for row in rows], [float(row["clock_mhz"]) for row in rows])
+        print("Fitted coefficients :", coefficients)
+
+    for log in args.logs:
+        summaries = parse_summary(Path(log).read_text(errors="replace"))
+        if "COMPILER SUMMARY" not in summaries:
+            print(f"{log} : no COMPILER SUMMARY found")
+            continue
+        features = cost_features(summaries)
+        summaries["PREDICTION"] = {
+            "coefficients": coefficients,
+            "features": features,
+            "cycles": predict_cycles(features, coefficients),
+            "fps": {str(clock): predict_fps(features, clock, coefficients) for clock in args.clock_mhz},
+        }
+        print(f"{Path(log).stem} : {summaries['PREDICTION']['cycles']:.0f} cycles per frame, "
+              + ", ".join(f"{fps:.1f} fps at {clock} MHz" for clock, fps in summaries["PREDICTION"]["fps"].items()))
+
+        if args.json is not None:
+            path = args.json if len(args.logs) == 1 else Path(args.json).with_name(f"{Path(log).stem}_summary.json")
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(summaries, file, indent=4)
+            print("Summary saved in: ", path)
+        if args.csv_dir is not None:
+            Path(args.csv_dir).mkdir(parents=True, exist_ok=True)
+            for path in save_csv(summaries, args.csv_dir, Path(log).stem):
+                print("Table saved in: ", path)
+
+
+if __name__ == "__main__":
+    # Define the command line arguments for the script
+    parser = argparse.ArgumentParser()
+    parser.add_argument("logs", type=str, nargs="+", help="tensil compilation logs (.txt saved by onnx_to_tensil.py)")
+    parser.add_argument("--json", type=str, default=None, help="save the parsed summaries in a json file")
+    parser.add_argument("--csv-dir", type=str, default=None, help="save every table in a csv file in this directory")
+    parser.add_argument("--clock-mhz", type=float, nargs="+", default=[50, 125], help="clocks of the TCU at which the fps is predicted")
+    parser.add_argument("--fit", type=str, default=None, help="csv (columns log, clock_mhz, fps) of fps measured on the board, to fit the throughput model")
+    args = parser.parse_args()
+
+    tensil_summary(args)